@@ -60,13 +60,25 @@ celery.conf.update(
     worker_disable_rate_limits=False,
     
     # Queue settings
+    task_default_queue='default',
     task_routes={
         'tasks.sync_employees_to_crm': {'queue': 'crm_sync'},
         'tasks.sync_salaries_to_crm': {'queue': 'crm_sync'},
+        'tasks.upload_salary_shard': {'queue': 'crm_sync'},
+        'tasks.finish_salary_month_sync': {'queue': 'crm_sync'},
         'tasks.sync_reports_to_crm': {'queue': 'crm_sync'},
+        'tasks.process_crm_webhooks': {'queue': 'crm_sync'},
         'tasks.generate_monthly_report': {'queue': 'reports'},
+        'tasks.build_report_artifacts': {'queue': 'reports'},
+        'tasks.finish_monthly_report': {'queue': 'reports'},
+        'tasks.export_salary_report': {'queue': 'reports'},
         'tasks.backup_database': {'queue': 'maintenance'},
         'tasks.cleanup_old_files': {'queue': 'maintenance'},
+        'tasks.close_report': {'queue': 'reports'},
+        'tasks.close_crm_sync': {'queue': 'crm_sync'},
+        'tasks.close_checkpoint': {'queue': 'crm_sync'},
+        'tasks.close_backup': {'queue': 'maintenance'},
+        'tasks.maintain_salary_partitions': {'queue': 'maintenance'},
     },
     
     # Retry settings
@@ -80,6 +92,11 @@ celery.conf.update(
             'schedule': crontab(minute='*/10'),  # Every 10 minutes
             'options': {'queue': 'crm_sync'}
         },
+        'process-crm-webhooks-every-minute': {
+            'task': 'tasks.process_crm_webhooks',
+            'schedule': crontab(minute='*'),  # Every minute
+            'options': {'queue': 'crm_sync'}
+        },
         'backup-database-daily': {
             'task': 'tasks.backup_database',
             'schedule': crontab(hour=2, minute=0),  # Daily at 2 AM
@@ -90,6 +107,11 @@ celery.conf.update(
             'schedule': crontab(day_of_week=0, hour=3, minute=0),  # Sunday at 3 AM
             'options': {'queue': 'maintenance'}
         },
+        'maintain-salary-partitions-daily': {
+            'task': 'tasks.maintain_salary_partitions',
+            'schedule': crontab(hour=0, minute=30),  # Daily at 00:30
+            'options': {'queue': 'maintenance'}
+        },
         'generate-monthly-reports': {
             'task': 'tasks.generate_monthly_report',
             'schedule': crontab(day_of_month=1, hour=1, minute=0),  # 1st of month at 1 AM
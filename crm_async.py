@@ -0,0 +1,241 @@
+"""
+CRM Sync Engine
+Runs the CRM health check, delta syncs, month uploads and report sync concurrently on asyncio
+"""
+
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, ContextManager, Dict, Iterable, List, Optional, Tuple
+
+from psycopg2 import extensions
+
+from crm_sync_state import (EMPLOYEES, SALARIES, employee_payload, salaries_by_month, summary_payload,
+                            sync_changes)
+from crm_upload import post_records, upload_month
+from http_client import HttpClient
+
+logger = logging.getLogger(__name__)
+
+# CRM requests in flight at once; keep at or below HTTP_POOL_MAXSIZE so every request gets a pooled connection
+SYNC_CONCURRENCY = int(os.getenv('CRM_SYNC_CONCURRENCY', '4'))
+
+# Threads for database steps (delta syncs, month uploads, report reads) running side by side
+STEP_THREADS = 8
+
+
+class CRMSyncEngine:
+    """Concurrent CRM sync over the shared, pooled HttpClient
+
+    Independent endpoints run at the same time, and so do the months inside
+    a salary batch and the months of a multi-month upload. A semaphore caps
+    in-flight requests at concurrency. requests and psycopg2 both block, so
+    requests and database steps run on the engine's own thread pools.
+    Latency is recorded per endpoint. Watermarks and upload progress only
+    move after the CRM acknowledges a batch, so running syncs side by side
+    is safe. connection() returns a context manager around a database
+    connection, e.g. ConnectionPool.connection.
+    """
+
+    def __init__(self, client: HttpClient, connection: Callable[[], ContextManager[extensions.connection]],
+                 headers: Optional[Dict[str, str]] = None, concurrency: int = SYNC_CONCURRENCY):
+        self.client = client
+        self.connection = connection
+        self.headers = dict(headers or {})
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Requests get their own threads, so steps blocked waiting on a request can never starve them
+        self._http_executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='crm-http')
+        self._step_executor = ThreadPoolExecutor(max_workers=STEP_THREADS, thread_name_prefix='crm-step')
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Dict] = {}
+
+    async def __aenter__(self) -> 'CRMSyncEngine':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._http_executor.shutdown(wait=True)
+        self._step_executor.shutdown(wait=True)
+
+    # Plumbing
+
+    async def _in_thread(self, func, *args, **kwargs):
+        """Run a blocking database step (which may post through _from_thread) off the event loop"""
+        self._loop = asyncio.get_running_loop()
+        return await self._loop.run_in_executor(self._step_executor, functools.partial(func, *args, **kwargs))
+
+    def _from_thread(self, coroutine):
+        """Run a coroutine on the engine's loop from one of its worker threads and wait for the result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    async def _call(self, path: str, func, *args, **kwargs):
+        """One HTTP call under the semaphore, timed against its endpoint"""
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self._http_executor, functools.partial(func, *args, **kwargs))
+            except Exception:
+                self._record(path, started, error=True)
+                raise
+            self._record(path, started, error=response.status_code >= 400)
+            return response
+
+    def _record(self, path: str, started: float, error: bool = False):
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            stats = self._latency.setdefault(path, {'calls': 0, 'errors': 0, 'total_seconds': 0.0,
+                                                    'max_seconds': 0.0})
+            stats['calls'] += 1
+            stats['errors'] += int(error)
+            stats['total_seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+    def latency(self) -> Dict[str, Dict]:
+        """Calls, errors and average/max seconds per endpoint"""
+        with self._lock:
+            latency = {path: dict(stats) for path, stats in self._latency.items()}
+        for stats in latency.values():
+            stats['average_seconds'] = round(stats['total_seconds'] / stats['calls'], 4)
+            stats['total_seconds'] = round(stats['total_seconds'], 4)
+            stats['max_seconds'] = round(stats['max_seconds'], 4)
+        return latency
+
+    async def post(self, path: str, fields: Dict, key: str, records: Iterable[Dict]) -> bool:
+        """POST {**fields, key: [records]} (gzip-encoded); True when the CRM accepted it"""
+        response = await self._call(path, post_records, self.client, path, fields, key, records,
+                                    headers=self.headers)
+        if response.status_code not in (200, 201):
+            logger.error(f"CRM {path} failed: {response.status_code} - {response.text}")
+            return False
+        return True
+
+    async def _sync_entity(self, entity: str, post_batch) -> Dict:
+        """sync_changes on its own connection in a worker thread, posting up to concurrency batches at once"""
+        async def post_batches(batches):
+            return await asyncio.gather(*(post_batch(rows) for rows in batches))
+
+        def run():
+            with self.connection() as conn:
+                return sync_changes(conn, entity, None, send_many=lambda batches: self._from_thread(
+                    post_batches(batches)), window=self.concurrency)
+        return await self._in_thread(run)
+
+    # Sync steps
+
+    async def check_health(self) -> Dict:
+        response = await self._call('/health', self.client.get, '/health', headers=self.headers)
+        return {'status': 'success' if response.status_code == 200 else 'failed',
+                'status_code': response.status_code}
+
+    async def sync_employees(self) -> Dict:
+        """Send labor profiles changed since the employee watermark"""
+        def post_batch(rows):
+            return self.post('/employees/sync', {}, 'employees', [employee_payload(row) for row in rows])
+        return await self._sync_entity(EMPLOYEES, post_batch)
+
+    async def _post_months(self, months: Dict[Tuple[int, int], List[Dict]]) -> bool:
+        results = await asyncio.gather(*(
+            self.post('/salaries/sync', {'year': year, 'month': month}, 'salaries', salaries)
+            for (year, month), salaries in sorted(months.items())
+        ))
+        return all(results)
+
+    async def sync_salaries(self) -> Dict:
+        """Send salary records changed since the salary watermark, posting each batch's months concurrently"""
+        def post_batch(rows):
+            return self._post_months(salaries_by_month(rows))
+        return await self._sync_entity(SALARIES, post_batch)
+
+    async def upload_month(self, year: int, month: int) -> Dict:
+        """Resumable chunked upload of one whole month, posting up to concurrency chunks at once"""
+        async def post_chunks(chunks):
+            return await asyncio.gather(*(self.post('/salaries/sync', fields, 'salaries', salaries)
+                                          for fields, salaries in chunks))
+
+        def run():
+            with self.connection() as conn:
+                return upload_month(conn, None, year, month,
+                                    post_many=lambda chunks: self._from_thread(post_chunks(chunks)),
+                                    window=self.concurrency)
+        return await self._in_thread(run)
+
+    async def upload_months(self, months: Iterable[Tuple[int, int]]) -> Dict[str, Dict]:
+        """Upload several whole months at once, each on its own connection"""
+        months = list(months)
+        results = await asyncio.gather(*(self.upload_month(year, month) for year, month in months),
+                                       return_exceptions=True)
+        return {f"{year}-{month:02d}": _result(result) for (year, month), result in zip(months, results)}
+
+    async def sync_summary_report(self, year: int, month: int) -> Dict:
+        def load():
+            with self.connection() as conn, conn.cursor() as cursor:
+                summary = summary_payload(cursor, year, month)
+                conn.rollback()
+                return summary
+
+        summary = await self._in_thread(load)
+        if not summary:
+            return {'status': 'success', 'synced': 0}
+        ok = await self.post('/reports/summary', {'year': year, 'month': month}, 'summary', summary)
+        return {'status': 'success' if ok else 'failed', 'synced': len(summary) if ok else 0}
+
+    async def run_cycle(self, employees: bool = True, salaries: bool = True,
+                        report_month: Optional[Tuple[int, int]] = None,
+                        months: Iterable[Tuple[int, int]] = ()) -> Dict:
+        """One full sync: every enabled step at once, so it takes about as long as the slowest
+
+        The health check runs alongside the syncs rather than gating them; a
+        sync that fails leaves its watermark where it was.
+        """
+        steps = {'health': self.check_health()}
+        if employees:
+            steps['employees'] = self.sync_employees()
+        if salaries:
+            steps['salaries'] = self.sync_salaries()
+        if report_month:
+            steps['summary_report'] = self.sync_summary_report(*report_month)
+        months = list(months)
+        if months:
+            steps['months'] = self.upload_months(months)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*steps.values(), return_exceptions=True)
+        elapsed = time.perf_counter() - started
+
+        cycle = {name: _result(result) for name, result in zip(steps, results)}
+        latency = self.latency()
+        logger.info(f"CRM sync cycle finished in {elapsed:.2f}s: "
+                    + ', '.join(f"{name}={result.get('status', 'done')}" for name, result in cycle.items()))
+        return {
+            'results': cycle,
+            'seconds': round(elapsed, 3),
+            'request_seconds': round(sum(stats['total_seconds'] for stats in latency.values()), 3),
+            'latency': latency,
+            'http': self.client.metrics()
+        }
+
+
+def _result(result) -> Dict:
+    if isinstance(result, BaseException):
+        logger.error(f"CRM sync step failed: {result}")
+        return {'status': 'error', 'error': str(result)}
+    return result
+
+
+def run_sync_cycle(client: HttpClient, connection: Callable[[], ContextManager[extensions.connection]],
+                   headers: Optional[Dict[str, str]] = None, concurrency: int = SYNC_CONCURRENCY,
+                   **cycle) -> Dict:
+    """Run one CRMSyncEngine.run_cycle from synchronous code"""
+    async def main():
+        async with CRMSyncEngine(client, connection, headers, concurrency) as engine:
+            return await engine.run_cycle(**cycle)
+    return asyncio.run(main())
@@ -4,13 +4,19 @@ Syncs salary data with JatanCRM Portal
 """
 
 import os
-import requests
 import json
 import logging
-from typing import Dict, List, Optional
+from contextlib import closing
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 import psycopg2
 from db_config import DatabaseConfig
+from crm_sync_state import (EMPLOYEES, SALARIES, employee_payload, salaries_by_month, summary_payload,
+                            sync_changes, sync_state)
+from crm_upload import post_records, upload_month
+from crm_async import run_sync_cycle
+from crm_webhooks import drain, enqueue_events, webhook_metrics
+from http_client import get_http_client
 
 # Setup logging
 logging.basicConfig(
@@ -34,6 +40,9 @@ class CRMIntegration:
 
         self.db_config = DatabaseConfig.from_file()
 
+        # Pooled keep-alive session, shared with the Celery tasks in the same process
+        self.http = get_http_client(self.api_base)
+
         if self.enabled:
             logger.info("CRM Integration enabled")
         else:
@@ -48,6 +57,10 @@ class CRMIntegration:
             'Accept': 'application/json'
         }
 
+    def http_metrics(self) -> Dict:
+        """Request counts and connection reuse for the CRM HTTP session"""
+        return self.http.metrics()
+
     def test_connection(self) -> bool:
         """Test connection to CRM API"""
         if not self.enabled:
@@ -55,10 +68,9 @@ class CRMIntegration:
             return False
 
         try:
-            response = requests.get(
-                f"{self.api_base}/health",
-                headers=self.get_auth_headers(),
-                timeout=self.timeout
+            response = self.http.get(
+                "/health",
+                headers=self.get_auth_headers()
             )
 
             if response.status_code == 200:
@@ -73,124 +85,77 @@ class CRMIntegration:
             return False
 
     def sync_employees(self) -> bool:
-        """Sync employee/labor profiles to CRM"""
+        """Sync employee/labor profiles added or edited since the last acknowledged sync to CRM"""
         if not self.enabled:
             return False
 
-        try:
-            # Get employees from local database
-            conn = psycopg2.connect(self.db_config.get_connection_string())
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT id, name, base_daily_wage, position, contact_info, overtime_rate
-                FROM labor_profiles
-                WHERE created_at >= NOW() - INTERVAL '7 days'
-                ORDER BY created_at DESC
-            """)
-
-            employees = []
-            for row in cursor.fetchall():
-                employees.append({
-                    'employee_id': row[0],
-                    'name': row[1],
-                    'daily_wage': float(row[2]),
-                    'position': row[3],
-                    'contact': row[4],
-                    'overtime_rate': float(row[5])
-                })
-
-            cursor.close()
-            conn.close()
-
-            if not employees:
-                logger.info("No new employees to sync")
-                return True
-
-            # Send to CRM
-            response = requests.post(
-                f"{self.api_base}/employees/sync",
-                json={'employees': employees},
-                headers=self.get_auth_headers(),
-                timeout=self.timeout
-            )
-
-            if response.status_code in [200, 201]:
-                logger.info(f"Synced {len(employees)} employees to CRM")
-                return True
-            else:
+        def send(rows):
+            response = post_records(self.http, "/employees/sync", {}, 'employees',
+                                    map(employee_payload, rows), headers=self.get_auth_headers())
+            if response.status_code not in [200, 201]:
                 logger.error(f"Employee sync failed: {response.status_code} - {response.text}")
                 return False
+            return True
+
+        try:
+            conn = psycopg2.connect(self.db_config.get_connection_string())
+            try:
+                result = sync_changes(conn, EMPLOYEES, send)
+            finally:
+                conn.close()
+            return result['status'] != 'failed'
 
         except Exception as e:
             logger.error(f"Employee sync error: {e}")
             return False
 
-    def sync_salaries(self, year: int, month: int) -> bool:
-        """Sync salary records for a specific month to CRM"""
+    def sync_salaries(self, year: Optional[int] = None, month: Optional[int] = None) -> bool:
+        """Sync salary records changed since the last acknowledged sync to CRM, or resend one whole month"""
         if not self.enabled:
             return False
 
         try:
-            # Get salary records from local database
             conn = psycopg2.connect(self.db_config.get_connection_string())
-            cursor = conn.cursor()
-
-            cursor.execute("""
-                SELECT labor_name, date, day_type, daily_wage, hours_worked,
-                       overtime_hours, weekend_bonus, holiday_bonus,
-                       other_allowances, deductions, total_salary
-                FROM salary_records
-                WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-                ORDER BY date, labor_name
-            """, (year, month))
-
-            salaries = []
-            for row in cursor.fetchall():
-                salaries.append({
-                    'employee_name': row[0],
-                    'date': row[1].isoformat(),
-                    'day_type': row[2],
-                    'daily_wage': float(row[3]),
-                    'hours_worked': float(row[4]),
-                    'overtime_hours': float(row[5]),
-                    'weekend_bonus': float(row[6]),
-                    'holiday_bonus': float(row[7]),
-                    'allowances': float(row[8]),
-                    'deductions': float(row[9]),
-                    'total_salary': float(row[10])
-                })
+            try:
+                if year is None or month is None:
+                    def send(rows):
+                        return all(self._post_salaries({'year': batch_year, 'month': batch_month}, salaries)
+                                   for (batch_year, batch_month), salaries in sorted(salaries_by_month(rows).items()))
 
-            cursor.close()
-            conn.close()
-
-            if not salaries:
-                logger.info(f"No salaries to sync for {year}-{month:02d}")
-                return True
-
-            # Send to CRM
-            response = requests.post(
-                f"{self.api_base}/salaries/sync",
-                json={
-                    'year': year,
-                    'month': month,
-                    'salaries': salaries
-                },
-                headers=self.get_auth_headers(),
-                timeout=self.timeout
-            )
+                    result = sync_changes(conn, SALARIES, send)
+                else:
+                    # Chunked, compressed upload that resumes after the last chunk the CRM acknowledged
+                    result = upload_month(conn, self._post_salaries, year, month)
+            finally:
+                conn.close()
 
-            if response.status_code in [200, 201]:
-                logger.info(f"Synced {len(salaries)} salary records to CRM for {year}-{month:02d}")
-                return True
-            else:
-                logger.error(f"Salary sync failed: {response.status_code} - {response.text}")
-                return False
+            return result['status'] != 'failed'
 
         except Exception as e:
             logger.error(f"Salary sync error: {e}")
             return False
 
+    def _post_salaries(self, fields: Dict, salaries: Iterable[Dict]) -> bool:
+        """Send one batch of salary records to CRM; fields carries year, month and any chunk details"""
+        response = post_records(self.http, "/salaries/sync", fields, 'salaries', salaries,
+                                headers=self.get_auth_headers())
+
+        if response.status_code in [200, 201]:
+            return True
+        else:
+            logger.error(f"Salary sync failed for {fields['year']}-{fields['month']:02d}: "
+                         f"{response.status_code} - {response.text}")
+            return False
+
+    def sync_state(self) -> List[Dict]:
+        """Watermark of the last acknowledged sync for each entity"""
+        conn = psycopg2.connect(self.db_config.get_connection_string())
+        try:
+            with conn.cursor() as cursor:
+                return sync_state(cursor)
+        finally:
+            conn.close()
+
     def sync_summary_report(self, year: int, month: int) -> bool:
         """Sync monthly summary report to CRM"""
         if not self.enabled:
@@ -201,28 +166,7 @@ class CRMIntegration:
             conn = psycopg2.connect(self.db_config.get_connection_string())
             cursor = conn.cursor()
 
-            cursor.execute("""
-                SELECT
-                    labor_name,
-                    COUNT(*) as working_days,
-                    SUM(hours_worked) as total_hours,
-                    SUM(overtime_hours) as total_overtime,
-                    SUM(total_salary) as total_salary
-                FROM salary_records
-                WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-                GROUP BY labor_name
-                ORDER BY labor_name
-            """, (year, month))
-
-            summary = []
-            for row in cursor.fetchall():
-                summary.append({
-                    'employee_name': row[0],
-                    'working_days': row[1],
-                    'total_hours': float(row[2]),
-                    'total_overtime': float(row[3]),
-                    'total_salary': float(row[4])
-                })
+            summary = summary_payload(cursor, year, month)
 
             cursor.close()
             conn.close()
@@ -232,15 +176,14 @@ class CRMIntegration:
                 return True
 
             # Send to CRM
-            response = requests.post(
-                f"{self.api_base}/reports/summary",
+            response = self.http.post(
+                "/reports/summary",
                 json={
                     'year': year,
                     'month': month,
                     'summary': summary
                 },
-                headers=self.get_auth_headers(),
-                timeout=self.timeout
+                headers=self.get_auth_headers()
             )
 
             if response.status_code in [200, 201]:
@@ -260,10 +203,9 @@ class CRMIntegration:
             return None
 
         try:
-            response = requests.get(
-                f"{self.api_base}/employees/{employee_id}",
-                headers=self.get_auth_headers(),
-                timeout=self.timeout
+            response = self.http.get(
+                f"/employees/{employee_id}",
+                headers=self.get_auth_headers()
             )
 
             if response.status_code == 200:
@@ -277,74 +219,75 @@ class CRMIntegration:
             return None
 
     def webhook_handler(self, event_type: str, data: Dict) -> bool:
-        """Handle webhook events from CRM"""
-        if not self.enabled:
-            return False
+        """Queue a webhook event from CRM; process_webhooks applies queued events in batches"""
+        return self.webhook_batch_handler([(event_type, data)]) == 1
 
-        logger.info(f"Received webhook: {event_type}")
+    def webhook_batch_handler(self, events: List[Tuple[str, Dict]]) -> int:
+        """Queue many (event_type, data) webhook events in one round trip; returns how many were queued"""
+        if not self.enabled:
+            return 0
 
         try:
-            if event_type == "employee.created":
-                # Handle new employee created in CRM
-                return self._handle_employee_created(data)
-            elif event_type == "employee.updated":
-                # Handle employee updated in CRM
-                return self._handle_employee_updated(data)
-            elif event_type == "salary.requested":
-                # Handle salary calculation request from CRM
-                return self._handle_salary_requested(data)
-            else:
-                logger.warning(f"Unknown webhook event type: {event_type}")
-                return False
+            conn = psycopg2.connect(self.db_config.get_connection_string())
+            try:
+                queued = enqueue_events(conn, events)
+            finally:
+                conn.close()
+            logger.info(f"Queued {queued} webhook events")
+            return queued
 
         except Exception as e:
             logger.error(f"Webhook handling error: {e}")
-            return False
+            return 0
 
-    def _handle_employee_created(self, data: Dict) -> bool:
-        """Handle employee created webhook"""
-        # Implement employee creation logic
-        logger.info(f"Handling employee created: {data.get('name')}")
-        return True
+    def process_webhooks(self, max_seconds: Optional[float] = None) -> Dict:
+        """Apply queued webhook events: coalesced profile upserts and batched payroll runs"""
+        conn = psycopg2.connect(self.db_config.get_connection_string())
+        try:
+            return drain(conn, max_seconds=max_seconds)
+        finally:
+            conn.close()
 
-    def _handle_employee_updated(self, data: Dict) -> bool:
-        """Handle employee updated webhook"""
-        # Implement employee update logic
-        logger.info(f"Handling employee updated: {data.get('name')}")
-        return True
+    def webhook_metrics(self) -> Dict:
+        """Webhook queue depth, lag and recent throughput"""
+        conn = psycopg2.connect(self.db_config.get_connection_string())
+        try:
+            with conn.cursor() as cursor:
+                return webhook_metrics(cursor)
+        finally:
+            conn.close()
 
-    def _handle_salary_requested(self, data: Dict) -> bool:
-        """Handle salary calculation request"""
-        # Implement salary calculation request logic
-        logger.info(f"Handling salary request for: {data.get('employee_name')}")
-        return True
 
+def run_periodic_sync() -> Optional[Dict]:
+    """Run periodic sync (can be called from scheduler)
 
-def run_periodic_sync():
-    """Run periodic sync (can be called from scheduler)"""
+    The health check, employee, salary and (optionally) report syncs run
+    concurrently on the async engine, so a cycle takes about as long as its
+    slowest call.
+    """
     logger.info("Starting periodic CRM sync")
 
     crm = CRMIntegration()
 
     if not crm.enabled:
         logger.info("CRM integration disabled, skipping sync")
-        return
-
-    # Test connection
-    if not crm.test_connection():
-        logger.error("CRM connection test failed, skipping sync")
-        return
-
-    # Sync employees
-    if os.getenv('CRM_SYNC_EMPLOYEES', 'true').lower() == 'true':
-        crm.sync_employees()
-
-    # Sync current month salaries
-    if os.getenv('CRM_SYNC_SALARIES', 'true').lower() == 'true':
-        now = datetime.now()
-        crm.sync_salaries(now.year, now.month)
-
-    logger.info("Periodic CRM sync completed")
+        return None
+
+    now = datetime.now()
+    sync_reports = os.getenv('CRM_SYNC_REPORTS', 'false').lower() == 'true'
+    result = run_sync_cycle(
+        crm.http,
+        lambda: closing(psycopg2.connect(crm.db_config.get_connection_string())),
+        crm.get_auth_headers(),
+        employees=os.getenv('CRM_SYNC_EMPLOYEES', 'true').lower() == 'true',
+        salaries=os.getenv('CRM_SYNC_SALARIES', 'true').lower() == 'true',
+        report_month=(now.year, now.month) if sync_reports else None
+    )
+
+    if result['results']['health']['status'] != 'success':
+        logger.error("CRM connection test failed during sync")
+    logger.info(f"Periodic CRM sync completed in {result['seconds']}s")
+    return result
 
 
 if __name__ == "__main__":
@@ -0,0 +1,329 @@
+"""
+CRM Delta Sync
+Per-entity high-water marks in crm_sync_state so CRM syncs only send rows changed since the last acknowledged batch
+"""
+
+import datetime
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+from psycopg2 import sql
+
+from payroll_summary import SUMMARY_TABLE
+
+logger = logging.getLogger(__name__)
+
+SYNC_STATE_TABLE = 'crm_sync_state'
+
+EMPLOYEES = 'labor_profiles'
+SALARIES = 'salary_records'
+
+# Rows sent per CRM request; the watermark advances after each acknowledged batch
+SYNC_BATCH_SIZE = int(os.getenv('CRM_SYNC_BATCH_SIZE', '5000'))
+
+# Rows (by id range) stamped per transaction when updated_at is first added to a table
+TRACKING_BACKFILL_BATCH = int(os.getenv('CRM_TRACKING_BACKFILL_BATCH', '10000'))
+
+# Columns read for each synced entity; id and updated_at form the watermark key
+ENTITY_COLUMNS = {
+    EMPLOYEES: ('id', 'name', 'base_daily_wage', 'position', 'contact_info', 'overtime_rate', 'updated_at'),
+    SALARIES: ('id', 'labor_name', 'date', 'day_type', 'daily_wage', 'hours_worked', 'overtime_hours',
+               'weekend_bonus', 'holiday_bonus', 'other_allowances', 'deductions', 'total_salary',
+               'updated_at'),
+}
+
+_SYNC_STATE_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {SYNC_STATE_TABLE} (
+        entity VARCHAR(64) PRIMARY KEY,
+        watermark_at TIMESTAMPTZ NOT NULL DEFAULT '-infinity',
+        watermark_id BIGINT NOT NULL DEFAULT 0,
+        rows_synced BIGINT NOT NULL DEFAULT 0,
+        synced_at TIMESTAMPTZ
+    )
+"""
+
+# updated_at uses clock_timestamp(), not the transaction start, so a row can never be
+# stamped earlier than the moment it was written. Updates that change nothing keep
+# their timestamp and are not sent again.
+_TRACKING_FUNCTION_DDL = """
+    CREATE OR REPLACE FUNCTION set_row_updated_at() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' THEN
+            NEW.updated_at := OLD.updated_at;
+            IF NEW IS NOT DISTINCT FROM OLD THEN
+                RETURN NEW;
+            END IF;
+        END IF;
+        NEW.updated_at := clock_timestamp();
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+
+def ensure_sync_state_schema(cursor):
+    cursor.execute(_SYNC_STATE_DDL)
+
+
+def _updated_at_nullable(cursor, table: str) -> bool:
+    """True while updated_at is missing or still being backfilled"""
+    cursor.execute("""
+        SELECT is_nullable = 'YES' FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s AND column_name = 'updated_at'
+    """, (table,))
+    row = cursor.fetchone()
+    return row is None or row[0]
+
+
+def _add_updated_at(cursor, table: str, batch_size: int) -> int:
+    """Add updated_at without rewriting the table, stamp existing rows in batches, then make it NOT NULL
+
+    A volatile default would rewrite the table (every partition) under an
+    ACCESS EXCLUSIVE lock. The column is added nullable and gets its default
+    as a separate, catalog-only step, so new rows are stamped from then on;
+    existing rows are stamped batch_size ids per transaction.
+    """
+    conn = cursor.connection
+    identifier = sql.Identifier(table)
+    # A leftover trigger would copy the NULL back over every stamp; it is recreated afterwards
+    cursor.execute(sql.SQL("DROP TRIGGER IF EXISTS {} ON {}").format(
+        sql.Identifier(f"{table}_set_updated_at"), identifier
+    ))
+    cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ").format(identifier))
+    cursor.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN updated_at SET DEFAULT clock_timestamp()").format(identifier))
+    conn.commit()
+
+    cursor.execute(sql.SQL("SELECT MIN(id), MAX(id) FROM {}").format(identifier))
+    low, high = cursor.fetchone()
+    stamped = 0
+    if low is not None:
+        for start in range(low, high + 1, batch_size):
+            cursor.execute(sql.SQL("""
+                UPDATE {} SET updated_at = clock_timestamp()
+                WHERE id >= %s AND id < %s AND updated_at IS NULL
+            """).format(identifier), (start, start + batch_size))
+            stamped += cursor.rowcount
+            conn.commit()
+
+    # Safety net for rows the id ranges missed; SET NOT NULL then scans but does not rewrite
+    cursor.execute(sql.SQL("UPDATE {} SET updated_at = clock_timestamp() WHERE updated_at IS NULL").format(identifier))
+    stamped += cursor.rowcount
+    cursor.execute(sql.SQL("ALTER TABLE {} ALTER COLUMN updated_at SET NOT NULL").format(identifier))
+    conn.commit()
+    logger.info(f"Added updated_at to {table}: {stamped} existing rows stamped")
+    return stamped
+
+
+def ensure_change_tracking(cursor, tables=(EMPLOYEES, SALARIES), batch_size: int = TRACKING_BACKFILL_BATCH):
+    """Add trigger-maintained updated_at columns (and their keyset indexes) to the synced tables
+
+    Existing rows are stamped as they are backfilled, so the first delta sync
+    after enabling this sends everything once. Adding the column commits the
+    caller's transaction along the way. On a partitioned salary_records the
+    column, index and trigger reach every partition.
+    """
+    cursor.execute(_TRACKING_FUNCTION_DDL)
+    for table in tables:
+        identifier = sql.Identifier(table)
+        if _updated_at_nullable(cursor, table):
+            _add_updated_at(cursor, table, batch_size)
+        cursor.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (updated_at, id)").format(
+            sql.Identifier(f"idx_{table}_updated_at"), identifier
+        ))
+        cursor.execute(sql.SQL("DROP TRIGGER IF EXISTS {} ON {}").format(
+            sql.Identifier(f"{table}_set_updated_at"), identifier
+        ))
+        cursor.execute(sql.SQL("""
+            CREATE TRIGGER {} BEFORE INSERT OR UPDATE ON {}
+            FOR EACH ROW EXECUTE FUNCTION set_row_updated_at()
+        """).format(sql.Identifier(f"{table}_set_updated_at"), identifier))
+    ensure_sync_state_schema(cursor)
+
+
+def sync_upper_bound(cursor) -> datetime.datetime:
+    """Newest updated_at that is safe to sync up to (exclusive)
+
+    Rows stamped before this are all committed: any transaction still writing
+    started at or after it. Seeing other sessions' transactions requires the
+    same database role or pg_read_all_stats.
+    """
+    cursor.execute("""
+        SELECT LEAST(
+            clock_timestamp(),
+            (SELECT MIN(xact_start) FROM pg_stat_activity
+             WHERE backend_xid IS NOT NULL AND pid <> pg_backend_pid())
+        )
+    """)
+    return cursor.fetchone()[0]
+
+
+def get_watermark(cursor, entity: str):
+    """(updated_at, id) of the last acknowledged row for an entity"""
+    cursor.execute(f"""
+        INSERT INTO {SYNC_STATE_TABLE} (entity) VALUES (%s)
+        ON CONFLICT (entity) DO NOTHING
+    """, (entity,))
+    cursor.execute(f"SELECT watermark_at, watermark_id FROM {SYNC_STATE_TABLE} WHERE entity = %s", (entity,))
+    return cursor.fetchone()
+
+
+def set_watermark(cursor, entity: str, watermark_at, watermark_id: int, rows: int = 0):
+    cursor.execute(f"""
+        UPDATE {SYNC_STATE_TABLE}
+        SET watermark_at = %s, watermark_id = %s, rows_synced = rows_synced + %s, synced_at = clock_timestamp()
+        WHERE entity = %s
+    """, (watermark_at, watermark_id, rows, entity))
+
+
+def reset_watermark(cursor, entity: str):
+    """Make the next sync of an entity resend every row"""
+    set_watermark(cursor, entity, '-infinity', 0)
+
+
+def fetch_changes(cursor, entity: str, after, before, limit: int) -> List[Dict]:
+    """Rows with (updated_at, id) after the watermark and updated_at before the upper bound"""
+    columns = ENTITY_COLUMNS[entity]
+    cursor.execute(sql.SQL("""
+        SELECT {columns} FROM {table}
+        WHERE (updated_at, id) > (%s, %s) AND updated_at < %s
+        ORDER BY updated_at, id
+        LIMIT %s
+    """).format(columns=sql.SQL(', ').join(map(sql.Identifier, columns)), table=sql.Identifier(entity)),
+        (after[0], after[1], before, limit))
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def sync_changes(conn, entity: str, send: Optional[Callable[[List[Dict]], bool]],
+                 batch_size: int = SYNC_BATCH_SIZE,
+                 send_many: Optional[Callable[[List[List[Dict]]], List[bool]]] = None,
+                 window: int = 1) -> Dict:
+    """Send every row of entity changed since the last acknowledged sync, batch by batch
+
+    send(rows) posts one batch and returns True once the CRM has accepted it;
+    only then is the watermark moved past those rows and committed. A failed
+    batch stops the run and is retried from the same point next time. A
+    concurrent sync of the same entity is skipped.
+
+    With send_many, up to window batches are read ahead and handed over
+    together (to be posted concurrently); the watermark then advances over
+    the batches acknowledged before the first failure.
+    """
+    if send_many is None:
+        send_many = lambda batches: [send(batches[0])]  # noqa: E731
+        window = 1
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_try_advisory_lock(hashtext(%s), hashtext(%s))", (SYNC_STATE_TABLE, entity))
+    if not cursor.fetchone()[0]:
+        conn.rollback()
+        logger.info(f"CRM sync of {entity} already running, skipping")
+        return {'entity': entity, 'status': 'skipped', 'synced': 0, 'batches': 0}
+
+    synced = 0
+    batches = 0
+    status = 'success'
+    try:
+        ensure_sync_state_schema(cursor)
+        watermark = get_watermark(cursor, entity)
+        upper = sync_upper_bound(cursor)
+        conn.commit()
+
+        drained = False
+        while not drained and status == 'success':
+            pending = []
+            after = watermark
+            while len(pending) < window:
+                rows = fetch_changes(cursor, entity, after, upper, batch_size)
+                if rows:
+                    pending.append(rows)
+                    after = (rows[-1]['updated_at'], rows[-1]['id'])
+                if len(rows) < batch_size:
+                    drained = True
+                    break
+            conn.rollback()
+            if not pending:
+                break
+
+            for rows, ok in zip(pending, send_many(pending)):
+                if not ok:
+                    status = 'failed'
+                    break
+                last = rows[-1]
+                watermark = (last['updated_at'], last['id'])
+                set_watermark(cursor, entity, watermark[0], watermark[1], len(rows))
+                conn.commit()
+                synced += len(rows)
+                batches += 1
+    finally:
+        conn.rollback()
+        cursor.execute("SELECT pg_advisory_unlock(hashtext(%s), hashtext(%s))", (SYNC_STATE_TABLE, entity))
+        conn.commit()
+        cursor.close()
+
+    logger.info(f"CRM delta sync of {entity}: {synced} rows in {batches} batches ({status})")
+    return {'entity': entity, 'status': status, 'synced': synced, 'batches': batches}
+
+
+def sync_state(cursor) -> List[Dict]:
+    """Watermarks and totals for every synced entity"""
+    cursor.execute(f"""
+        SELECT entity, watermark_at, watermark_id, rows_synced, synced_at
+        FROM {SYNC_STATE_TABLE} ORDER BY entity
+    """)
+    columns = ('entity', 'watermark_at', 'watermark_id', 'rows_synced', 'synced_at')
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def employee_payload(row: Dict) -> Dict:
+    """CRM employee record for a labor_profiles row"""
+    return {
+        'employee_id': row['id'],
+        'name': row['name'],
+        'daily_wage': float(row['base_daily_wage']),
+        'position': row['position'],
+        'contact': row['contact_info'],
+        'overtime_rate': float(row['overtime_rate'])
+    }
+
+
+def salary_payload(row: Dict) -> Dict:
+    """CRM salary record for a salary_records row"""
+    return {
+        'employee_name': row['labor_name'],
+        'date': row['date'].isoformat(),
+        'day_type': row['day_type'],
+        'daily_wage': float(row['daily_wage']),
+        'hours_worked': float(row['hours_worked']),
+        'overtime_hours': float(row['overtime_hours']),
+        'weekend_bonus': float(row['weekend_bonus']),
+        'holiday_bonus': float(row['holiday_bonus']),
+        'allowances': float(row['other_allowances']),
+        'deductions': float(row['deductions']),
+        'total_salary': float(row['total_salary'])
+    }
+
+
+def salaries_by_month(rows: List[Dict]) -> Dict[tuple, List[Dict]]:
+    """Group changed salary rows by (year, month), matching the CRM's per-month endpoint"""
+    months: Dict[tuple, List[Dict]] = {}
+    for row in rows:
+        months.setdefault((row['date'].year, row['date'].month), []).append(salary_payload(row))
+    return months
+
+
+def summary_payload(cursor, year: int, month: int) -> List[Dict]:
+    """CRM summary report records for a month, from payroll_monthly_summary"""
+    cursor.execute(f"""
+        SELECT labor_name, working_days, total_hours, total_overtime_hours, total_salary
+        FROM {SUMMARY_TABLE}
+        WHERE year = %s AND month = %s
+        ORDER BY labor_name
+    """, (year, month))
+    return [{
+        'employee_name': row[0],
+        'working_days': row[1],
+        'total_hours': float(row[2]),
+        'total_overtime': float(row[3]),
+        'total_salary': float(row[4])
+    } for row in cursor.fetchall()]
@@ -0,0 +1,330 @@
+"""
+CRM Chunked Uploads
+Gzip-compressed, chunked salary uploads to the CRM that resume from the last acknowledged chunk
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import logging
+import os
+import uuid
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from crm_sync_state import get_watermark, salary_payload, set_watermark
+from period_queries import Period
+from report_stream import CRM_SALARY_COLUMNS, DEFAULT_ITERSIZE, iter_query_chunks
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_TABLE = 'crm_upload_progress'
+
+# Salary rows per uploaded chunk
+UPLOAD_BATCH_SIZE = int(os.getenv('CRM_UPLOAD_BATCH_SIZE', '2000'))
+
+# Rows per shard when a month's upload is fanned out across Celery tasks
+SHARD_ROWS = int(os.getenv('CRM_SHARD_ROWS', '20000'))
+
+# Request bodies are gzip-compressed unless CRM_GZIP=false
+GZIP_ENABLED = os.getenv('CRM_GZIP', 'true').lower() == 'true'
+GZIP_LEVEL = int(os.getenv('CRM_GZIP_LEVEL', '6'))
+
+_UPLOAD_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {UPLOAD_TABLE} (
+        upload_key VARCHAR(64) PRIMARY KEY,
+        upload_id VARCHAR(36) NOT NULL,
+        last_date DATE,
+        last_labor_name VARCHAR(255),
+        chunks_sent INTEGER NOT NULL DEFAULT 0,
+        rows_sent BIGINT NOT NULL DEFAULT 0,
+        started_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    )
+"""
+
+
+def ensure_upload_schema(cursor):
+    cursor.execute(_UPLOAD_DDL)
+
+
+def salary_record(row) -> Dict:
+    """CRM salary record for a row of CRM_SALARY_COLUMNS"""
+    return salary_payload(dict(zip(CRM_SALARY_COLUMNS, row)))
+
+
+def encode_body(fields: Dict, key: str, records: Iterable[Dict],
+                compress: bool = GZIP_ENABLED) -> bytes:
+    """JSON for {key: [records], **fields}, written record by record into a (gzip) buffer
+
+    Records are serialized as they are read: given a generator (e.g. over a
+    server-side cursor), only the encoded body is held in memory. fields are
+    written after the records, so the generator can still fill them in.
+    """
+    buffer = io.BytesIO()
+    out = gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=GZIP_LEVEL, mtime=0) if compress else buffer
+
+    out.write(f'{{{json.dumps(key)}: ['.encode())
+    for index, record in enumerate(records):
+        if index:
+            out.write(b', ')
+        out.write(json.dumps(record).encode())
+    out.write(b']')
+    out.write(f', {json.dumps(fields)[1:]}'.encode() if fields else b'}')
+
+    if compress:
+        out.close()
+    return buffer.getvalue()
+
+
+def post_records(client, path: str, fields: Dict, key: str, records: Iterable[Dict],
+                 headers: Optional[Dict[str, str]] = None, compress: bool = GZIP_ENABLED, **kwargs):
+    """POST {**fields, key: [records]} through an HttpClient, gzip-encoded unless compress is False"""
+    body = encode_body(fields, key, records, compress)
+    headers = dict(headers or {})
+    headers['Content-Type'] = 'application/json'
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    return client.post(path, data=body, headers=headers, **kwargs)
+
+
+def _get_progress(cursor, upload_key: str):
+    """Saved (upload_id, last_date, last_labor_name, chunks_sent, rows_sent), starting a new upload if none"""
+    cursor.execute(f"""
+        INSERT INTO {UPLOAD_TABLE} (upload_key, upload_id) VALUES (%s, %s)
+        ON CONFLICT (upload_key) DO NOTHING
+    """, (upload_key, str(uuid.uuid4())))
+    cursor.execute(f"""
+        SELECT upload_id, last_date, last_labor_name, chunks_sent, rows_sent
+        FROM {UPLOAD_TABLE} WHERE upload_key = %s
+    """, (upload_key,))
+    return cursor.fetchone()
+
+
+def month_key(year: int, month: int) -> str:
+    return f"salary_records:{year}-{month:02d}"
+
+
+def _upload_key(year: int, month: int, shard: Optional[Dict]) -> str:
+    if shard is None:
+        return month_key(year, month)
+    names = hashlib.md5(f"{shard['first']}|{shard['last']}".encode()).hexdigest()[:12]
+    return f"{month_key(year, month)}:{names}"
+
+
+def month_shards(cursor, year: int, month: int, shard_rows: int = SHARD_ROWS) -> List[Dict]:
+    """Split a month into contiguous labor_name ranges of about shard_rows rows each
+
+    Each shard is {'shard', 'first', 'last', 'rows'}; an employee's rows
+    never straddle two shards. An empty month is a single empty shard.
+    """
+    period_filter, params = Period.month(year, month).predicate()
+    cursor.execute(f"""
+        SELECT labor_name, COUNT(*)
+        FROM salary_records
+        WHERE {period_filter}
+        GROUP BY labor_name
+        ORDER BY labor_name
+    """, params)
+
+    shards: List[Dict] = []
+    for name, rows in cursor.fetchall():
+        if not shards or shards[-1]['rows'] >= shard_rows:
+            shards.append({'shard': len(shards), 'first': name, 'last': name, 'rows': 0})
+        shards[-1]['last'] = name
+        shards[-1]['rows'] += rows
+    return shards or [{'shard': 0, 'first': None, 'last': None, 'rows': 0}]
+
+
+def _chunk_query(period: Period, after, limit: int, shard: Optional[Dict] = None):
+    """Query for up to limit rows of the period (and shard) after the (date, labor_name) key, in key order"""
+    period_filter, params = period.predicate()
+    query = f"""
+        SELECT {', '.join(CRM_SALARY_COLUMNS)}
+        FROM salary_records
+        WHERE {period_filter}
+    """
+    params = list(params)
+    if shard is not None and shard['first'] is not None:
+        query += " AND labor_name BETWEEN %s AND %s"
+        params.extend((shard['first'], shard['last']))
+    if after[0] is not None:
+        query += " AND (date, labor_name) > (%s, %s)"
+        params.extend(after)
+    query += " ORDER BY date, labor_name LIMIT %s"
+    params.append(limit)
+    return query, params
+
+
+def _fetch_chunk(cursor, period: Period, after, limit: int, shard: Optional[Dict] = None):
+    cursor.execute(*_chunk_query(period, after, limit, shard))
+    return cursor.fetchall()
+
+
+class _ChunkStream:
+    """One chunk's salary records, read from a server-side cursor while they are encoded
+
+    The query asks for one row more than the chunk holds; once read,
+    fields['final'] tells whether that extra row was there, and last_row is
+    the chunk's last (resume) key.
+    """
+
+    def __init__(self, conn, query: str, params, fields: Dict, batch_size: int):
+        self.fields = fields
+        self.rows = 0
+        self.last_row = None
+        self._records = self._read(conn, query, params, batch_size)
+
+    def _read(self, conn, query: str, params, batch_size: int):
+        batches = iter_query_chunks(conn, query, params, min(batch_size + 1, DEFAULT_ITERSIZE),
+                                    cursor_name='crm_upload_chunk')
+        try:
+            for rows in batches:
+                for row in rows:
+                    if self.rows == batch_size:
+                        self.fields['final'] = False
+                        return
+                    self.rows += 1
+                    self.last_row = row
+                    yield salary_record(row)
+            self.fields['final'] = True
+        finally:
+            batches.close()
+
+    def __iter__(self):
+        return self._records
+
+    def drain(self):
+        """Read whatever the poster left unread, so final and last_row are set"""
+        for _ in self._records:
+            pass
+
+    def close(self):
+        """Close the server-side cursor, read to the end or not"""
+        self._records.close()
+
+
+def upload_month(conn, post_chunk: Optional[Callable[[Dict, Iterable[Dict]], bool]], year: int, month: int,
+                 batch_size: int = UPLOAD_BATCH_SIZE,
+                 post_many: Optional[Callable[[List[Tuple[Dict, Iterable[Dict]]]], List[bool]]] = None,
+                 window: int = 1, shard: Optional[Dict] = None) -> Dict:
+    """Send a month of salary records in chunks, resuming after the last acknowledged one
+
+    post_chunk(fields, records) sends one chunk and returns True once the CRM
+    has acknowledged it. records streams from a server-side cursor, so pass
+    it to post_records/encode_body as it is; fields carries year, month,
+    upload_id, chunk (its index) and final, which is only settled once the
+    records have been read. A resumed upload keeps its upload_id and chunk
+    numbering, so the CRM can tell a retry from a new upload. Progress is
+    committed after every acknowledged chunk and cleared once the final
+    chunk is accepted.
+
+    With post_many, up to window chunks are read ahead and handed over
+    together (to be posted concurrently); their rows are held as tuples and
+    turned into records while they are encoded. The final chunk is always
+    sent on its own, after every earlier chunk has been acknowledged.
+
+    With shard (from month_shards) only that labor_name range is sent, as an
+    upload of its own with separate progress; fields then carry its index.
+    """
+    upload_key = _upload_key(year, month, shard)
+    period = Period.month(year, month)
+    cursor = conn.cursor()
+    ensure_upload_schema(cursor)
+    upload_id, last_date, last_name, chunk, rows_sent = _get_progress(cursor, upload_key)
+    conn.commit()
+    resumed = chunk > 0
+    if resumed:
+        logger.info(f"Resuming CRM upload {upload_key} after chunk {chunk - 1} ({rows_sent} rows)")
+
+    def chunk_fields(index: int) -> Dict:
+        fields = {'year': year, 'month': month, 'upload_id': upload_id, 'chunk': index, 'final': False}
+        if shard is not None:
+            fields['shard'] = shard['shard']
+        return fields
+
+    def acknowledged(fields: Dict, rows: int, last_row) -> bool:
+        """Record an acknowledged chunk; True when it was the final one"""
+        nonlocal chunk, rows_sent, last_date, last_name
+        chunk += 1
+        rows_sent += rows
+        if fields['final']:
+            cursor.execute(f"DELETE FROM {UPLOAD_TABLE} WHERE upload_key = %s", (upload_key,))
+            conn.commit()
+            return True
+
+        last_date, last_name = last_row[1], last_row[0]
+        cursor.execute(f"""
+            UPDATE {UPLOAD_TABLE}
+            SET last_date = %s, last_labor_name = %s, chunks_sent = %s, rows_sent = %s,
+                updated_at = now()
+            WHERE upload_key = %s
+        """, (last_date, last_name, chunk, rows_sent, upload_key))
+        conn.commit()
+        return False
+
+    def stopped() -> Dict:
+        logger.error(f"CRM upload {upload_key} stopped at chunk {chunk}; it resumes there next time")
+        return {'status': 'failed', 'upload_id': upload_id, 'chunks': chunk,
+                'synced': rows_sent, 'resumed': resumed}
+
+    try:
+        final = False
+        while not final and post_many is None:
+            # One extra row tells whether this chunk is the last
+            fields = chunk_fields(chunk)
+            query, params = _chunk_query(period, (last_date, last_name), batch_size + 1, shard)
+            stream = _ChunkStream(conn, query, params, fields, batch_size)
+            try:
+                ok = post_chunk(fields, stream)
+                stream.drain()
+            finally:
+                stream.close()
+            conn.rollback()
+            if not ok:
+                return stopped()
+            final = acknowledged(fields, stream.rows, stream.last_row)
+
+        while not final:
+            pending = []
+            after = (last_date, last_name)
+            while len(pending) < window and not final:
+                rows = _fetch_chunk(cursor, period, after, batch_size + 1, shard)
+                final = len(rows) <= batch_size
+                rows = rows[:batch_size]
+                fields = chunk_fields(chunk + len(pending))
+                fields['final'] = final
+                pending.append((fields, rows))
+                if rows:
+                    after = (rows[-1][1], rows[-1][0])
+            conn.rollback()
+
+            groups = [pending[:-1], pending[-1:]] if final and len(pending) > 1 else [pending]
+            for group in groups:
+                results = post_many([(fields, map(salary_record, rows)) for fields, rows in group])
+                for (fields, rows), ok in zip(group, results):
+                    if not ok:
+                        return stopped()
+                    if acknowledged(fields, len(rows), rows[-1] if rows else None):
+                        break
+    finally:
+        conn.rollback()
+        cursor.close()
+
+    logger.info(f"Uploaded {rows_sent} salary records for {upload_key} in {chunk} chunks")
+    return {'status': 'success', 'upload_id': upload_id, 'chunks': chunk, 'synced': rows_sent,
+            'year': year, 'month': month, 'resumed': resumed}
+
+
+def record_month_sync(cursor, year: int, month: int, as_of, rows: int):
+    """Mark a month as fully sent as of as_of in crm_sync_state (entity salary_records:YYYY-MM)"""
+    entity = month_key(year, month)
+    get_watermark(cursor, entity)
+    set_watermark(cursor, entity, as_of, 0, rows)
+
+
+def reset_upload(cursor, year: int, month: int):
+    """Forget a partial upload (and any partial shards) so the month is sent again from the start"""
+    key = month_key(year, month)
+    cursor.execute(f"DELETE FROM {UPLOAD_TABLE} WHERE upload_key = %s OR upload_key LIKE %s",
+                   (key, f"{key}:%"))
@@ -0,0 +1,361 @@
+"""
+CRM Webhook Ingestion
+Queues CRM webhook events in PostgreSQL and applies them in coalesced batches with bulk upserts
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from holiday_calendar import load_calendar
+from server_payroll import generate_month_in_database
+
+logger = logging.getLogger(__name__)
+
+EVENTS_TABLE = 'crm_webhook_events'
+PROFILE_STAGING_TABLE = 'labor_profiles_staging'
+
+EMPLOYEE_EVENTS = ('employee.created', 'employee.updated')
+SALARY_EVENTS = ('salary.requested',)
+EVENT_TYPES = EMPLOYEE_EVENTS + SALARY_EVENTS
+
+# Events claimed per drain transaction
+WEBHOOK_BATCH_SIZE = int(os.getenv('CRM_WEBHOOK_BATCH_SIZE', '5000'))
+
+# Inbound employee fields and the labor_profiles columns they set
+EMPLOYEE_FIELDS = {
+    'daily_wage': 'base_daily_wage',
+    'base_daily_wage': 'base_daily_wage',
+    'hourly_rate': 'hourly_rate',
+    'position': 'position',
+    'contact': 'contact_info',
+    'contact_info': 'contact_info',
+    'overtime_rate': 'overtime_rate',
+}
+PROFILE_UPDATE_COLUMNS = ('base_daily_wage', 'hourly_rate', 'position', 'contact_info', 'overtime_rate')
+
+# salary.requested options passed through to generate_month_in_database
+PAYROLL_OPTIONS = ('hours_per_day', 'overtime_per_day', 'include_weekends', 'other_allowances', 'deductions')
+
+_EVENTS_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {EVENTS_TABLE} (
+        id BIGSERIAL PRIMARY KEY,
+        event_type VARCHAR(64) NOT NULL,
+        payload JSONB NOT NULL,
+        received_at TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp(),
+        processed_at TIMESTAMPTZ,
+        error TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_{EVENTS_TABLE}_pending ON {EVENTS_TABLE} (id) WHERE processed_at IS NULL;
+"""
+
+
+def ensure_webhook_schema(cursor):
+    cursor.execute(_EVENTS_DDL)
+
+
+def enqueue_events(conn, events: Iterable[Tuple[str, Dict]]) -> int:
+    """Store (event_type, data) pairs for the next drain; one round trip however many there are"""
+    rows = [(event_type, json.dumps(data)) for event_type, data in events]
+    if not rows:
+        return 0
+    with conn.cursor() as cursor:
+        execute_values(cursor, f"INSERT INTO {EVENTS_TABLE} (event_type, payload) VALUES %s",
+                       rows, template="(%s, %s::jsonb)", page_size=1000)
+    conn.commit()
+    return len(rows)
+
+
+def coalesce_employee_events(events: Iterable[Tuple[int, str, Dict]]
+                             ) -> Tuple[Dict[str, Dict], Dict[str, List[int]], Dict[int, str]]:
+    """Merge (id, event_type, data) employee events per name in arrival order; later values win field by field
+
+    Returns the merged column values by name, the event ids behind each
+    name, and an error for each event that cannot be applied.
+    """
+    merged: Dict[str, Dict] = {}
+    sources: Dict[str, List[int]] = {}
+    errors: Dict[int, str] = {}
+    for event_id, event_type, data in events:
+        name = (data.get('name') or '').strip()
+        if not name:
+            errors[event_id] = f"{event_type} without a name"
+            continue
+        sources.setdefault(name, []).append(event_id)
+        columns = merged.setdefault(name, {})
+        for field, column in EMPLOYEE_FIELDS.items():
+            if data.get(field) is not None:
+                columns[column] = data[field]
+    return merged, sources, errors
+
+
+def upsert_profiles(cursor, profiles: Dict[str, Dict]) -> Dict:
+    """Apply merged employee values to labor_profiles in one statement
+
+    Fields an event did not carry keep their stored value, except the
+    hourly rate: unless the event sets one it follows the (merged) daily
+    wage as wage / 8. A new employee needs a daily wage (names without one
+    are returned as rejected). Rows that change nothing are left untouched.
+    """
+    if not profiles:
+        return {'inserted': 0, 'updated': 0, 'rejected': []}
+
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {PROFILE_STAGING_TABLE} (
+            name VARCHAR(255) PRIMARY KEY,
+            base_daily_wage DECIMAL(10,2),
+            hourly_rate DECIMAL(10,2),
+            position VARCHAR(255),
+            contact_info TEXT,
+            overtime_rate DECIMAL(3,2)
+        ) ON COMMIT DROP
+    """)
+    cursor.execute(f"TRUNCATE {PROFILE_STAGING_TABLE}")
+    execute_values(
+        cursor,
+        f"INSERT INTO {PROFILE_STAGING_TABLE} (name, {', '.join(PROFILE_UPDATE_COLUMNS)}) VALUES %s",
+        [(name, *(values.get(column) for column in PROFILE_UPDATE_COLUMNS)) for name, values in profiles.items()],
+        page_size=1000
+    )
+
+    cursor.execute(f"""
+        WITH source AS (
+            SELECT s.name,
+                   COALESCE(s.base_daily_wage, p.base_daily_wage) AS base_daily_wage,
+                   COALESCE(s.hourly_rate, ROUND(COALESCE(s.base_daily_wage, p.base_daily_wage) / 8, 2)) AS hourly_rate,
+                   COALESCE(s.position, p.position) AS position,
+                   COALESCE(s.contact_info, p.contact_info) AS contact_info,
+                   COALESCE(s.overtime_rate, p.overtime_rate, 1.5) AS overtime_rate,
+                   p.id IS NOT NULL AS existing
+            FROM {PROFILE_STAGING_TABLE} s
+            LEFT JOIN labor_profiles p ON p.name = s.name
+        ),
+        upserted AS (
+            INSERT INTO labor_profiles (name, {', '.join(PROFILE_UPDATE_COLUMNS)})
+            SELECT name, {', '.join(PROFILE_UPDATE_COLUMNS)} FROM source
+            WHERE base_daily_wage IS NOT NULL
+            ON CONFLICT (name) DO UPDATE SET
+                {', '.join(f'{column} = EXCLUDED.{column}' for column in PROFILE_UPDATE_COLUMNS)}
+            WHERE ({', '.join(f'labor_profiles.{column}' for column in PROFILE_UPDATE_COLUMNS)})
+                IS DISTINCT FROM ({', '.join(f'EXCLUDED.{column}' for column in PROFILE_UPDATE_COLUMNS)})
+            RETURNING name
+        )
+        SELECT COUNT(*) FILTER (WHERE u.name IS NOT NULL AND NOT s.existing),
+               COUNT(*) FILTER (WHERE u.name IS NOT NULL AND s.existing),
+               COALESCE(array_agg(s.name) FILTER (WHERE s.base_daily_wage IS NULL), '{{}}')
+        FROM source s LEFT JOIN upserted u ON u.name = s.name
+    """)
+    inserted, updated, rejected = cursor.fetchone()
+    return {'inserted': inserted, 'updated': updated, 'rejected': rejected}
+
+
+def _payroll_options(data: Dict) -> tuple:
+    """The PAYROLL_OPTIONS a salary.requested event set, as sorted (name, value) pairs of the right types
+
+    Numeric options become floats and include_weekends must be a JSON
+    boolean; anything else raises ValueError.
+    """
+    options = []
+    for key in PAYROLL_OPTIONS:
+        value = data.get(key)
+        if value is None:
+            continue
+        if key == 'include_weekends':
+            if not isinstance(value, bool):
+                raise ValueError(f"{key} must be true or false, not {value!r}")
+        else:
+            if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+                raise ValueError(f"{key} must be a number, not {value!r}")
+            try:
+                value = float(value)
+            except ValueError:
+                raise ValueError(f"{key} must be a number, not {value!r}") from None
+            if not math.isfinite(value) or value < 0:
+                raise ValueError(f"{key} must be a non-negative number, not {value!r}")
+        options.append((key, value))
+    return tuple(sorted(options))
+
+
+def group_salary_requests(events: Iterable[Tuple[int, Dict]]) -> Tuple[Dict[tuple, Optional[set]], Dict[int, str]]:
+    """Collapse salary.requested events into one payroll run per (year, month, options)
+
+    The value is the set of employee names to calculate, or None when any
+    request in the group asked for the whole month. Events with an invalid
+    month or option are returned as errors instead.
+    """
+    groups: Dict[tuple, Optional[set]] = {}
+    errors: Dict[int, str] = {}
+    for event_id, data in events:
+        try:
+            year, month = int(data['year']), int(data['month'])
+            if not 1 <= month <= 12:
+                raise ValueError(month)
+        except (KeyError, TypeError, ValueError):
+            errors[event_id] = "salary.requested without a valid year and month"
+            continue
+        try:
+            options = _payroll_options(data)
+        except ValueError as error:
+            errors[event_id] = f"salary.requested with an invalid option: {error}"
+            continue
+        name = data.get('employee_name')
+        if name is not None and not isinstance(name, str):
+            errors[event_id] = "salary.requested with an employee_name that is not a string"
+            continue
+        key = (year, month, options)
+        if not name:
+            groups[key] = None
+        elif key not in groups:
+            groups[key] = {name}
+        elif groups[key] is not None:
+            groups[key].add(name)
+    return groups, errors
+
+
+def drain_once(conn, batch_size: int = WEBHOOK_BATCH_SIZE, holidays=None) -> Dict:
+    """Claim up to batch_size queued events, apply them in one transaction and mark them processed
+
+    Employee events are applied before salary requests, so a request for
+    an employee created in the same batch is calculated. Events that can
+    never be applied are marked processed with their error instead of
+    blocking the queue; a database failure rolls the whole batch back for
+    the next drain.
+    """
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT id, event_type, payload, EXTRACT(EPOCH FROM clock_timestamp() - received_at)
+            FROM {EVENTS_TABLE}
+            WHERE processed_at IS NULL
+            ORDER BY id
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        """, (batch_size,))
+        claimed = cursor.fetchall()
+        if not claimed:
+            conn.rollback()
+            return {'events': 0}
+
+        try:
+            employee_events = [(event_id, event_type, data) for event_id, event_type, data, _ in claimed
+                               if event_type in EMPLOYEE_EVENTS]
+            salary_events = [(event_id, data) for event_id, event_type, data, _ in claimed
+                             if event_type in SALARY_EVENTS]
+            errors = {event_id: f"unknown event type {event_type}" for event_id, event_type, _, _ in claimed
+                      if event_type not in EVENT_TYPES}
+
+            profiles, sources, employee_errors = coalesce_employee_events(employee_events)
+            profile_result = upsert_profiles(cursor, profiles)
+            errors.update(employee_errors)
+            for name in profile_result['rejected']:
+                errors.update((event_id, "new employee without a daily wage") for event_id in sources[name])
+
+            groups, salary_errors = group_salary_requests(salary_events)
+            errors.update(salary_errors)
+            if groups and holidays is None:
+                holidays = load_calendar(cursor)
+            payroll_rows = 0
+            for (year, month, options), names in sorted(groups.items(), key=lambda item: item[0][:2]):
+                result = generate_month_in_database(
+                    cursor, year, month, holidays,
+                    labor_names=sorted(names) if names is not None else None, **dict(options)
+                )
+                payroll_rows += result['rows']
+
+            cursor.execute(f"UPDATE {EVENTS_TABLE} SET processed_at = clock_timestamp() WHERE id = ANY(%s)",
+                           ([event_id for event_id, _, _, _ in claimed],))
+            if errors:
+                execute_values(cursor, f"""
+                    UPDATE {EVENTS_TABLE} SET error = v.error
+                    FROM (VALUES %s) AS v(id, error)
+                    WHERE {EVENTS_TABLE}.id = v.id
+                """, list(errors.items()))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    elapsed = time.perf_counter() - started
+    if errors:
+        logger.warning(f"Skipped {len(errors)} CRM webhook events, e.g. {next(iter(errors.values()))}")
+
+    result = {
+        'events': len(claimed),
+        'employee_events': len(employee_events),
+        'profiles': len(profiles),
+        'profiles_inserted': profile_result['inserted'],
+        'profiles_updated': profile_result['updated'],
+        'coalesced': len(employee_events) - len(employee_errors) - len(profiles)
+                     + len(salary_events) - len(salary_errors) - len(groups),
+        'salary_requests': len(salary_events),
+        'payroll_runs': len(groups),
+        'payroll_rows': payroll_rows,
+        'errors': len(errors),
+        'max_lag_seconds': round(float(max(lag for _, _, _, lag in claimed)), 3),
+        'seconds': round(elapsed, 3),
+        'events_per_second': round(len(claimed) / elapsed, 1) if elapsed else 0.0
+    }
+    logger.info(f"Applied {len(claimed)} CRM webhook events in {elapsed:.2f}s "
+                f"({result['profiles']} profiles, {result['payroll_runs']} payroll runs)")
+    return result
+
+
+def drain(conn, batch_size: int = WEBHOOK_BATCH_SIZE, max_seconds: Optional[float] = None) -> Dict:
+    """Drain the queue batch by batch until it is empty (or max_seconds has passed)"""
+    started = time.perf_counter()
+    totals = {'events': 0, 'batches': 0, 'profiles_inserted': 0, 'profiles_updated': 0,
+              'coalesced': 0, 'payroll_runs': 0, 'payroll_rows': 0, 'errors': 0, 'max_lag_seconds': 0.0}
+    holidays = None
+    while max_seconds is None or time.perf_counter() - started < max_seconds:
+        if holidays is None:
+            with conn.cursor() as cursor:
+                holidays = load_calendar(cursor)
+            conn.rollback()
+        result = drain_once(conn, batch_size, holidays)
+        if not result['events']:
+            break
+        totals['batches'] += 1
+        for key in ('events', 'profiles_inserted', 'profiles_updated', 'coalesced', 'payroll_runs',
+                    'payroll_rows', 'errors'):
+            totals[key] += result[key]
+        totals['max_lag_seconds'] = max(totals['max_lag_seconds'], result['max_lag_seconds'])
+
+    elapsed = time.perf_counter() - started
+    totals['seconds'] = round(elapsed, 3)
+    totals['events_per_second'] = round(totals['events'] / elapsed, 1) if elapsed else 0.0
+    return totals
+
+
+def webhook_metrics(cursor) -> Dict:
+    """Queue depth, age of the oldest waiting event and recent throughput"""
+    cursor.execute(f"""
+        SELECT COUNT(*) FILTER (WHERE processed_at IS NULL),
+               EXTRACT(EPOCH FROM clock_timestamp() - MIN(received_at) FILTER (WHERE processed_at IS NULL)),
+               COUNT(*) FILTER (WHERE processed_at > clock_timestamp() - interval '1 hour'),
+               COUNT(*) FILTER (WHERE error IS NOT NULL AND processed_at > clock_timestamp() - interval '1 hour'),
+               AVG(EXTRACT(EPOCH FROM processed_at - received_at))
+                   FILTER (WHERE processed_at > clock_timestamp() - interval '1 hour')
+        FROM {EVENTS_TABLE}
+    """)
+    pending, oldest, processed, failed, average_lag = cursor.fetchone()
+    return {
+        'pending': pending,
+        'oldest_pending_seconds': round(float(oldest), 3) if oldest is not None else 0.0,
+        'processed_last_hour': processed,
+        'errors_last_hour': failed,
+        'average_lag_seconds': round(float(average_lag), 3) if average_lag is not None else 0.0
+    }
+
+
+def purge_processed(cursor, days: int = 7) -> int:
+    """Delete events processed more than days ago"""
+    cursor.execute(f"""
+        DELETE FROM {EVENTS_TABLE}
+        WHERE processed_at < clock_timestamp() - make_interval(days => %s)
+    """, (days,))
+    return cursor.rowcount
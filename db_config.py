@@ -17,6 +17,12 @@ class DatabaseConfig:
         self.database = os.getenv('DB_NAME', 'labor_salary_db')
         self.user = os.getenv('DB_USER', 'postgres')
         self.password = os.getenv('DB_PASSWORD', 'password')
+
+        # Connection pool settings
+        self.pool_min_size = int(os.getenv('DB_POOL_MIN', '1'))
+        self.pool_max_size = int(os.getenv('DB_POOL_MAX', '10'))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+        self.pool_health_check_idle = float(os.getenv('DB_POOL_HEALTH_CHECK_IDLE', '10'))
         
     def get_connection_string(self) -> str:
         """Get PostgreSQL connection string"""
@@ -57,6 +63,14 @@ class DatabaseConfig:
                                 config.user = value
                             elif key == 'DB_PASSWORD':
                                 config.password = value
+                            elif key == 'DB_POOL_MIN':
+                                config.pool_min_size = int(value)
+                            elif key == 'DB_POOL_MAX':
+                                config.pool_max_size = int(value)
+                            elif key == 'DB_POOL_TIMEOUT':
+                                config.pool_timeout = float(value)
+                            elif key == 'DB_POOL_HEALTH_CHECK_IDLE':
+                                config.pool_health_check_idle = float(value)
                         except ValueError:
                             continue
         
@@ -72,6 +86,10 @@ class DatabaseConfig:
             f.write(f"DB_NAME={self.database}\n")
             f.write(f"DB_USER={self.user}\n")
             f.write(f"DB_PASSWORD={self.password}\n")
+            f.write(f"DB_POOL_MIN={self.pool_min_size}\n")
+            f.write(f"DB_POOL_MAX={self.pool_max_size}\n")
+            f.write(f"DB_POOL_TIMEOUT={self.pool_timeout}\n")
+            f.write(f"DB_POOL_HEALTH_CHECK_IDLE={self.pool_health_check_idle}\n")
     
     def __repr__(self):
         return f"DatabaseConfig(host={self.host}, port={self.port}, database={self.database}, user={self.user})"
@@ -0,0 +1,232 @@
+"""
+Database Connection Pool
+Thread-safe pool of PostgreSQL connections configured from DatabaseConfig
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+from psycopg2 import extensions
+from psycopg2.pool import PoolError
+
+from db_config import DatabaseConfig
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """Thread-safe PostgreSQL connection pool with health checks and usage stats
+
+    Fork-safe: a child process never uses or closes connections it inherited
+    (closing them would end the parent's sessions); it starts with an empty
+    pool of its own.
+    """
+
+    def __init__(self, config: DatabaseConfig, min_size: Optional[int] = None,
+                 max_size: Optional[int] = None, timeout: Optional[float] = None,
+                 health_check_idle: Optional[float] = None):
+        self.config = config
+        self.min_size = config.pool_min_size if min_size is None else min_size
+        self.max_size = config.pool_max_size if max_size is None else max_size
+        self.timeout = config.pool_timeout if timeout is None else timeout
+        # Connections idle for longer than this are pinged before being handed out
+        self.health_check_idle = (config.pool_health_check_idle
+                                  if health_check_idle is None else health_check_idle)
+
+        if self.max_size < 1 or self.min_size < 0 or self.min_size > self.max_size:
+            raise ValueError(f"Invalid pool size: min={self.min_size}, max={self.max_size}")
+
+        self._lock = threading.Condition()
+        self._idle: List[Tuple[extensions.connection, float]] = []
+        self._in_use: Dict[int, extensions.connection] = {}
+        self._size = 0
+        self._closed = False
+        self._pid = os.getpid()
+        # Connections inherited across a fork, kept referenced so they are never closed from here
+        self._inherited: List[extensions.connection] = []
+        self._stats = self._new_stats()
+
+        for _ in range(self.min_size):
+            conn = self._connect()
+            with self._lock:
+                self._size += 1
+                self._idle.append((conn, time.monotonic()))
+
+    @staticmethod
+    def _new_stats() -> Dict:
+        return {
+            'connections_created': 0,
+            'connections_discarded': 0,
+            'checkouts': 0,
+            'checkout_waits': 0,
+            'checkout_timeouts': 0,
+            'checkout_wait_seconds': 0.0,
+            'max_checkout_wait_seconds': 0.0,
+            'health_check_failures': 0,
+            'peak_in_use': 0,
+            'forks_detected': 0
+        }
+
+    def _check_fork(self):
+        """Start over with an empty pool in a forked child (caller must hold the lock)"""
+        if self._pid == os.getpid():
+            return
+        self._inherited.extend(conn for conn, _ in self._idle)
+        self._inherited.extend(self._in_use.values())
+        self._idle, self._in_use, self._size = [], {}, 0
+        forks = self._stats['forks_detected'] + 1
+        self._stats = self._new_stats()
+        self._stats['forks_detected'] = forks
+        self._pid = os.getpid()
+
+    def _connect(self) -> extensions.connection:
+        conn = psycopg2.connect(self.config.get_connection_string())
+        with self._lock:
+            self._stats['connections_created'] += 1
+        return conn
+
+    def _discard(self, conn: extensions.connection):
+        """Close a connection and free its slot (caller must hold the lock)"""
+        self._size -= 1
+        self._stats['connections_discarded'] += 1
+        self._lock.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _is_healthy(self, conn: extensions.connection, idle_since: float) -> bool:
+        if conn.closed:
+            return False
+        if time.monotonic() - idle_since < self.health_check_idle:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            return False
+
+    def getconn(self, timeout: Optional[float] = None) -> extensions.connection:
+        """Borrow a connection, waiting up to timeout seconds when the pool is exhausted"""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+
+        while True:
+            with self._lock:
+                self._check_fork()
+                if self._closed:
+                    raise PoolError("connection pool is closed")
+
+                conn, idle_since = None, 0.0
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['checkout_timeouts'] += 1
+                        raise PoolError(f"no connection available within {timeout}s "
+                                        f"(max_size={self.max_size})")
+                    self._stats['checkout_waits'] += 1
+                    self._lock.wait(remaining)
+
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    # Reserve a slot and open the connection outside the lock
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._lock:
+                        self._size -= 1
+                        self._lock.notify()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                # Stale connection, e.g. after a server restart: drop it and reconnect
+                logger.warning("Discarding unhealthy pooled connection")
+                with self._lock:
+                    self._stats['health_check_failures'] += 1
+                    self._discard(conn)
+                continue
+
+            waited = time.monotonic() - started
+            with self._lock:
+                self._in_use[id(conn)] = conn
+                self._stats['checkouts'] += 1
+                self._stats['checkout_wait_seconds'] += waited
+                self._stats['max_checkout_wait_seconds'] = max(self._stats['max_checkout_wait_seconds'], waited)
+                self._stats['peak_in_use'] = max(self._stats['peak_in_use'], len(self._in_use))
+            return conn
+
+    def putconn(self, conn: extensions.connection, close: bool = False):
+        """Return a borrowed connection to the pool"""
+        with self._lock:
+            self._check_fork()
+            if self._in_use.pop(id(conn), None) is None:
+                if any(inherited is conn for inherited in self._inherited):
+                    return
+                raise PoolError("trying to put a connection that was not borrowed from this pool")
+
+            if not close and not conn.closed and not self._closed:
+                try:
+                    # Never hand out a connection with an open or failed transaction
+                    if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                        conn.rollback()
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    close = True
+
+            if close or conn.closed or self._closed or len(self._idle) >= self.max_size:
+                self._discard(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._lock.notify()
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of a with block"""
+        conn = self.getconn()
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def closeall(self):
+        """Close idle connections and refuse further checkouts"""
+        with self._lock:
+            self._check_fork()
+            self._closed = True
+            idle, self._idle = self._idle, []
+            for conn, _ in idle:
+                self._discard(conn)
+            self._lock.notify_all()
+
+    def stats(self) -> Dict:
+        """Pool usage statistics, including how long checkouts waited for a connection"""
+        with self._lock:
+            self._check_fork()
+            stats = {
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                **self._stats
+            }
+        checkouts = stats['checkouts']
+        stats['average_checkout_wait_ms'] = (round(stats['checkout_wait_seconds'] * 1000 / checkouts, 3)
+                                             if checkouts else 0.0)
+        stats['checkout_wait_seconds'] = round(stats['checkout_wait_seconds'], 4)
+        stats['max_checkout_wait_seconds'] = round(stats['max_checkout_wait_seconds'], 4)
+        return stats
+
+    def __repr__(self):
+        return f"ConnectionPool(min_size={self.min_size}, max_size={self.max_size}, size={self._size})"
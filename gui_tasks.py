@@ -0,0 +1,162 @@
+"""
+GUI Background Tasks
+Runs blocking calls off the Tk main thread and hands results back through root.after
+"""
+
+import logging
+import queue
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# How often the main thread checks for finished tasks while any are pending
+POLL_INTERVAL_MS = 50
+
+
+class Ticket:
+    """One submitted call; callbacks run on the Tk main thread"""
+
+    def __init__(self, key: Hashable, func: Callable, args: tuple, kwargs: Dict,
+                 on_success: Optional[Callable[[Any], None]], on_error: Optional[Callable[[BaseException], None]]):
+        self.key = key
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.on_success = on_success
+        self.on_error = on_error
+        self.future: Optional[Future] = None
+        self.stale = False
+
+    def same_call(self, func: Callable, args: tuple, kwargs: Dict) -> bool:
+        try:
+            return bool(self.func == func and self.args == args and self.kwargs == kwargs)
+        except Exception:
+            # Arguments without a plain truth value (e.g. DataFrames) never coalesce
+            return False
+
+    @property
+    def done(self) -> bool:
+        return self.future is not None and self.future.done()
+
+    def cancel(self):
+        """Drop the result; the call itself is skipped if it has not started yet"""
+        self.stale = True
+        if self.future is not None:
+            self.future.cancel()
+
+    def __repr__(self):
+        return f"Ticket({self.key!r}, {getattr(self.func, '__name__', self.func)})"
+
+
+class BackgroundTasks:
+    """Thread pool for GUI work with per-key cancellation and coalescing
+
+    Tasks are grouped by key. Submitting a task with the same key and arguments
+    as one still running coalesces into it, so repeated clicks do one call.
+    Submitting a different call under the same key supersedes the old one: its
+    result is dropped, and it never starts if it was still queued. Use distinct
+    keys for writes that must not be superseded. submit() and every callback
+    run on the Tk main thread.
+    """
+
+    def __init__(self, root, max_workers: int = 4, poll_interval: int = POLL_INTERVAL_MS,
+                 on_busy: Optional[Callable[[int], None]] = None):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.on_busy = on_busy
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='gui-task')
+        self._finished: 'queue.Queue[Ticket]' = queue.Queue()
+        self._latest: Dict[Hashable, Ticket] = {}
+        self._pending: Set[Ticket] = set()
+        self._polling = False
+        self._closed = False
+        self._reported_busy = 0
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def submit(self, key: Hashable, func: Callable, *args, on_success: Optional[Callable[[Any], None]] = None,
+               on_error: Optional[Callable[[BaseException], None]] = None, **kwargs) -> Optional[Ticket]:
+        """Run func(*args, **kwargs) in the background and deliver the outcome to a callback"""
+        if self._closed:
+            return None
+
+        current = self._latest.get(key)
+        if current is not None and not current.stale and not current.done:
+            if current.same_call(func, args, kwargs):
+                current.on_success, current.on_error = on_success, on_error
+                return current
+            current.cancel()
+
+        ticket = Ticket(key, func, args, kwargs, on_success, on_error)
+        self._latest[key] = ticket
+        self._pending.add(ticket)
+        ticket.future = self._executor.submit(func, *args, **kwargs)
+        # Runs on the worker thread (or here, if already finished); the queue hands over to Tk
+        ticket.future.add_done_callback(lambda _: self._finished.put(ticket))
+
+        self._busy_changed()
+        self._schedule_poll()
+        return ticket
+
+    def cancel(self, key: Hashable):
+        """Drop the result of the latest task submitted under key"""
+        ticket = self._latest.pop(key, None)
+        if ticket is not None:
+            ticket.cancel()
+
+    def _schedule_poll(self):
+        if not self._polling and not self._closed:
+            self._polling = True
+            self.root.after(self.poll_interval, self._poll)
+
+    def _poll(self):
+        self._polling = False
+        if self._closed:
+            return
+
+        while True:
+            try:
+                ticket = self._finished.get_nowait()
+            except queue.Empty:
+                break
+            self._deliver(ticket)
+
+        self._busy_changed()
+        if self._pending:
+            self._schedule_poll()
+
+    def _deliver(self, ticket: Ticket):
+        self._pending.discard(ticket)
+        if self._latest.get(ticket.key) is ticket:
+            del self._latest[ticket.key]
+        if ticket.stale or ticket.future.cancelled():
+            return
+
+        error = ticket.future.exception()
+        try:
+            if error is None:
+                if ticket.on_success is not None:
+                    ticket.on_success(ticket.future.result())
+            elif ticket.on_error is not None:
+                ticket.on_error(error)
+            else:
+                logger.error(f"Background task {ticket!r} failed", exc_info=error)
+        except Exception:
+            logger.exception(f"Callback for background task {ticket!r} failed")
+
+    def _busy_changed(self):
+        if self.on_busy is not None and len(self._pending) != self._reported_busy:
+            self._reported_busy = len(self._pending)
+            self.on_busy(self._reported_busy)
+
+    def shutdown(self):
+        """Drop pending results and stop the worker threads (running calls finish on their own)"""
+        self._closed = True
+        for ticket in list(self._pending):
+            ticket.cancel()
+        self._pending.clear()
+        self._latest.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
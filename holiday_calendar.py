@@ -0,0 +1,242 @@
+"""
+Holiday Calendar
+Public holidays and company closures compiled into per-year NumPy day masks
+"""
+
+import calendar
+import csv
+import datetime
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Public holidays are paid like a weekday plus this share of the daily wage
+HOLIDAY_BONUS_RATE = 0.5
+
+PUBLIC_HOLIDAY = 'public'
+COMPANY_CLOSURE = 'closure'
+HOLIDAY_KINDS = (PUBLIC_HOLIDAY, COMPANY_CLOSURE)
+
+DEFAULT_CALENDAR_FILE = 'holidays.csv'
+
+# Compiled years kept per calendar
+DEFAULT_CACHE_SIZE = 8
+
+HOLIDAYS_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS holidays (
+        date DATE PRIMARY KEY,
+        name VARCHAR(255) NOT NULL,
+        kind VARCHAR(20) NOT NULL DEFAULT 'public' CHECK (kind IN ('public', 'closure'))
+    )
+"""
+
+
+class Holiday(NamedTuple):
+    date: datetime.date
+    name: str
+    kind: str = PUBLIC_HOLIDAY
+
+
+class CompiledYear:
+    """Day masks and precomputed labels for every day of one year, indexed by day of year"""
+
+    def __init__(self, year: int, holidays: Dict[datetime.date, Holiday]):
+        self.year = year
+        first = datetime.date(year, 1, 1)
+        self.first_ordinal = first.toordinal()
+        num_days = 366 if calendar.isleap(year) else 365
+
+        self.dates = [first + datetime.timedelta(days=offset) for offset in range(num_days)]
+        self.date_strs = [day.isoformat() for day in self.dates]
+        self.day_names = [calendar.day_name[day.weekday()] for day in self.dates]
+
+        weekday = (first.weekday() + np.arange(num_days)) % 7
+        self.is_weekend = weekday >= 5
+        self.is_holiday = np.zeros(num_days, dtype=bool)
+        self.is_closure = np.zeros(num_days, dtype=bool)
+        self.holiday_names: Dict[int, str] = {}
+
+        for day, holiday in holidays.items():
+            if day.year != year:
+                continue
+            index = day.toordinal() - self.first_ordinal
+            self.holiday_names[index] = holiday.name
+            if holiday.kind == COMPANY_CLOSURE:
+                self.is_closure[index] = True
+            else:
+                self.is_holiday[index] = True
+
+        self.day_types = np.where(self.is_holiday, 'Holiday',
+                                  np.where(self.is_weekend, 'Weekend', 'Weekday'))
+
+        month_lengths = [calendar.monthrange(year, month)[1] for month in range(1, 13)]
+        self._month_starts = np.concatenate(([0], np.cumsum(month_lengths)))
+
+    def index(self, day: datetime.date) -> int:
+        return day.toordinal() - self.first_ordinal
+
+    def month_slice(self, month: int) -> slice:
+        return slice(int(self._month_starts[month - 1]), int(self._month_starts[month]))
+
+    def working_indices(self, month: int, include_weekends: bool = False) -> np.ndarray:
+        """Day-of-year indices worked in a month: closures never, weekends only when included"""
+        days = self.month_slice(month)
+        worked = ~self.is_closure[days]
+        if not include_weekends:
+            worked &= ~self.is_weekend[days]
+        return np.flatnonzero(worked) + days.start
+
+
+class HolidayCalendar:
+    """Holiday and closure dates with an LRU cache of compiled years"""
+
+    def __init__(self, holidays: Iterable[Holiday] = (), cache_size: int = DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._holidays: Dict[datetime.date, Holiday] = {}
+        self._compiled: 'OrderedDict[int, CompiledYear]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self.update(holidays)
+
+    def update(self, holidays: Iterable[Holiday]):
+        """Add or replace entries (later entries win) and drop compiled years they affect"""
+        with self._lock:
+            for holiday in holidays:
+                if holiday.kind not in HOLIDAY_KINDS:
+                    raise ValueError(f"Unknown holiday kind {holiday.kind!r} for {holiday.date}")
+                self._holidays[holiday.date] = holiday
+                self._compiled.pop(holiday.date.year, None)
+
+    def year(self, year: int) -> CompiledYear:
+        """Compiled masks for a year, built on first use"""
+        with self._lock:
+            compiled = self._compiled.get(year)
+            if compiled is not None:
+                self._compiled.move_to_end(year)
+                self._hits += 1
+                return compiled
+
+            self._misses += 1
+            compiled = CompiledYear(year, self._holidays)
+            self._compiled[year] = compiled
+            while len(self._compiled) > self.cache_size:
+                self._compiled.popitem(last=False)
+            return compiled
+
+    def day_type(self, day: datetime.date) -> str:
+        """'Weekday', 'Weekend' or 'Holiday' (closures keep their weekday/weekend type)"""
+        compiled = self.year(day.year)
+        return str(compiled.day_types[compiled.index(day)])
+
+    def is_holiday(self, day: datetime.date) -> bool:
+        compiled = self.year(day.year)
+        return bool(compiled.is_holiday[compiled.index(day)])
+
+    def is_closure(self, day: datetime.date) -> bool:
+        compiled = self.year(day.year)
+        return bool(compiled.is_closure[compiled.index(day)])
+
+    def holiday_name(self, day: datetime.date) -> Optional[str]:
+        compiled = self.year(day.year)
+        return compiled.holiday_names.get(compiled.index(day))
+
+    def working_days(self, year: int, month: int, include_weekends: bool = False
+                     ) -> Tuple[List[datetime.date], np.ndarray, np.ndarray, np.ndarray]:
+        """Worked dates of a month with their day types, weekend mask and holiday mask"""
+        compiled = self.year(year)
+        indices = compiled.working_indices(month, include_weekends)
+        dates = [compiled.dates[index] for index in indices]
+        return dates, compiled.day_types[indices], compiled.is_weekend[indices], compiled.is_holiday[indices]
+
+    def working_dates(self, year: int, month: int, include_weekends: bool = False) -> List[Dict]:
+        """Worked dates of a month in the get_working_dates format"""
+        compiled = self.year(year)
+        working_dates = []
+        for index in compiled.working_indices(month, include_weekends).tolist():
+            working_dates.append({
+                'date': compiled.dates[index],
+                'date_str': compiled.date_strs[index],
+                'day_name': compiled.day_names[index],
+                'day_type': str(compiled.day_types[index]),
+                'is_weekend': bool(compiled.is_weekend[index]),
+                'is_holiday': bool(compiled.is_holiday[index])
+            })
+        return working_dates
+
+    def holidays(self, year: Optional[int] = None) -> List[Holiday]:
+        """Entries, oldest first, optionally for one year"""
+        with self._lock:
+            entries = list(self._holidays.values())
+        if year is not None:
+            entries = [holiday for holiday in entries if holiday.date.year == year]
+        return sorted(entries)
+
+    def cache_info(self) -> Dict[str, int]:
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses,
+                    'size': len(self._compiled), 'max_size': self.cache_size}
+
+    def __len__(self) -> int:
+        return len(self._holidays)
+
+
+def _parse_holiday(date_value, name, kind=None) -> Holiday:
+    if isinstance(date_value, datetime.datetime):
+        date_value = date_value.date()
+    elif not isinstance(date_value, datetime.date):
+        date_value = datetime.date.fromisoformat(str(date_value).strip())
+    kind = (kind or PUBLIC_HOLIDAY).strip().lower()
+    return Holiday(date_value, str(name or '').strip(), kind)
+
+
+def load_holiday_file(path: str) -> List[Holiday]:
+    """Read holidays from a CSV (date,name,kind) or JSON list of {date, name, kind} objects"""
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith('.json'):
+            return [_parse_holiday(item['date'], item.get('name'), item.get('kind'))
+                    for item in json.load(f)]
+
+        lines = (line for line in f if line.strip() and not line.lstrip().startswith('#'))
+        return [_parse_holiday(row['date'], row.get('name'), row.get('kind'))
+                for row in csv.DictReader(lines)]
+
+
+def load_holiday_table(cursor) -> List[Holiday]:
+    """Read holidays from the holidays table (PostgreSQL or SQLite cursor)"""
+    cursor.execute("SELECT date, name, kind FROM holidays ORDER BY date")
+    return [_parse_holiday(*row) for row in cursor.fetchall()]
+
+
+def calendar_file_path(base_dir: Optional[str] = None) -> Optional[str]:
+    """HOLIDAY_CALENDAR_FILE, or holidays.csv next to the application when present"""
+    path = os.getenv('HOLIDAY_CALENDAR_FILE')
+    if path:
+        return path
+    path = os.path.join(base_dir or os.path.dirname(os.path.abspath(__file__)), DEFAULT_CALENDAR_FILE)
+    return path if os.path.exists(path) else None
+
+
+def load_calendar(cursor=None, path: Optional[str] = None) -> HolidayCalendar:
+    """Build a calendar from the holiday file, then the holidays table (table entries win)"""
+    holidays_calendar = HolidayCalendar()
+
+    path = path or calendar_file_path()
+    if path:
+        try:
+            holidays_calendar.update(load_holiday_file(path))
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Could not load holiday calendar {path}: {e}")
+
+    if cursor is not None:
+        holidays_calendar.update(load_holiday_table(cursor))
+
+    return holidays_calendar
+
@@ -0,0 +1,177 @@
+"""
+HTTP Client
+Shared, pooled requests.Session with retries, timeouts and connection reuse metrics
+"""
+
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+# Responses worth retrying: rate limiting and transient upstream failures
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HttpClientConfig:
+    """HTTP connection pool, timeout and retry settings"""
+
+    def __init__(self):
+        # Distinct hosts kept in the pool, and keep-alive connections per host
+        self.pool_connections = int(os.getenv('HTTP_POOL_CONNECTIONS', '4'))
+        self.pool_maxsize = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+        self.connect_timeout = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))
+        self.read_timeout = float(os.getenv('HTTP_READ_TIMEOUT', os.getenv('CRM_TIMEOUT', '30')))
+        self.retries = int(os.getenv('HTTP_RETRIES', '3'))
+        self.backoff_factor = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.5'))
+        # POST is only retried when this is set, or when the request never reached the server
+        self.retry_post = os.getenv('HTTP_RETRY_POST', 'false').lower() == 'true'
+
+    @property
+    def timeout(self) -> Tuple[float, float]:
+        return (self.connect_timeout, self.read_timeout)
+
+    def retry_policy(self) -> Retry:
+        allowed_methods = set(Retry.DEFAULT_ALLOWED_METHODS)
+        if self.retry_post:
+            allowed_methods.add('POST')
+        return Retry(
+            total=self.retries,
+            connect=self.retries,
+            read=self.retries,
+            status=self.retries,
+            backoff_factor=self.backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=frozenset(allowed_methods),
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+
+
+class HttpClient:
+    """A requests.Session bound to one base URL, with pooled keep-alive connections
+
+    Safe to share between threads. Paths are joined to base_url; absolute URLs
+    are used as given. Every call gets the configured (connect, read) timeout
+    unless one is passed.
+    """
+
+    def __init__(self, base_url: str = '', config: Optional[HttpClientConfig] = None,
+                 headers: Optional[Dict[str, str]] = None):
+        self.base_url = base_url.rstrip('/')
+        self.config = config or HttpClientConfig()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.config.pool_connections,
+            pool_maxsize=self.config.pool_maxsize,
+            max_retries=self.config.retry_policy()
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self._adapter = adapter
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'retries': 0,
+            'total_seconds': 0.0
+        }
+
+    def url(self, path: str) -> str:
+        if path.startswith(('http://', 'https://')):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def request(self, method: str, path: str,
+                timeout: Union[None, float, Tuple[float, float]] = None, **kwargs) -> requests.Response:
+        """Send a request through the pooled session"""
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url(path), timeout=timeout or self.config.timeout, **kwargs)
+        except requests.RequestException:
+            self._record(started, error=True)
+            raise
+
+        retries = getattr(getattr(response.raw, 'retries', None), 'history', ())
+        self._record(started, retries=len(retries))
+        return response
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request('PUT', path, **kwargs)
+
+    def _record(self, started: float, error: bool = False, retries: int = 0):
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['errors'] += int(error)
+            self._stats['retries'] += retries
+            self._stats['total_seconds'] += time.perf_counter() - started
+
+    def metrics(self) -> Dict:
+        """Request counts plus how many requests reused a pooled connection"""
+        connections = 0
+        pooled_requests = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                connections += pool.num_connections
+                pooled_requests += pool.num_requests
+
+        with self._lock:
+            stats = dict(self._stats)
+        stats['connections_opened'] = connections
+        stats['connections_reused'] = max(0, pooled_requests - connections)
+        stats['reuse_ratio'] = round(stats['connections_reused'] / pooled_requests, 3) if pooled_requests else 0.0
+        stats['average_seconds'] = (round(stats['total_seconds'] / stats['requests'], 4)
+                                    if stats['requests'] else 0.0)
+        stats['total_seconds'] = round(stats['total_seconds'], 3)
+        return stats
+
+    def close(self):
+        self.session.close()
+
+    def __repr__(self):
+        return f"HttpClient({self.base_url!r})"
+
+
+_clients: Dict[str, HttpClient] = {}
+_clients_pid: Optional[int] = None
+_clients_lock = threading.Lock()
+
+
+def get_http_client(base_url: str, config: Optional[HttpClientConfig] = None) -> HttpClient:
+    """The shared client for base_url in this process (forked workers get their own)"""
+    global _clients_pid
+    base_url = base_url.rstrip('/')
+    with _clients_lock:
+        if _clients_pid != os.getpid():
+            # Connections inherited across fork must not be shared with the parent
+            _clients.clear()
+            _clients_pid = os.getpid()
+        client = _clients.get(base_url)
+        if client is None:
+            client = _clients[base_url] = HttpClient(base_url, config)
+        return client
+
+
+def http_metrics() -> Dict[str, Dict]:
+    """Metrics for every shared client in this process, by base URL"""
+    with _clients_lock:
+        clients = dict(_clients) if _clients_pid == os.getpid() else {}
+    return {base_url: client.metrics() for base_url, client in clients.items()}
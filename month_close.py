@@ -0,0 +1,217 @@
+"""
+Month Close
+Checkpointed month-end stages (payroll, summaries, reports, CRM sync, verified backup) for the month_close workflow
+"""
+
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import time
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+from psycopg2.extras import Json
+
+from db_config import DatabaseConfig
+from holiday_calendar import load_calendar
+from payroll_engine import calculate_payroll_batch
+from payroll_runner import PROFILE_COLUMNS
+from payroll_summary import monthly_payroll_total, rebuild_monthly_summaries, summary_drift
+from period_queries import Period
+from salary_store import bulk_upsert_salary_records
+
+logger = logging.getLogger(__name__)
+
+CLOSE_TABLE = 'month_close_stages'
+
+# Stages, in dependency order; reports, CRM sync and backup run side by side
+PAYROLL = 'payroll'
+SUMMARIES = 'summaries'
+REPORTS = ('report:artifacts', 'report:detailed')
+CRM = 'crm'
+BACKUP = 'backup'
+CLOSED = 'closed'
+
+# Employees calculated and saved per payroll task
+CLOSE_SHARD_EMPLOYEES = int(os.getenv('MONTH_CLOSE_SHARD_EMPLOYEES', '500'))
+
+BACKUP_DIR = os.getenv('BACKUP_DIR', '/app/backups')
+
+# Tables a month-close backup must contain data for (partitions count for salary_records)
+BACKUP_TABLES = ('labor_profiles', 'salary_records', 'payroll_monthly_summary')
+
+_CLOSE_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {CLOSE_TABLE} (
+        year SMALLINT NOT NULL,
+        month SMALLINT NOT NULL,
+        stage VARCHAR(64) NOT NULL,
+        result JSONB NOT NULL DEFAULT '{{}}',
+        seconds NUMERIC,
+        finished_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (year, month, stage)
+    )
+"""
+
+
+def ensure_close_schema(cursor):
+    cursor.execute(_CLOSE_DDL)
+
+
+def get_checkpoint(cursor, year: int, month: int, stage: str) -> Optional[Dict]:
+    """Saved result of a finished stage, or None"""
+    cursor.execute(f"SELECT result FROM {CLOSE_TABLE} WHERE year = %s AND month = %s AND stage = %s",
+                   (year, month, stage))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def save_checkpoint(cursor, year: int, month: int, stage: str, result: Dict, seconds: Optional[float] = None):
+    cursor.execute(f"""
+        INSERT INTO {CLOSE_TABLE} (year, month, stage, result, seconds) VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (year, month, stage) DO UPDATE SET
+            result = EXCLUDED.result, seconds = EXCLUDED.seconds, finished_at = now()
+    """, (year, month, stage, Json(result, dumps=lambda value: json.dumps(value, default=str)),
+          None if seconds is None else round(seconds, 3)))
+
+
+def completed_stages(cursor, year: int, month: int) -> Dict[str, Dict]:
+    """Every finished stage of a month's close, with its saved result"""
+    cursor.execute(f"SELECT stage, result FROM {CLOSE_TABLE} WHERE year = %s AND month = %s", (year, month))
+    return dict(cursor.fetchall())
+
+
+def clear_checkpoints(cursor, year: int, month: int) -> int:
+    """Forget a month's close so every stage runs again"""
+    cursor.execute(f"DELETE FROM {CLOSE_TABLE} WHERE year = %s AND month = %s", (year, month))
+    return cursor.rowcount
+
+
+def close_status(cursor, year: int, month: int) -> List[Dict]:
+    """Finished stages of a month's close in the order they finished"""
+    cursor.execute(f"""
+        SELECT stage, seconds, finished_at, result
+        FROM {CLOSE_TABLE} WHERE year = %s AND month = %s
+        ORDER BY finished_at
+    """, (year, month))
+    columns = ('stage', 'seconds', 'finished_at', 'result')
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+
+def run_checkpointed(conn, year: int, month: int, stage: str, func: Callable,
+                     valid: Optional[Callable[[Dict], bool]] = None) -> Dict:
+    """Run func(conn) for a stage unless it already finished, then record its result
+
+    The checkpoint commits in the same transaction as func's uncommitted
+    writes. A session advisory lock keeps two runs of the same stage from
+    overlapping; the second waits, then returns the first one's result.
+    valid(saved) can reject a checkpoint whose output has gone (e.g. a
+    deleted file). Effects outside the database (files, CRM posts) must be
+    safe to repeat.
+    """
+    key = f"{year}-{month:02d}:{stage}"
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(hashtext(%s), hashtext(%s))", (CLOSE_TABLE, key))
+        try:
+            saved = get_checkpoint(cursor, year, month, stage)
+            conn.rollback()
+            if saved is not None and (valid is None or valid(saved)):
+                logger.info(f"Month close {key} already done, skipping")
+                return saved
+
+            started = time.perf_counter()
+            result = func(conn)
+            save_checkpoint(cursor, year, month, stage, result, time.perf_counter() - started)
+            conn.commit()
+            logger.info(f"Month close {key} done in {time.perf_counter() - started:.1f}s")
+            return result
+        finally:
+            conn.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(hashtext(%s), hashtext(%s))", (CLOSE_TABLE, key))
+            conn.commit()
+
+
+def profile_shards(cursor, shard_size: int = CLOSE_SHARD_EMPLOYEES) -> List[Dict]:
+    """Split labor_profiles into contiguous name ranges of shard_size employees"""
+    cursor.execute("SELECT name FROM labor_profiles ORDER BY name")
+    names = [row[0] for row in cursor.fetchall()]
+    return [{'shard': index, 'first': chunk[0], 'last': chunk[-1], 'employees': len(chunk)}
+            for index, chunk in enumerate(names[start:start + shard_size]
+                                          for start in range(0, len(names), shard_size))]
+
+
+def shard_stage(shard: Dict) -> str:
+    """Checkpoint name of one payroll shard, stable for the same name range"""
+    names = hashlib.md5(f"{shard['first']}|{shard['last']}".encode()).hexdigest()[:12]
+    return f"{PAYROLL}:{names}"
+
+
+def calculate_shard(conn, year: int, month: int, shard: Dict, **options) -> Dict:
+    """Calculate one name range's payroll and bulk-save it (and its summaries); the caller commits"""
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {', '.join(PROFILE_COLUMNS)} FROM labor_profiles
+            WHERE name BETWEEN %s AND %s ORDER BY name
+        """, (shard['first'], shard['last']))
+        profiles = pd.DataFrame(cursor.fetchall(), columns=PROFILE_COLUMNS).astype(
+            {'base_daily_wage': float, 'overtime_rate': float}
+        )
+        holidays = load_calendar(cursor)
+
+    batch = calculate_payroll_batch(year, month, profiles, holidays=holidays, **options)
+    saved = bulk_upsert_salary_records(conn, batch)
+    return {'shard': shard['shard'], 'employees': len(batch),
+            'total_salary': float(batch.totals['total_salary'].sum()), **saved}
+
+
+def materialize_summaries(cursor, year: int, month: int) -> Dict:
+    """Rebuild the month's payroll_monthly_summary rows and check them against the daily rows"""
+    summaries = rebuild_monthly_summaries(cursor, Period.month(year, month))
+    drift = summary_drift(cursor, year, month)
+    if any(drift.values()):
+        raise RuntimeError(f"Summaries for {year}-{month:02d} disagree with salary_records: {drift}")
+    return {'summaries': summaries, 'total_salary': monthly_payroll_total(cursor, year, month)}
+
+
+def _run(command: List[str], config: DatabaseConfig) -> subprocess.CompletedProcess:
+    result = subprocess.run(command, capture_output=True, text=True,
+                            env={**os.environ, 'PGPASSWORD': config.password or ''})
+    if result.returncode != 0:
+        raise RuntimeError(f"{command[0]} failed: {result.stderr.strip()}")
+    return result
+
+
+def verified_backup(config: DatabaseConfig, path: str) -> Dict:
+    """pg_dump the database into path (custom format) and check the archive before keeping it
+
+    The dump is listed with pg_restore, which reads the whole table of
+    contents, and must carry data for every table in BACKUP_TABLES. Only
+    then is it renamed into place, so path is always a readable backup.
+    """
+    partial_path = f"{path}.part"
+    try:
+        _run(['pg_dump', '-h', config.host, '-p', str(config.port), '-U', config.user,
+              '-d', config.database, '-Fc', '-f', partial_path], config)
+        listing = _run(['pg_restore', '--list', partial_path], config).stdout.splitlines()
+
+        # e.g. "4111; 0 16472 TABLE DATA public labor_profiles postgres"
+        tables = [line.split()[-2] for line in listing if ' TABLE DATA ' in line]
+        missing = [table for table in BACKUP_TABLES
+                   if not any(name == table or name.startswith(f"{table}_") for name in tables)]
+        if missing:
+            raise RuntimeError(f"Backup {path} has no data for {', '.join(missing)}")
+
+        digest = hashlib.sha256()
+        with open(partial_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    logger.info(f"Verified backup {path}: {len(listing)} entries, {len(tables)} tables with data")
+    return {'path': path, 'bytes': os.path.getsize(path), 'sha256': digest.hexdigest(),
+            'entries': len(listing), 'tables': len(tables)}
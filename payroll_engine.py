@@ -0,0 +1,397 @@
+"""
+Vectorized Payroll Engine
+Calculates monthly salaries for a whole roster at once using NumPy arrays
+"""
+
+import calendar
+import datetime
+from collections.abc import Sequence
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from holiday_calendar import HOLIDAY_BONUS_RATE, CompiledYear, HolidayCalendar
+
+# Share of the daily wage added for working a weekend day
+WEEKEND_BONUS_RATE = 0.5
+
+# Column order used when writing rows into salary_records
+SALARY_RECORD_COLUMNS = (
+    'labor_name', 'date', 'day_type', 'daily_wage', 'hours_worked', 'regular_hours',
+    'overtime_hours', 'overtime_rate', 'weekend_bonus', 'holiday_bonus',
+    'other_allowances', 'deductions', 'total_salary'
+)
+
+# Columns returned by the summary report
+SUMMARY_REPORT_COLUMNS = (
+    'labor_name', 'working_days', 'total_regular_hours', 'total_overtime_hours',
+    'total_regular_pay', 'total_overtime_pay', 'total_weekend_bonus', 'total_holiday_bonus',
+    'total_allowances', 'total_deductions', 'total_salary'
+)
+
+
+class DailySalaries(Sequence):
+    """Per-day breakdown of one employee's month, built only when first accessed"""
+
+    def __init__(self, labor_name: str, compiled: CompiledYear, indices: np.ndarray, daily_wage: float,
+                 hours_per_day: float = 8, overtime_per_day: float = 0, overtime_rate: float = 1.5,
+                 other_allowances: float = 0, deductions: float = 0):
+        self.labor_name = labor_name
+        self._compiled = compiled
+        self._indices = indices
+        self._rates = (daily_wage, hours_per_day, overtime_per_day, overtime_rate, other_allowances, deductions)
+        self._rows: Optional[List[Dict]] = None
+
+    def _build(self) -> List[Dict]:
+        daily_wage, hours_per_day, overtime_per_day, overtime_rate, other_allowances, deductions = self._rates
+        compiled = self._compiled
+
+        # Same for every day: regular pay is the full day wage
+        regular_pay = daily_wage
+        overtime_pay = overtime_per_day * (daily_wage / 8) * overtime_rate
+
+        rows = []
+        for index in self._indices.tolist():
+            is_holiday = bool(compiled.is_holiday[index])
+            is_weekend = bool(compiled.is_weekend[index])
+            weekend_bonus = daily_wage * WEEKEND_BONUS_RATE if is_weekend and not is_holiday else 0
+            holiday_bonus = daily_wage * HOLIDAY_BONUS_RATE if is_holiday else 0
+
+            rows.append({
+                'labor_name': self.labor_name,
+                'date': compiled.dates[index],
+                'date_str': compiled.date_strs[index],
+                'day_type': str(compiled.day_types[index]),
+                'day_name': compiled.day_names[index],
+                'daily_wage': daily_wage,
+                'hours_worked': hours_per_day,
+                'regular_hours': min(hours_per_day, 8),
+                'overtime_hours': max(hours_per_day - 8, 0) + overtime_per_day,
+                'overtime_rate': overtime_rate,
+                'regular_pay': regular_pay,
+                'overtime_pay': overtime_pay,
+                'weekend_bonus': weekend_bonus,
+                'holiday_bonus': holiday_bonus,
+                'other_allowances': other_allowances,
+                'deductions': deductions,
+                'total_salary': regular_pay + overtime_pay + weekend_bonus + holiday_bonus + other_allowances - deductions
+            })
+        return rows
+
+    @property
+    def materialized(self) -> bool:
+        return self._rows is not None
+
+    def _all(self) -> List[Dict]:
+        if self._rows is None:
+            self._rows = self._build()
+        return self._rows
+
+    def __getitem__(self, index):
+        return self._all()[index]
+
+    def __iter__(self):
+        return iter(self._all())
+
+    def __len__(self) -> int:
+        return len(self._indices)
+
+    def __repr__(self):
+        state = 'materialized' if self.materialized else 'lazy'
+        return f"DailySalaries({self.labor_name!r}, days={len(self)}, {state})"
+
+
+class PayrollBatch:
+    """Columnar payroll results for a roster (employees x working days)"""
+
+    def __init__(self, year: int, month: int, labor_names: List[str], dates: List[datetime.date],
+                 day_types: np.ndarray, daily: Dict[str, np.ndarray], totals: Dict[str, np.ndarray]):
+        self.year = year
+        self.month = month
+        self.month_name = calendar.month_name[month]
+        self.labor_names = labor_names
+        self.dates = dates
+        self.date_strs = [d.strftime('%Y-%m-%d') for d in dates]
+        self.day_names = [d.strftime('%A') for d in dates]
+        self.day_types = day_types
+        # Per-day columns, each shaped (employees, days)
+        self.daily = daily
+        # Monthly totals, each shaped (employees,)
+        self.totals = totals
+
+    def __len__(self) -> int:
+        return len(self.labor_names)
+
+    @property
+    def total_working_days(self) -> int:
+        return len(self.dates)
+
+    def day_type_summary(self) -> Dict[str, int]:
+        """Count working days per day type"""
+        day_types, counts = np.unique(self.day_types, return_counts=True)
+        return {str(day_type): int(count) for day_type, count in zip(day_types, counts)}
+
+    def monthly_data(self, index: int) -> Dict:
+        """Build the calculate_monthly_salary result for one employee"""
+        labor_name = self.labor_names[index]
+        columns = {name: values[index].tolist() for name, values in self.daily.items()}
+
+        daily_salaries = []
+        for day in range(self.total_working_days):
+            daily_salaries.append({
+                'labor_name': labor_name,
+                'date': self.dates[day],
+                'date_str': self.date_strs[day],
+                'day_type': str(self.day_types[day]),
+                'day_name': self.day_names[day],
+                'daily_wage': columns['daily_wage'][day],
+                'hours_worked': columns['hours_worked'][day],
+                'regular_hours': columns['regular_hours'][day],
+                'overtime_hours': columns['overtime_hours'][day],
+                'overtime_rate': columns['overtime_rate'][day],
+                'regular_pay': columns['regular_pay'][day],
+                'overtime_pay': columns['overtime_pay'][day],
+                'weekend_bonus': columns['weekend_bonus'][day],
+                'holiday_bonus': columns['holiday_bonus'][day],
+                'other_allowances': columns['other_allowances'][day],
+                'deductions': columns['deductions'][day],
+                'total_salary': columns['total_salary'][day]
+            })
+
+        return {
+            'labor_name': labor_name,
+            'year': self.year,
+            'month': self.month,
+            'month_name': self.month_name,
+            'total_working_days': self.total_working_days,
+            'day_type_summary': self.day_type_summary(),
+            'daily_salaries': daily_salaries,
+            'summary': {name: float(values[index]) for name, values in self.totals.items()}
+        }
+
+    def iter_salary_rows(self) -> Iterator[Tuple]:
+        """Yield salary_records rows (see SALARY_RECORD_COLUMNS), employee by employee"""
+        day_types = [str(day_type) for day_type in self.day_types]
+        columns = [self.daily[name].tolist() for name in SALARY_RECORD_COLUMNS[3:]]
+
+        for index, labor_name in enumerate(self.labor_names):
+            employee_columns = [column[index] for column in columns]
+            for day in range(self.total_working_days):
+                yield (labor_name, self.date_strs[day], day_types[day],
+                       *(column[day] for column in employee_columns))
+
+    def summary_frame(self) -> pd.DataFrame:
+        """Monthly totals in the same layout as generate_summary_report"""
+        days = self.total_working_days
+        df = pd.DataFrame({
+            'labor_name': self.labor_names,
+            'working_days': np.full(len(self), days, dtype=np.int64),
+            'total_regular_hours': self.daily['regular_hours'].sum(axis=1),
+            'total_overtime_hours': self.daily['overtime_hours'].sum(axis=1),
+            'total_regular_pay': self.totals['total_regular_pay'],
+            'total_overtime_pay': self.totals['total_overtime_pay'],
+            'total_weekend_bonus': self.totals['total_weekend_bonus'],
+            'total_holiday_bonus': self.totals['total_holiday_bonus'],
+            'total_allowances': self.totals['total_allowances'],
+            'total_deductions': self.totals['total_deductions'],
+            'total_salary': self.totals['total_salary']
+        }, columns=list(SUMMARY_REPORT_COLUMNS))
+        return df.sort_values('total_salary', ascending=False, kind='stable').reset_index(drop=True)
+
+    def detail_frame(self) -> pd.DataFrame:
+        """Daily rows in the same layout as generate_detailed_report (ordered by date)"""
+        employees, days = len(self), self.total_working_days
+        data = {
+            'labor_name': np.tile(np.asarray(self.labor_names, dtype=object), days),
+            'date': np.repeat(np.asarray(self.dates, dtype=object), employees),
+            'day_type': np.repeat(self.day_types, employees)
+        }
+        for name in SALARY_RECORD_COLUMNS[3:]:
+            # Transpose so rows come out date-major, like the report query
+            data[name] = np.ascontiguousarray(self.daily[name].T).reshape(-1)
+        return pd.DataFrame(data, columns=list(SALARY_RECORD_COLUMNS))
+
+
+def _profile_column(profiles: pd.DataFrame, name: str, default) -> np.ndarray:
+    """Per-employee values from a profile column, falling back to a scalar/array default"""
+    if name in profiles.columns:
+        return profiles[name].fillna(default).to_numpy(dtype=np.float64)
+    return np.broadcast_to(np.asarray(default, dtype=np.float64), (len(profiles),)).copy()
+
+
+def working_days(year: int, month: int, include_weekends: bool = False,
+                 holidays: Optional[HolidayCalendar] = None
+                 ) -> Tuple[List[datetime.date], np.ndarray, np.ndarray, np.ndarray]:
+    """Working dates of a month with their day types, weekend mask and holiday mask"""
+    return (holidays or HolidayCalendar()).working_days(year, month, include_weekends)
+
+
+def day_type_counts(compiled: CompiledYear, indices: np.ndarray) -> Dict[str, int]:
+    """Worked days per day type, e.g. {'Weekday': 20, 'Holiday': 1}"""
+    is_holiday = compiled.is_holiday[indices]
+    holidays = int(np.count_nonzero(is_holiday))
+    weekends = int(np.count_nonzero(compiled.is_weekend[indices] & ~is_holiday))
+    counts = {'Weekday': len(indices) - holidays - weekends, 'Weekend': weekends, 'Holiday': holidays}
+    return {day_type: count for day_type, count in counts.items() if count}
+
+
+def _cents(amount):
+    """Round money to cents, halves away from zero as NUMERIC(10,2) does; scalars stay Python floats"""
+    # Settle float noise in the cent count first, so x.xx5 rounds the same however it was summed
+    cents = np.round(np.asarray(amount, dtype=np.float64) * 100, 4)
+    rounded = np.sign(cents) * np.floor(np.abs(cents) + 0.5) / 100
+    return rounded if isinstance(amount, np.ndarray) else float(rounded)
+
+
+def monthly_totals(daily_wage, day_counts: Dict[str, int], overtime_per_day=0, overtime_rate=1.5,
+                   other_allowances=0, deductions=0) -> Dict:
+    """Closed-form monthly summary from day-type counts (scalars or per-employee arrays)
+
+    Totals are rounded to cents: the closed form and a sum of the daily rows
+    can differ in the last floating-point digits, but not once rounded.
+    """
+    days = sum(day_counts.values())
+    overtime_pay = overtime_per_day * (daily_wage / 8) * overtime_rate
+
+    total_regular_pay = daily_wage * days
+    total_overtime_pay = overtime_pay * days
+    total_weekend_bonus = daily_wage * WEEKEND_BONUS_RATE * day_counts.get('Weekend', 0)
+    total_holiday_bonus = daily_wage * HOLIDAY_BONUS_RATE * day_counts.get('Holiday', 0)
+    total_allowances = other_allowances * days
+    total_deductions = deductions * days
+
+    return {
+        'total_regular_pay': _cents(total_regular_pay),
+        'total_overtime_pay': _cents(total_overtime_pay),
+        'total_weekend_bonus': _cents(total_weekend_bonus),
+        'total_holiday_bonus': _cents(total_holiday_bonus),
+        'total_allowances': _cents(total_allowances),
+        'total_deductions': _cents(total_deductions),
+        'total_salary': _cents(total_regular_pay + total_overtime_pay + total_weekend_bonus +
+                               total_holiday_bonus + total_allowances - total_deductions)
+    }
+
+
+def calculate_monthly_salary(labor_name: str, daily_wage: float, year: int, month: int,
+                             hours_per_day: float = 8, overtime_per_day: float = 0,
+                             overtime_rate: float = 1.5, include_weekends: bool = False,
+                             other_allowances: float = 0, deductions: float = 0,
+                             holidays: Optional[HolidayCalendar] = None,
+                             summary_only: bool = False) -> Dict:
+    """One employee's month: closed-form totals plus a lazy daily breakdown
+
+    With summary_only the result has no 'daily_salaries' at all, for callers
+    that only need totals (dashboards, what-if checks, certificates).
+    """
+    compiled = (holidays or HolidayCalendar()).year(year)
+    indices = compiled.working_indices(month, include_weekends)
+    counts = day_type_counts(compiled, indices)
+
+    result = {
+        'labor_name': labor_name,
+        'year': year,
+        'month': month,
+        'month_name': calendar.month_name[month],
+        'total_working_days': len(indices),
+        'day_type_summary': counts,
+        'summary': monthly_totals(daily_wage, counts, overtime_per_day, overtime_rate,
+                                  other_allowances, deductions)
+    }
+    if not summary_only:
+        result['daily_salaries'] = DailySalaries(labor_name, compiled, indices, daily_wage, hours_per_day,
+                                                 overtime_per_day, overtime_rate, other_allowances, deductions)
+    return result
+
+
+def calculate_payroll_batch(year: int, month: int, profiles: Union[pd.DataFrame, List[Dict]],
+                            hours_per_day: float = 8, overtime_per_day: float = 0,
+                            include_weekends: bool = False, other_allowances: float = 0,
+                            deductions: float = 0, holidays: Optional[HolidayCalendar] = None) -> PayrollBatch:
+    """Calculate monthly salaries for every profile at once
+
+    profiles needs 'name', 'base_daily_wage' and 'overtime_rate'. Optional
+    per-employee columns ('daily_wage', 'hours_per_day', 'overtime_per_day',
+    'other_allowances', 'deductions') override the keyword defaults.
+    """
+    if not isinstance(profiles, pd.DataFrame):
+        profiles = pd.DataFrame(list(profiles))
+
+    labor_names = profiles['name'].astype(str).tolist() if len(profiles) else []
+    wage = _profile_column(profiles, 'base_daily_wage', 0)
+    if 'daily_wage' in profiles.columns:
+        custom_wage = profiles['daily_wage'].to_numpy(dtype=np.float64)
+        wage = np.where(np.isnan(custom_wage), wage, custom_wage)
+    overtime_rate = _profile_column(profiles, 'overtime_rate', 1.5)
+    hours = _profile_column(profiles, 'hours_per_day', hours_per_day)
+    overtime = _profile_column(profiles, 'overtime_per_day', overtime_per_day)
+    allowances = _profile_column(profiles, 'other_allowances', other_allowances)
+    deduction = _profile_column(profiles, 'deductions', deductions)
+
+    compiled = (holidays or HolidayCalendar()).year(year)
+    indices = compiled.working_indices(month, include_weekends)
+    dates = [compiled.dates[index] for index in indices]
+    day_types = compiled.day_types[indices]
+    is_weekend, is_holiday = compiled.is_weekend[indices], compiled.is_holiday[indices]
+    shape = (len(labor_names), len(dates))
+
+    def per_employee(values: np.ndarray) -> np.ndarray:
+        return np.broadcast_to(values[:, None], shape)
+
+    # Same arithmetic, in the same order, as calculate_monthly_salary and DailySalaries
+    hourly_rate = wage / 8
+    overtime_pay = overtime * hourly_rate * overtime_rate
+    regular_pay = per_employee(wage)
+    weekend_bonus = np.where((is_weekend & ~is_holiday)[None, :], wage[:, None] * WEEKEND_BONUS_RATE, 0.0)
+    holiday_bonus = np.where(is_holiday[None, :], wage[:, None] * HOLIDAY_BONUS_RATE, 0.0)
+    total_daily = (regular_pay + per_employee(overtime_pay) + weekend_bonus + holiday_bonus +
+                   per_employee(allowances) - per_employee(deduction))
+
+    # Totals come from day counts, rounded to cents, as in calculate_monthly_salary
+    totals = monthly_totals(wage, day_type_counts(compiled, indices), overtime, overtime_rate,
+                            allowances, deduction)
+
+    daily = {
+        'daily_wage': regular_pay,
+        'hours_worked': per_employee(hours),
+        'regular_hours': per_employee(np.minimum(hours, 8)),
+        'overtime_hours': per_employee(np.maximum(hours - 8, 0) + overtime),
+        'overtime_rate': per_employee(overtime_rate),
+        'regular_pay': regular_pay,
+        'overtime_pay': per_employee(overtime_pay),
+        'weekend_bonus': weekend_bonus,
+        'holiday_bonus': holiday_bonus,
+        'other_allowances': per_employee(allowances),
+        'deductions': per_employee(deduction),
+        'total_salary': total_daily
+    }
+    return PayrollBatch(year, month, labor_names, dates, day_types, daily, totals)
+
+
+def salary_record_rows(monthly_data: Union[Dict, PayrollBatch]) -> Iterator[Tuple]:
+    """Rows for salary_records from one employee's monthly_data or a PayrollBatch"""
+    if isinstance(monthly_data, PayrollBatch):
+        return monthly_data.iter_salary_rows()
+
+    if 'daily_salaries' not in monthly_data:
+        raise ValueError("Summary-only salary data has no daily rows to save")
+    return _daily_salary_rows(monthly_data['daily_salaries'])
+
+
+def _daily_salary_rows(daily_salaries: Iterable[Dict]) -> Iterator[Tuple]:
+    for daily_salary in daily_salaries:
+        yield (
+            daily_salary['labor_name'],
+            daily_salary['date_str'],
+            daily_salary['day_type'],
+            daily_salary['daily_wage'],
+            daily_salary['hours_worked'],
+            daily_salary['regular_hours'],
+            daily_salary['overtime_hours'],
+            daily_salary['overtime_rate'],
+            daily_salary['weekend_bonus'],
+            daily_salary['holiday_bonus'],
+            daily_salary['other_allowances'],
+            daily_salary['deductions'],
+            daily_salary['total_salary']
+        )
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Payroll Runner
+Month-end payroll for the whole roster, sharded across a process pool
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+from db_config import DatabaseConfig
+from holiday_calendar import Holiday, HolidayCalendar, load_calendar
+from payroll_engine import calculate_payroll_batch
+from salary_partitions import create_month_partition, is_partitioned
+from salary_store import bulk_upsert_salary_records
+
+# Shards per worker, so a slow shard does not leave the other workers idle
+SHARDS_PER_WORKER = 4
+
+PROFILE_COLUMNS = ['name', 'base_daily_wage', 'overtime_rate']
+
+# Per-process state set up by _init_worker
+_worker_state: Dict = {}
+
+
+def load_profiles(cursor) -> pd.DataFrame:
+    """Every labor profile, in one query"""
+    cursor.execute(f"SELECT {', '.join(PROFILE_COLUMNS)} FROM labor_profiles ORDER BY name")
+    return pd.DataFrame(cursor.fetchall(), columns=PROFILE_COLUMNS).astype(
+        {'base_daily_wage': float, 'overtime_rate': float}
+    )
+
+
+def synthetic_roster(employees: int, seed: int = 0) -> pd.DataFrame:
+    """A made-up roster for benchmarking"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'name': [f"Synthetic {index:06d}" for index in range(1, employees + 1)],
+        'base_daily_wage': rng.uniform(80, 500, employees).round(2),
+        'overtime_rate': rng.choice([1.25, 1.5, 2.0], employees)
+    })
+
+
+def shard_profiles(profiles: pd.DataFrame, shards: int) -> List[pd.DataFrame]:
+    """Split the roster into at most `shards` contiguous, similarly sized pieces"""
+    shards = max(1, min(shards, len(profiles)))
+    bounds = np.linspace(0, len(profiles), shards + 1).astype(int)
+    return [profiles.iloc[start:end] for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+
+def _init_worker(connection_string: Optional[str], holidays: List[Holiday]):
+    """Process pool initializer: one calendar and (when saving) one connection per worker"""
+    _worker_state['holidays'] = HolidayCalendar(holidays)
+    _worker_state['conn'] = psycopg2.connect(connection_string) if connection_string else None
+
+
+def _run_shard(index: int, profiles: List[Dict], options: Dict) -> Dict:
+    """Calculate and save one shard; runs in a worker process"""
+    started = time.perf_counter()
+    batch = calculate_payroll_batch(holidays=_worker_state['holidays'], profiles=profiles, **options)
+    computed = time.perf_counter()
+
+    result = {'shard': index, 'pid': os.getpid(), 'employees': len(batch),
+              'rows': len(batch) * batch.total_working_days,
+              'total_salary': float(batch.totals['total_salary'].sum())}
+
+    conn = _worker_state['conn']
+    if conn is not None:
+        try:
+            result.update(bulk_upsert_salary_records(conn, batch))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    result['compute_seconds'] = computed - started
+    result['save_seconds'] = time.perf_counter() - computed
+    return result
+
+
+def _print_progress(done: int, total: int, shard: Dict):
+    print(f"  [{done}/{total}] shard {shard['shard']:>3}: {shard['employees']:>6} employees, "
+          f"{shard['rows']:>8} rows, compute {shard['compute_seconds']:.2f}s, "
+          f"save {shard['save_seconds']:.2f}s (pid {shard['pid']})", flush=True)
+
+
+def run_payroll(year: int, month: int, workers: Optional[int] = None,
+                config: Optional[DatabaseConfig] = None, profiles: Optional[pd.DataFrame] = None,
+                save: bool = True, shards: Optional[int] = None, hours_per_day: float = 8,
+                overtime_per_day: float = 0, include_weekends: bool = False,
+                other_allowances: float = 0, deductions: float = 0,
+                progress: Optional[Callable[[int, int, Dict], None]] = None) -> Dict:
+    """Calculate (and by default save) one month's payroll for every employee
+
+    The roster is loaded in one query unless profiles is given, split into
+    shards and processed by `workers` processes (default: CPU count). Each
+    worker saves its shards with COPY and a set-based upsert on its own
+    connection. Returns overall totals plus per-shard timings.
+    """
+    started = time.perf_counter()
+    config = config or DatabaseConfig.from_file()
+    workers = max(1, workers or os.cpu_count() or 1)
+
+    holidays = HolidayCalendar()
+    conn = psycopg2.connect(config.get_connection_string())
+    try:
+        with conn.cursor() as cursor:
+            if profiles is None:
+                profiles = load_profiles(cursor)
+            holidays = load_calendar(cursor)
+            if save and is_partitioned(cursor):
+                # Create the month's partition up front so shards don't race to create it
+                create_month_partition(cursor, year, month)
+        conn.commit()
+    finally:
+        conn.close()
+    loaded = time.perf_counter()
+
+    options = {'year': year, 'month': month, 'hours_per_day': hours_per_day,
+               'overtime_per_day': overtime_per_day, 'include_weekends': include_weekends,
+               'other_allowances': other_allowances, 'deductions': deductions}
+    pieces = shard_profiles(profiles, shards or workers * SHARDS_PER_WORKER) if len(profiles) else []
+    initargs = (config.get_connection_string() if save else None, holidays.holidays())
+    progress = progress or (lambda done, total, shard: None)
+
+    results = []
+    if workers == 1:
+        # Run in this process: no pickling overhead, easier to debug
+        _init_worker(*initargs)
+        try:
+            for index, piece in enumerate(pieces):
+                results.append(_run_shard(index, piece.to_dict('records'), options))
+                progress(len(results), len(pieces), results[-1])
+        finally:
+            if _worker_state.get('conn') is not None:
+                _worker_state['conn'].close()
+            _worker_state.clear()
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as pool:
+            futures = [pool.submit(_run_shard, index, piece.to_dict('records'), options)
+                       for index, piece in enumerate(pieces)]
+            for future in as_completed(futures):
+                results.append(future.result())
+                progress(len(results), len(pieces), results[-1])
+
+    results.sort(key=lambda shard: shard['shard'])
+    return {
+        'year': year,
+        'month': month,
+        'workers': workers,
+        'employees': sum(shard['employees'] for shard in results),
+        'rows': sum(shard['rows'] for shard in results),
+        'inserted': sum(shard.get('inserted', 0) for shard in results),
+        'updated': sum(shard.get('updated', 0) for shard in results),
+        'total_salary': sum(shard['total_salary'] for shard in results),
+        'load_seconds': loaded - started,
+        'elapsed_seconds': time.perf_counter() - started,
+        'shards': results
+    }
+
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="Run month-end payroll for every employee")
+    parser.add_argument('year', type=int)
+    parser.add_argument('month', type=int)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--shards', type=int, default=None,
+                        help=f"number of shards (default: {SHARDS_PER_WORKER} per worker)")
+    parser.add_argument('--include-weekends', action='store_true')
+    parser.add_argument('--hours-per-day', type=float, default=8)
+    parser.add_argument('--overtime-per-day', type=float, default=0)
+    parser.add_argument('--allowances', type=float, default=0, help="other allowances per day")
+    parser.add_argument('--deductions', type=float, default=0, help="deductions per day")
+    parser.add_argument('--synthetic', type=int, metavar='N',
+                        help="use a synthetic roster of N employees instead of labor_profiles")
+    parser.add_argument('--no-save', action='store_true', help="calculate only, don't write salary_records")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    profiles = synthetic_roster(args.synthetic) if args.synthetic else None
+
+    print(f"Running payroll for {args.year}-{args.month:02d}...")
+    try:
+        result = run_payroll(
+            args.year, args.month,
+            workers=args.workers,
+            profiles=profiles,
+            save=not args.no_save,
+            shards=args.shards,
+            hours_per_day=args.hours_per_day,
+            overtime_per_day=args.overtime_per_day,
+            include_weekends=args.include_weekends,
+            other_allowances=args.allowances,
+            deductions=args.deductions,
+            progress=_print_progress
+        )
+    except psycopg2.Error as e:
+        print(f"✗ Payroll run failed: {e}")
+        sys.exit(1)
+
+    print()
+    print(f"✓ {result['employees']} employees, {result['rows']} daily rows "
+          f"({result['inserted']} inserted, {result['updated']} updated)")
+    print(f"  Total payroll: AED {result['total_salary']:,.2f}")
+    print(f"  {result['workers']} worker(s), {len(result['shards'])} shard(s), "
+          f"loaded in {result['load_seconds']:.2f}s, finished in {result['elapsed_seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Payroll Monthly Summary
+Per-employee monthly totals kept in payroll_monthly_summary alongside salary_records
+"""
+
+import logging
+from typing import Dict, Optional
+
+from psycopg2 import sql
+
+from period_queries import Period
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_TABLE = 'payroll_monthly_summary'
+
+# Report columns, in the order generate_summary_report has always returned them
+SUMMARY_COLUMNS = (
+    'labor_name', 'working_days', 'total_regular_hours', 'total_overtime_hours',
+    'total_regular_pay', 'total_overtime_pay', 'total_weekend_bonus', 'total_holiday_bonus',
+    'total_allowances', 'total_deductions', 'total_salary'
+)
+
+# Unconstrained NUMERIC keeps the sums exactly as the daily roll-up returned them
+_TABLE_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {SUMMARY_TABLE} (
+        labor_name VARCHAR(255) NOT NULL,
+        year SMALLINT NOT NULL,
+        month SMALLINT NOT NULL,
+        working_days INTEGER NOT NULL,
+        total_hours NUMERIC NOT NULL,
+        total_regular_hours NUMERIC NOT NULL,
+        total_overtime_hours NUMERIC NOT NULL,
+        total_regular_pay NUMERIC NOT NULL,
+        total_overtime_pay NUMERIC NOT NULL,
+        total_weekend_bonus NUMERIC NOT NULL,
+        total_holiday_bonus NUMERIC NOT NULL,
+        total_allowances NUMERIC NOT NULL,
+        total_deductions NUMERIC NOT NULL,
+        total_salary NUMERIC NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (labor_name, year, month)
+    )
+"""
+
+_AGGREGATES = """
+    COUNT(*),
+    SUM(r.hours_worked),
+    SUM(r.regular_hours),
+    SUM(r.overtime_hours),
+    SUM(r.daily_wage * r.regular_hours / 8),
+    SUM(r.overtime_hours * (r.daily_wage / 8) * r.overtime_rate),
+    SUM(r.weekend_bonus),
+    SUM(r.holiday_bonus),
+    SUM(r.other_allowances),
+    SUM(r.deductions),
+    SUM(r.total_salary)
+"""
+
+_INSERT_COLUMNS = """
+    labor_name, year, month, working_days, total_hours, total_regular_hours,
+    total_overtime_hours, total_regular_pay, total_overtime_pay, total_weekend_bonus,
+    total_holiday_bonus, total_allowances, total_deductions, total_salary
+"""
+
+_UPDATE_LIST = ',\n            '.join(
+    f"{column} = EXCLUDED.{column}" for column in (
+        'working_days', 'total_hours', 'total_regular_hours', 'total_overtime_hours',
+        'total_regular_pay', 'total_overtime_pay', 'total_weekend_bonus', 'total_holiday_bonus',
+        'total_allowances', 'total_deductions', 'total_salary'
+    )
+) + ',\n            updated_at = CURRENT_TIMESTAMP'
+
+
+def ensure_summary_schema(cursor) -> bool:
+    """Create payroll_monthly_summary, backfilling it when it is new; returns True when created"""
+    cursor.execute("SELECT to_regclass(%s) IS NULL", (SUMMARY_TABLE,))
+    missing = cursor.fetchone()[0]
+
+    cursor.execute(_TABLE_DDL)
+    cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{SUMMARY_TABLE}_period ON {SUMMARY_TABLE} (year, month)")
+
+    if missing:
+        rows = rebuild_monthly_summaries(cursor)
+        logger.info(f"Created {SUMMARY_TABLE} and backfilled {rows} rows")
+    return missing
+
+
+def lock_staged_summaries(cursor, staging_table: str):
+    """Serialize writers touching the same (labor_name, month) until commit
+
+    Without this, two transactions saving different days of one employee's month
+    could each recompute the summary without seeing the other's rows.
+    """
+    cursor.execute(sql.SQL("""
+        SELECT pg_advisory_xact_lock(hashtext({summary}), hashtext(labor_name || ':' || month))
+        FROM (
+            SELECT DISTINCT labor_name, to_char(date, 'YYYY-MM') AS month
+            FROM {staging}
+            ORDER BY labor_name, month
+        ) keys
+    """).format(summary=sql.Literal(SUMMARY_TABLE), staging=sql.Identifier(staging_table)))
+
+
+def refresh_staged_summaries(cursor, staging_table: str) -> int:
+    """Recompute the summary rows for every (labor_name, month) present in a staging table
+
+    Must run after the staged rows have been merged into salary_records, in the
+    same transaction, so the summaries commit or roll back with the daily rows.
+    """
+    cursor.execute(sql.SQL(f"""
+        WITH keys AS (
+            SELECT DISTINCT labor_name, date_trunc('month', date)::date AS month_start
+            FROM {{staging}}
+        )
+        INSERT INTO {SUMMARY_TABLE} ({_INSERT_COLUMNS})
+        SELECT k.labor_name,
+               EXTRACT(YEAR FROM k.month_start)::int,
+               EXTRACT(MONTH FROM k.month_start)::int,
+               {_AGGREGATES}
+        FROM keys k
+        JOIN salary_records r
+          ON r.labor_name = k.labor_name
+         AND r.date >= k.month_start
+         AND r.date < (k.month_start + interval '1 month')::date
+        GROUP BY k.labor_name, k.month_start
+        ON CONFLICT (labor_name, year, month) DO UPDATE SET
+            {_UPDATE_LIST}
+    """).format(staging=sql.Identifier(staging_table)))
+    return cursor.rowcount
+
+
+def rebuild_monthly_summaries(cursor, period: Optional[Period] = None) -> int:
+    """Recompute summaries from salary_records for whole months overlapping period
+
+    Without a period, every month between the first and last daily row is rebuilt;
+    summaries for months outside that range (e.g. detached partitions) are kept.
+    Returns the number of summary rows written.
+    """
+    if period is None:
+        cursor.execute("SELECT MIN(date), MAX(date) FROM salary_records")
+        first_day, last_day = cursor.fetchone()
+        if first_day is None:
+            return 0
+        period = Period.between(first_day, last_day)
+
+    months = list(period.months())
+    period = Period(Period.month(*months[0]).start, Period.month(*months[-1]).end)
+    period_filter, params = period.predicate('r.date')
+
+    cursor.execute(f"""
+        DELETE FROM {SUMMARY_TABLE}
+        WHERE make_date(year, month, 1) >= %s AND make_date(year, month, 1) < %s
+    """, params)
+    cursor.execute(f"""
+        INSERT INTO {SUMMARY_TABLE} ({_INSERT_COLUMNS})
+        SELECT r.labor_name,
+               EXTRACT(YEAR FROM r.date)::int,
+               EXTRACT(MONTH FROM r.date)::int,
+               {_AGGREGATES}
+        FROM salary_records r
+        WHERE {period_filter}
+        GROUP BY r.labor_name, EXTRACT(YEAR FROM r.date), EXTRACT(MONTH FROM r.date)
+    """, params)
+    rows = cursor.rowcount
+    logger.info(f"Rebuilt {rows} monthly summaries for {period}")
+    return rows
+
+
+def summary_query(year: int, month: int, order_by: str = 'total_salary DESC'):
+    """SELECT for one month's summary rows in report column order, with its parameters"""
+    query = f"""
+        SELECT {', '.join(SUMMARY_COLUMNS)}
+        FROM {SUMMARY_TABLE}
+        WHERE year = %s AND month = %s
+        ORDER BY {order_by}
+    """
+    return query, (year, month)
+
+
+def monthly_payroll_total(cursor, year: int, month: int) -> float:
+    """Total salary for one month across all employees"""
+    cursor.execute(f"""
+        SELECT COALESCE(SUM(total_salary), 0)
+        FROM {SUMMARY_TABLE}
+        WHERE year = %s AND month = %s
+    """, (year, month))
+    return float(cursor.fetchone()[0])
+
+
+def summary_drift(cursor, year: int, month: int) -> Dict[str, int]:
+    """Compare one month's summaries against the daily rows; counts of mismatching employees"""
+    period_filter, params = Period.month(year, month).predicate('r.date')
+    cursor.execute(f"""
+        WITH actual AS (
+            SELECT r.labor_name, COUNT(*) AS working_days, SUM(r.total_salary) AS total_salary
+            FROM salary_records r
+            WHERE {period_filter}
+            GROUP BY r.labor_name
+        ),
+        stored AS (
+            SELECT labor_name, working_days, total_salary
+            FROM {SUMMARY_TABLE}
+            WHERE year = %s AND month = %s
+        )
+        SELECT
+            COUNT(*) FILTER (WHERE stored.labor_name IS NULL),
+            COUNT(*) FILTER (WHERE actual.labor_name IS NULL),
+            COUNT(*) FILTER (WHERE actual.working_days <> stored.working_days
+                               OR actual.total_salary <> stored.total_salary)
+        FROM actual FULL JOIN stored USING (labor_name)
+    """, (*params, year, month))
+    missing, stale, mismatched = cursor.fetchone()
+    return {'missing': missing, 'stale': stale, 'mismatched': mismatched}
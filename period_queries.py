@@ -0,0 +1,92 @@
+"""
+Period Queries
+Turns report periods into index-friendly half-open date range predicates
+"""
+
+import calendar
+import datetime
+from typing import Iterator, Optional, Tuple
+
+
+class Period:
+    """Half-open date range: start <= date < end"""
+
+    def __init__(self, start: datetime.date, end: datetime.date):
+        if end < start:
+            raise ValueError(f"Period end {end} is before start {start}")
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def month(cls, year: int, month: int) -> 'Period':
+        """A calendar month"""
+        start = datetime.date(year, month, 1)
+        return cls(start, _add_months(start, 1))
+
+    @classmethod
+    def quarter(cls, year: int, quarter: int) -> 'Period':
+        """A calendar quarter (1-4)"""
+        if not 1 <= quarter <= 4:
+            raise ValueError(f"Quarter must be 1-4, got {quarter}")
+        start = datetime.date(year, 3 * (quarter - 1) + 1, 1)
+        return cls(start, _add_months(start, 3))
+
+    @classmethod
+    def year(cls, year: int) -> 'Period':
+        """A calendar year"""
+        return cls(datetime.date(year, 1, 1), datetime.date(year + 1, 1, 1))
+
+    @classmethod
+    def year_to_date(cls, year: int, month: Optional[int] = None,
+                     as_of: Optional[datetime.date] = None) -> 'Period':
+        """January 1st up to the end of month, or up to and including as_of"""
+        start = datetime.date(year, 1, 1)
+        if month is not None:
+            return cls(start, _add_months(start, month))
+        as_of = as_of or datetime.date.today()
+        return cls(start, as_of + datetime.timedelta(days=1))
+
+    @classmethod
+    def between(cls, first_day: datetime.date, last_day: datetime.date) -> 'Period':
+        """An arbitrary range including both first_day and last_day"""
+        return cls(first_day, last_day + datetime.timedelta(days=1))
+
+    @property
+    def last_day(self) -> datetime.date:
+        return self.end - datetime.timedelta(days=1)
+
+    def predicate(self, column: str = 'date') -> Tuple[str, Tuple[datetime.date, datetime.date]]:
+        """SQL condition and parameters, e.g. ("date >= %s AND date < %s", (start, end))"""
+        return f"{column} >= %s AND {column} < %s", (self.start, self.end)
+
+    def months(self) -> Iterator[Tuple[int, int]]:
+        """(year, month) pairs overlapping the period"""
+        current = self.start.replace(day=1)
+        while current < self.end:
+            yield current.year, current.month
+            current = _add_months(current, 1)
+
+    def __contains__(self, day: datetime.date) -> bool:
+        return self.start <= day < self.end
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Period) and (self.start, self.end) == (other.start, other.end)
+
+    def __hash__(self) -> int:
+        return hash((self.start, self.end))
+
+    def __repr__(self):
+        return f"Period({self.start.isoformat()}, {self.end.isoformat()})"
+
+
+def _add_months(day: datetime.date, months: int) -> datetime.date:
+    """Shift a date by whole months, clamping the day to the target month's length"""
+    index = day.year * 12 + (day.month - 1) + months
+    year, month = divmod(index, 12)
+    month += 1
+    return datetime.date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def month_predicate(year: int, month: int, column: str = 'date') -> Tuple[str, Tuple[datetime.date, datetime.date]]:
+    """Shortcut for Period.month(year, month).predicate(column)"""
+    return Period.month(year, month).predicate(column)
@@ -0,0 +1,293 @@
+"""
+Labor Profile Repository
+In-memory labor profiles indexed by name and id, kept current with LISTEN/NOTIFY
+"""
+
+import datetime
+import json
+import logging
+import os
+import select
+import socket
+import threading
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+import pandas as pd
+import psycopg2
+from psycopg2 import extensions
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = 'labor_profiles_changed'
+
+# How long the listener waits on the socket before checking whether it should stop
+LISTEN_TIMEOUT = 5.0
+
+# Wait before reconnecting after the listening connection drops
+RECONNECT_DELAY = 5.0
+
+PROFILE_COLUMNS = ('id', 'name', 'base_daily_wage', 'hourly_rate', 'position',
+                   'contact_info', 'overtime_rate', 'created_at')
+
+# Row triggers send the changed id; TRUNCATE tells listeners to reload everything
+_TRIGGER_DDL = f"""
+    CREATE OR REPLACE FUNCTION notify_labor_profiles_changed() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'TRUNCATE' THEN
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', json_build_object('op', TG_OP)::text);
+        ELSIF TG_OP = 'DELETE' THEN
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', json_build_object('op', TG_OP, 'id', OLD.id)::text);
+        ELSE
+            PERFORM pg_notify('{NOTIFY_CHANNEL}', json_build_object('op', TG_OP, 'id', NEW.id)::text);
+        END IF;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql;
+
+    DROP TRIGGER IF EXISTS labor_profiles_notify ON labor_profiles;
+    CREATE TRIGGER labor_profiles_notify
+        AFTER INSERT OR UPDATE OR DELETE ON labor_profiles
+        FOR EACH ROW EXECUTE FUNCTION notify_labor_profiles_changed();
+
+    DROP TRIGGER IF EXISTS labor_profiles_notify_truncate ON labor_profiles;
+    CREATE TRIGGER labor_profiles_notify_truncate
+        AFTER TRUNCATE ON labor_profiles
+        FOR EACH STATEMENT EXECUTE FUNCTION notify_labor_profiles_changed();
+"""
+
+
+class LaborProfile(NamedTuple):
+    id: int
+    name: str
+    base_daily_wage: float
+    hourly_rate: float
+    position: Optional[str]
+    contact_info: Optional[str]
+    overtime_rate: float
+    created_at: Optional[datetime.datetime]
+
+
+def ensure_profile_triggers(cursor):
+    """Install the NOTIFY triggers on labor_profiles (idempotent)"""
+    cursor.execute(_TRIGGER_DDL)
+
+
+def _profile_from_row(row) -> LaborProfile:
+    values = dict(zip(PROFILE_COLUMNS, row))
+    for column in ('base_daily_wage', 'hourly_rate', 'overtime_rate'):
+        if values[column] is not None:
+            values[column] = float(values[column])
+    return LaborProfile(**values)
+
+
+class ProfileRepository:
+    """Every labor profile in memory, looked up by name or id without a query
+
+    start() listens on NOTIFY_CHANNEL before loading, so no change between the
+    load and the first notification is missed. A background thread then
+    applies notified ids in batches, and reloads everything after the
+    listening connection has been lost. Writers in this process can call
+    refresh() with the ids they changed so their own reads see the change
+    immediately.
+    """
+
+    def __init__(self, connect: Callable[[], extensions.connection]):
+        self._connect = connect
+        self._by_id: Dict[int, LaborProfile] = {}
+        self._by_name: Dict[str, LaborProfile] = {}
+        self._lock = threading.Lock()
+        self._query_lock = threading.Lock()
+        self._query_conn: Optional[extensions.connection] = None
+        self._listen_conn: Optional[extensions.connection] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wakeup: Optional[tuple] = None
+        self.version = 0
+        self.loaded = False
+
+    @classmethod
+    def from_dsn(cls, dsn: str) -> 'ProfileRepository':
+        return cls(lambda: psycopg2.connect(dsn))
+
+    def start(self) -> 'ProfileRepository':
+        """Listen for changes, load every profile and start the listener thread"""
+        if self._thread is not None:
+            return self
+
+        self._stop.clear()
+        self._wakeup = socket.socketpair()
+        try:
+            self._open_listener()
+        except psycopg2.Error as e:
+            logger.warning(f"Profile change notifications unavailable, will retry: {e}")
+        self.reload()
+
+        self._thread = threading.Thread(target=self._listen_loop, name='profile-listener', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the listener thread and close both connections"""
+        self._stop.set()
+        if self._thread is not None:
+            self._wakeup[1].send(b'\0')
+            self._thread.join(timeout=LISTEN_TIMEOUT + 1)
+            self._thread = None
+        if self._wakeup is not None:
+            for sock in self._wakeup:
+                sock.close()
+            self._wakeup = None
+        for conn in (self._listen_conn, self._query_conn):
+            if conn is not None and not conn.closed:
+                conn.close()
+        self._listen_conn = self._query_conn = None
+
+    # Lookups
+
+    def get(self, name: str) -> Optional[LaborProfile]:
+        return self._by_name.get(name)
+
+    def get_by_id(self, profile_id: int) -> Optional[LaborProfile]:
+        return self._by_id.get(profile_id)
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def all(self) -> List[LaborProfile]:
+        """Every profile, ordered by name"""
+        with self._lock:
+            profiles = list(self._by_id.values())
+        return sorted(profiles, key=lambda profile: profile.name)
+
+    def names(self) -> List[str]:
+        return [profile.name for profile in self.all()]
+
+    def created_since(self, cutoff: datetime.datetime) -> List[LaborProfile]:
+        """Profiles created at or after cutoff, newest first"""
+        recent = [profile for profile in self.all()
+                  if profile.created_at is not None and profile.created_at >= cutoff]
+        return sorted(recent, key=lambda profile: profile.created_at, reverse=True)
+
+    def to_frame(self) -> pd.DataFrame:
+        """Profiles as a DataFrame with the labor_profiles columns, ordered by name"""
+        return pd.DataFrame(self.all(), columns=list(PROFILE_COLUMNS))
+
+    # Loading
+
+    def reload(self):
+        """Replace the cache with a fresh copy of labor_profiles"""
+        rows = self._query(f"SELECT {', '.join(PROFILE_COLUMNS)} FROM labor_profiles")
+        profiles = [_profile_from_row(row) for row in rows]
+        with self._lock:
+            self._by_id = {profile.id: profile for profile in profiles}
+            self._by_name = {profile.name: profile for profile in profiles}
+            self.version += 1
+            self.loaded = True
+        logger.info(f"Loaded {len(profiles)} labor profiles")
+
+    def refresh(self, profile_ids: Iterable[int]):
+        """Re-read the given profiles; ids no longer in the table are dropped"""
+        profile_ids = sorted(set(profile_ids))
+        if not profile_ids:
+            return
+
+        rows = self._query(
+            f"SELECT {', '.join(PROFILE_COLUMNS)} FROM labor_profiles WHERE id = ANY(%s)",
+            (profile_ids,)
+        )
+        fresh = {profile.id: profile for profile in map(_profile_from_row, rows)}
+
+        with self._lock:
+            for profile_id in profile_ids:
+                old = self._by_id.pop(profile_id, None)
+                if old is not None and self._by_name.get(old.name) is old:
+                    del self._by_name[old.name]
+                new = fresh.get(profile_id)
+                if new is not None:
+                    self._by_id[profile_id] = new
+                    self._by_name[new.name] = new
+            self.version += 1
+
+    def _query(self, query: str, params=None) -> List[tuple]:
+        """Run a read on the repository's own autocommit connection, reconnecting once if it dropped"""
+        with self._query_lock:
+            for attempt in (1, 2):
+                try:
+                    if self._query_conn is None or self._query_conn.closed:
+                        self._query_conn = self._connect()
+                        self._query_conn.autocommit = True
+                    with self._query_conn.cursor() as cursor:
+                        cursor.execute(query, params)
+                        return cursor.fetchall()
+                except (psycopg2.OperationalError, psycopg2.InterfaceError):
+                    if self._query_conn is not None and not self._query_conn.closed:
+                        self._query_conn.close()
+                    self._query_conn = None
+                    if attempt == 2:
+                        raise
+
+    # Listening
+
+    def _open_listener(self):
+        conn = self._connect()
+        conn.autocommit = True
+        with conn.cursor() as cursor:
+            cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+        self._listen_conn = conn
+
+    def _listen_loop(self):
+        while not self._stop.is_set():
+            try:
+                if self._listen_conn is None or self._listen_conn.closed:
+                    self._open_listener()
+                    # Notifications sent while disconnected are lost
+                    self.reload()
+
+                conn = self._listen_conn
+                readable, _, _ = select.select([conn, self._wakeup[0]], [], [], LISTEN_TIMEOUT)
+                if conn not in readable:
+                    continue
+                conn.poll()
+                self._apply_notifications(conn.notifies)
+                conn.notifies.clear()
+
+            except (psycopg2.Error, OSError, ValueError) as e:
+                if self._stop.is_set():
+                    break
+                logger.warning(f"Profile listener lost its connection, reconnecting: {e}")
+                if self._listen_conn is not None and not self._listen_conn.closed:
+                    self._listen_conn.close()
+                self._listen_conn = None
+                self._stop.wait(RECONNECT_DELAY)
+
+    def _apply_notifications(self, notifies):
+        """Apply one batch of notifications with a single query"""
+        changed = set()
+        for notify in notifies:
+            try:
+                payload = json.loads(notify.payload)
+            except ValueError:
+                payload = {}
+            if 'id' not in payload:
+                self.reload()
+                return
+            changed.add(int(payload['id']))
+        self.refresh(changed)
+
+
+_default_repository: Optional[ProfileRepository] = None
+_default_pid: Optional[int] = None
+_default_lock = threading.Lock()
+
+
+def get_profile_repository(connect: Callable[[], extensions.connection]) -> ProfileRepository:
+    """The started repository for this process (forked workers get their own)"""
+    global _default_repository, _default_pid
+    with _default_lock:
+        if _default_repository is None or _default_pid != os.getpid():
+            _default_repository = ProfileRepository(connect).start()
+            _default_pid = os.getpid()
+        return _default_repository
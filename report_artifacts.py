@@ -0,0 +1,332 @@
+"""
+Report Artifacts
+A month's summary XLSX, per-employee detail CSVs and payslip PDFs, built in a process pool and cached by content hash
+"""
+
+import argparse
+import calendar
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+from typing import Dict, List, Optional
+from xml.sax.saxutils import escape
+
+import psycopg2
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import inch
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+from db_config import DatabaseConfig
+from period_queries import Period
+from report_export import export_report, filename_slug, write_csv
+from report_stream import DETAILED_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_DIR = os.getenv('REPORT_ARTIFACT_DIR', os.path.join(os.getenv('EXPORT_DIR', '/app/exports'), 'artifacts'))
+
+# Processes building per-employee files (default: CPU count)
+ARTIFACT_WORKERS = int(os.getenv('REPORT_ARTIFACT_WORKERS', '0'))
+
+# Employees handed to a worker at a time
+EMPLOYEES_PER_TASK = 25
+
+# Bump when the layout of any artifact changes, so cached files are rebuilt
+ARTIFACT_VERSION = 1
+
+COMPANY_NAME = os.getenv('COMPANY_NAME', 'Jatan Jewellery FZ.C')
+COMPANY_LICENSE = os.getenv('COMPANY_LICENSE', '41778')
+
+# Per-process state set up by _init_worker
+_worker_state: Dict = {}
+
+
+def month_dir(year: int, month: int) -> str:
+    return os.path.join(ARTIFACT_DIR, f"{year}-{month:02d}")
+
+
+def employee_hashes(cursor, year: int, month: int) -> Dict[str, str]:
+    """md5 of each employee's report rows for the month, computed in PostgreSQL"""
+    period_filter, params = Period.month(year, month).predicate()
+    cursor.execute(f"""
+        SELECT labor_name, md5(string_agg(ROW({', '.join(DETAILED_COLUMNS)})::text, E'\\n' ORDER BY date))
+        FROM salary_records
+        WHERE {period_filter}
+        GROUP BY labor_name
+        ORDER BY labor_name
+    """, params)
+    return dict(cursor.fetchall())
+
+
+def month_hash(year: int, month: int, hashes: Dict[str, str]) -> str:
+    """Content hash of a month's report data (and the artifact layout version)"""
+    digest = hashlib.sha256(f"v{ARTIFACT_VERSION}:{year}-{month:02d}".encode())
+    for name in sorted(hashes):
+        digest.update(f"\n{name}\t{hashes[name]}".encode())
+    return digest.hexdigest()
+
+
+def _manifest_path(year: int, month: int, content_hash: str) -> str:
+    return os.path.join(month_dir(year, month), f"manifest_{content_hash[:16]}.json")
+
+
+def _employee_files(year: int, month: int, name: str, employee_hash: str) -> Dict[str, str]:
+    stem = f"{filename_slug(name)}_{employee_hash[:12]}"
+    directory = month_dir(year, month)
+    return {'hash': employee_hash,
+            'detail': os.path.join(directory, 'detail', f"{stem}.csv"),
+            'payslip': os.path.join(directory, 'payslips', f"{stem}.pdf")}
+
+
+def _read_manifest(path: str) -> Optional[Dict]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    files = [manifest['summary']] + [path for files in manifest['employees'].values()
+                                     for path in (files['detail'], files['payslip'])]
+    return manifest if all(os.path.exists(path) for path in files) else None
+
+
+def cached_artifacts(cursor, year: int, month: int) -> Optional[Dict]:
+    """Manifest of the month's artifacts if they were built from the data as it is now"""
+    content_hash = month_hash(year, month, employee_hashes(cursor, year, month))
+    return _read_manifest(_manifest_path(year, month, content_hash))
+
+
+def _write_atomic(path: str, write):
+    """Call write(partial_path), then move the finished file into place"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial_path = f"{path}.{os.getpid()}.part"
+    try:
+        write(partial_path)
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+
+def _payslip_totals(rows: List[tuple]) -> Dict[str, Decimal]:
+    """Monthly totals from detail rows, computed the way payroll_monthly_summary computes them"""
+    column = {name: index for index, name in enumerate(DETAILED_COLUMNS)}
+    totals = dict.fromkeys(('regular_hours', 'overtime_hours', 'regular_pay', 'overtime_pay', 'weekend_bonus',
+                            'holiday_bonus', 'other_allowances', 'deductions', 'total_salary'), Decimal(0))
+    for row in rows:
+        wage = row[column['daily_wage']]
+        totals['regular_hours'] += row[column['regular_hours']]
+        totals['overtime_hours'] += row[column['overtime_hours']]
+        totals['regular_pay'] += wage * row[column['regular_hours']] / 8
+        totals['overtime_pay'] += row[column['overtime_hours']] * (wage / 8) * row[column['overtime_rate']]
+        for name in ('weekend_bonus', 'holiday_bonus', 'other_allowances', 'deductions', 'total_salary'):
+            totals[name] += row[column[name]]
+    return totals
+
+
+def write_payslip(path: str, name: str, year: int, month: int, rows: List[tuple]):
+    """One employee's payslip PDF for the month"""
+    totals = _payslip_totals(rows)
+    styles = getSampleStyleSheet()
+    elements = [
+        Paragraph(escape(COMPANY_NAME.upper()), styles['Heading1']),
+        Paragraph(f"Trade License Number: {COMPANY_LICENSE}", styles['Normal']),
+        Spacer(1, 20),
+        Paragraph(f"Payslip - {calendar.month_name[month]} {year}", styles['Heading2']),
+        Paragraph(f"Employee: <b>{escape(name)}</b>", styles['Normal']),
+        Paragraph(f"Working days: {len(rows)}", styles['Normal']),
+        Spacer(1, 20)
+    ]
+
+    table = Table([
+        ['Component', 'Amount (AED)'],
+        [f"Regular pay ({totals['regular_hours']:.2f} h)", f"{totals['regular_pay']:,.2f}"],
+        [f"Overtime pay ({totals['overtime_hours']:.2f} h)", f"{totals['overtime_pay']:,.2f}"],
+        ['Weekend bonus', f"{totals['weekend_bonus']:,.2f}"],
+        ['Holiday bonus', f"{totals['holiday_bonus']:,.2f}"],
+        ['Other allowances', f"{totals['other_allowances']:,.2f}"],
+        ['Deductions', f"-{totals['deductions']:,.2f}"],
+        ['Net salary', f"{totals['total_salary']:,.2f}"]
+    ], colWidths=[3 * inch, 2 * inch])
+    table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+        ('ALIGN', (1, 0), (1, -1), 'RIGHT'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black)
+    ]))
+    elements.append(table)
+
+    # invariant: the same rows always give the same bytes
+    SimpleDocTemplate(path, pagesize=A4, invariant=1, title=f"Payslip {name} {year}-{month:02d}").build(elements)
+
+
+def build_employee_artifacts(conn, year: int, month: int, employees: Dict[str, Dict]) -> Dict:
+    """Write detail CSVs and payslips for some employees (one piece of a plan)"""
+    period_filter, params = Period.month(year, month).predicate()
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT {', '.join(DETAILED_COLUMNS)}
+            FROM salary_records
+            WHERE {period_filter} AND labor_name = ANY(%s)
+            ORDER BY labor_name, date
+        """, (*params, list(employees)))
+        rows = cursor.fetchall()
+    conn.rollback()
+
+    by_name: Dict[str, List[tuple]] = {}
+    for row in rows:
+        by_name.setdefault(row[0], []).append(row)
+
+    for name, files in employees.items():
+        employee_rows = by_name.get(name, [])
+        _write_atomic(files['detail'], lambda path: write_csv(path, DETAILED_COLUMNS, [employee_rows]))
+        _write_atomic(files['payslip'], lambda path: write_payslip(path, name, year, month, employee_rows))
+    return {'pid': os.getpid(), 'employees': len(employees), 'rows': len(rows)}
+
+
+def plan_month_artifacts(cursor, year: int, month: int, force: bool = False) -> Dict:
+    """What a build of the month's artifacts has to do
+
+    Files are keyed by content hash: the summary and manifest by the
+    month's, each detail CSV and payslip by its employee's. 'cached' holds
+    the manifest when everything is current; otherwise 'pieces' splits the
+    employees whose files are missing into groups of EMPLOYEES_PER_TASK.
+    """
+    hashes = employee_hashes(cursor, year, month)
+    content_hash = month_hash(year, month, hashes)
+    manifest_path = _manifest_path(year, month, content_hash)
+    employees = {name: _employee_files(year, month, name, employee_hash)
+                 for name, employee_hash in hashes.items()}
+
+    cached = None if force else _read_manifest(manifest_path)
+    names = [] if cached else sorted(
+        name for name, files in employees.items()
+        if force or not (os.path.exists(files['detail']) and os.path.exists(files['payslip']))
+    )
+    return {
+        'year': year,
+        'month': month,
+        'content_hash': content_hash,
+        'manifest': manifest_path,
+        'employees': employees,
+        'cached': cached,
+        'pieces': [{name: employees[name] for name in names[start:start + EMPLOYEES_PER_TASK]}
+                   for start in range(0, len(names), EMPLOYEES_PER_TASK)]
+    }
+
+
+def finish_month_artifacts(conn, plan: Dict) -> Dict:
+    """Write the summary XLSX and the manifest once every piece is built, and prune stale files"""
+    year, month, content_hash = plan['year'], plan['month'], plan['content_hash']
+    summary_path = os.path.join(month_dir(year, month), f"summary_{content_hash[:16]}.xlsx")
+    _write_atomic(summary_path, lambda path: export_report(conn, path, 'summary', year, month, fmt='xlsx'))
+    conn.rollback()
+
+    manifest = {
+        'year': year,
+        'month': month,
+        'content_hash': content_hash,
+        'version': ARTIFACT_VERSION,
+        'manifest': plan['manifest'],
+        'summary': summary_path,
+        'employees': plan['employees']
+    }
+
+    def write_manifest(path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=1)
+
+    _write_atomic(plan['manifest'], write_manifest)
+    _prune(year, month, manifest)
+    return manifest
+
+
+def _prune(year: int, month: int, manifest: Dict):
+    """Remove the month's files (and manifests) that the current manifest no longer lists"""
+    keep = {manifest['summary'], manifest['manifest']}
+    for files in manifest['employees'].values():
+        keep.update((files['detail'], files['payslip']))
+    for directory, _, names in os.walk(month_dir(year, month)):
+        for name in names:
+            path = os.path.join(directory, name)
+            if path not in keep and not name.endswith('.part'):
+                os.remove(path)
+
+
+def _init_worker(connection_string: str):
+    """Process pool initializer: one connection per worker"""
+    _worker_state['conn'] = psycopg2.connect(connection_string)
+
+
+def _build_piece(year: int, month: int, employees: Dict[str, Dict]) -> Dict:
+    return build_employee_artifacts(_worker_state['conn'], year, month, employees)
+
+
+def build_month_artifacts(config: DatabaseConfig, year: int, month: int, workers: Optional[int] = None,
+                          force: bool = False) -> Dict:
+    """Build (or reuse) the month's report artifacts here, pieces spread over a process pool
+
+    Celery workers are daemonic and cannot start a pool; the
+    generate_monthly_report task fans the pieces out as tasks instead, and
+    in any daemonic process the pieces are built one after another.
+    """
+    started = time.perf_counter()
+    conn = psycopg2.connect(config.get_connection_string())
+    try:
+        with conn.cursor() as cursor:
+            plan = plan_month_artifacts(cursor, year, month, force)
+        if plan['cached']:
+            logger.info(f"Report artifacts for {year}-{month:02d} are current ({plan['content_hash'][:16]})")
+            return {**plan['cached'], 'cached': True, 'built': 0, 'seconds': round(time.perf_counter() - started, 3)}
+
+        pieces = plan['pieces']
+        workers = max(1, min(workers or ARTIFACT_WORKERS or os.cpu_count() or 1, len(pieces) or 1))
+        if multiprocessing.current_process().daemon:
+            workers = 1
+
+        if workers == 1:
+            # Run in this process: no pool start-up for a handful of employees
+            for piece in pieces:
+                build_employee_artifacts(conn, year, month, piece)
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(config.get_connection_string(),)) as pool:
+                for future in as_completed([pool.submit(_build_piece, year, month, piece) for piece in pieces]):
+                    future.result()
+
+        manifest = finish_month_artifacts(conn, plan)
+    finally:
+        conn.close()
+
+    built = sum(len(piece) for piece in pieces)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Built report artifacts for {year}-{month:02d}: {built} of {len(manifest['employees'])} "
+                f"employees in {elapsed:.1f}s with {workers} workers")
+    return {**manifest, 'cached': False, 'built': built, 'workers': workers, 'seconds': round(elapsed, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a month's report artifacts")
+    parser.add_argument('year', type=int)
+    parser.add_argument('month', type=int)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--force', action='store_true', help="rebuild every file even if it is current")
+    args = parser.parse_args()
+
+    result = build_month_artifacts(DatabaseConfig.from_file(), args.year, args.month, args.workers, args.force)
+    state = 'current' if result['cached'] else f"built {result['built']} employees"
+    print(f"{args.year}-{args.month:02d} ({result['content_hash'][:16]}): {state} in {result['seconds']}s")
+    print(f"Manifest: {result['manifest']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Report Export
+Streams report rows from a server-side cursor into .xlsx or .csv files in constant memory
+"""
+
+import csv
+import logging
+import os
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from openpyxl import Workbook
+
+from payroll_summary import SUMMARY_COLUMNS, SUMMARY_TABLE
+from period_queries import Period
+from report_stream import DETAILED_COLUMNS, detailed_report_query, iter_query_chunks
+
+logger = logging.getLogger(__name__)
+
+# Rows per round trip from the server-side cursor
+EXPORT_CHUNK_ROWS = 5000
+
+# Excel's limit is 1,048,576 rows including the header; longer exports continue on a new sheet
+XLSX_MAX_ROWS = 1048575
+
+EXPORT_FORMATS = ('xlsx', 'csv')
+REPORT_KINDS = ('summary', 'detailed')
+
+
+def detailed_export_query(year: int, month: Optional[int] = None,
+                          labor_name: Optional[str] = None) -> Tuple[Sequence[str], str, List]:
+    """Columns, SQL and parameters for daily rows of a month (or a whole year without month)"""
+    period = Period.month(year, month) if month else Period.year(year)
+    query, params = detailed_report_query(period, labor_name)
+    return DETAILED_COLUMNS, query, params
+
+
+def summary_export_query(year: int, month: Optional[int] = None,
+                         labor_name: Optional[str] = None) -> Tuple[Sequence[str], str, List]:
+    """Columns, SQL and parameters for monthly summaries of a month (or every month of a year)"""
+    columns = SUMMARY_COLUMNS if month else ('month',) + SUMMARY_COLUMNS
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM {SUMMARY_TABLE}
+        WHERE year = %s
+    """
+    params: List = [year]
+    if month:
+        query += " AND month = %s"
+        params.append(month)
+    if labor_name:
+        query += " AND labor_name = %s"
+        params.append(labor_name)
+    query += " ORDER BY month, total_salary DESC" if not month else " ORDER BY total_salary DESC"
+    return columns, query, params
+
+
+def write_csv(path: str, columns: Sequence[str], chunks: Iterable[List[tuple]]) -> int:
+    """Write chunks of rows to a CSV file; returns the number of rows"""
+    rows_written = 0
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        for rows in chunks:
+            writer.writerows(rows)
+            rows_written += len(rows)
+    return rows_written
+
+
+def write_xlsx(path: str, columns: Sequence[str], chunks: Iterable[List[tuple]],
+               sheet_title: str = 'Report') -> int:
+    """Write chunks of rows to an .xlsx file in openpyxl write-only mode; returns the number of rows"""
+    workbook = Workbook(write_only=True)
+    sheets = 0
+    sheet = None
+    sheet_rows = XLSX_MAX_ROWS
+    rows_written = 0
+
+    for rows in chunks:
+        for row in rows:
+            if sheet_rows == XLSX_MAX_ROWS:
+                sheets += 1
+                sheet = workbook.create_sheet(sheet_title if sheets == 1 else f"{sheet_title} {sheets}")
+                sheet.append(columns)
+                sheet_rows = 0
+            sheet.append(row)
+            sheet_rows += 1
+        rows_written += len(rows)
+
+    if sheet is None:
+        workbook.create_sheet(sheet_title).append(columns)
+    workbook.save(path)
+    return rows_written
+
+
+def export_report(conn, path: str, kind: str, year: int, month: Optional[int] = None,
+                  labor_name: Optional[str] = None, fmt: Optional[str] = None,
+                  chunk_rows: int = EXPORT_CHUNK_ROWS) -> Dict:
+    """Stream a summary or detailed report into path (.xlsx or .csv, from the extension unless fmt is given)
+
+    Values keep their database types (dates, exact numerics). The file is
+    written next to path and renamed into place once complete.
+    """
+    if kind not in REPORT_KINDS:
+        raise ValueError(f"Unknown report kind {kind!r}; expected one of {REPORT_KINDS}")
+    fmt = (fmt or os.path.splitext(path)[1].lstrip('.') or 'xlsx').lower()
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format {fmt!r}; expected one of {EXPORT_FORMATS}")
+
+    build_query = detailed_export_query if kind == 'detailed' else summary_export_query
+    columns, query, params = build_query(year, month, labor_name)
+    chunks = iter_query_chunks(conn, query, params, chunk_rows, cursor_name='report_export')
+
+    partial_path = f"{path}.part"
+    try:
+        if fmt == 'csv':
+            rows = write_csv(partial_path, columns, chunks)
+        else:
+            rows = write_xlsx(partial_path, columns, chunks, sheet_title=f"{kind.title()} Report")
+        os.replace(partial_path, path)
+    except BaseException:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+        raise
+
+    logger.info(f"Exported {rows} {kind} report rows for {year}{f'-{month:02d}' if month else ''} to {path}")
+    return {'path': path, 'kind': kind, 'format': fmt, 'rows': rows}
+
+
+def filename_slug(name: str) -> str:
+    """name reduced to letters, digits, '.', '_' and '-', safe as part of a file name (no '/' or leading dots)"""
+    return re.sub(r'[^A-Za-z0-9._-]+', '_', name).strip('._') or 'employee'
+
+
+def export_filename(kind: str, year: int, month: Optional[int] = None, fmt: str = 'xlsx',
+                    labor_name: Optional[str] = None) -> str:
+    """Default file name for an export, e.g. detailed_report_2025-03.xlsx"""
+    period = f"{year}-{month:02d}" if month else str(year)
+    who = f"_{filename_slug(labor_name)}" if labor_name else ''
+    return f"{kind}_report_{period}{who}.{fmt}"
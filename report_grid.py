@@ -0,0 +1,203 @@
+"""
+Virtual Report Grid
+Treeview-based report view that only builds widgets for the rows on screen
+"""
+
+from tkinter import ttk
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# Rows materialized below the visible area, so partly visible rows are filled in
+BUFFER_ROWS = 5
+
+# Used until the first row has been drawn and can be measured
+DEFAULT_ROW_HEIGHT = 20
+
+SORT_ARROWS = {False: ' ▲', True: ' ▼'}
+
+
+class ReportData:
+    """A report kept as column arrays plus a display order"""
+
+    def __init__(self, df: Optional[pd.DataFrame] = None):
+        self.frame = df.reset_index(drop=True) if df is not None else pd.DataFrame()
+        self.columns: List[str] = [str(column) for column in self.frame.columns]
+        self._values: Dict[str, np.ndarray] = {
+            name: self.frame[column].to_numpy() for name, column in zip(self.columns, self.frame.columns)
+        }
+        self._sort_keys: Dict[str, np.ndarray] = {}
+        self.order = np.arange(len(self.frame))
+        self.sort_column: Optional[str] = None
+        self.descending = False
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+    def rows(self, start: int, stop: int) -> List[tuple]:
+        """Display rows start..stop-1, gathered from the column arrays"""
+        indices = self.order[start:stop]
+        return list(zip(*(self._values[column][indices] for column in self.columns)))
+
+    def sort(self, column: str, descending: bool = False):
+        """Reorder by one column (stable, so ties keep their current relative order)"""
+        key = self._sort_key(column)[self.order]
+        if descending:
+            # Stable descending: argsort the reversed keys, then map back and reverse
+            positions = (len(key) - 1 - np.argsort(key[::-1], kind='stable'))[::-1]
+        else:
+            positions = np.argsort(key, kind='stable')
+        self.order = self.order[positions]
+        self.sort_column = column
+        self.descending = descending
+
+    def _sort_key(self, column: str) -> np.ndarray:
+        """Sortable array for a column: numbers as floats, anything else as text"""
+        key = self._sort_keys.get(column)
+        if key is None:
+            values = self._values[column]
+            if values.dtype.kind in 'biufM':
+                key = values
+            else:
+                try:
+                    key = pd.to_numeric(pd.Series(values), errors='raise').to_numpy(dtype=float)
+                except (TypeError, ValueError):
+                    key = pd.Series(values).astype(str).to_numpy(dtype=str)
+            self._sort_keys[column] = key
+        return key
+
+    def to_frame(self) -> pd.DataFrame:
+        """The report in its current display order"""
+        return self.frame.take(self.order).reset_index(drop=True)
+
+
+class VirtualReportGrid(ttk.Frame):
+    """Scrollable report table backed by ReportData
+
+    The Treeview only ever holds the visible rows plus BUFFER_ROWS; scrolling
+    refills those items from the column arrays. Clicking a heading sorts by
+    that column (again to reverse).
+    """
+
+    def __init__(self, parent, height: int = 20, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.data = ReportData()
+        self._offset = 0
+        self._visible_rows = height
+        self._row_height = DEFAULT_ROW_HEIGHT
+        self._items: List[str] = []
+
+        self.tree = ttk.Treeview(self, show='headings', height=height)
+        scrollbar_x = ttk.Scrollbar(self, orient='horizontal', command=self.tree.xview)
+        self.scrollbar_y = ttk.Scrollbar(self, orient='vertical', command=self.yview)
+        self.tree.configure(xscrollcommand=scrollbar_x.set)
+
+        scrollbar_x.pack(side='bottom', fill='x')
+        self.scrollbar_y.pack(side='right', fill='y')
+        self.tree.pack(side='left', fill='both', expand=True)
+
+        self.tree.bind('<Configure>', self._on_resize)
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda event: self._scroll_by(-3))
+        self.tree.bind('<Button-5>', lambda event: self._scroll_by(3))
+        self.tree.bind('<Prior>', lambda event: self._scroll_by(-self._visible_rows))
+        self.tree.bind('<Next>', lambda event: self._scroll_by(self._visible_rows))
+        self.tree.bind('<Home>', lambda event: self._scroll_to(0))
+        self.tree.bind('<End>', lambda event: self._scroll_to(len(self.data)))
+
+    def show(self, df: pd.DataFrame):
+        """Replace the grid contents with a DataFrame"""
+        self.data = ReportData(df)
+        self.tree.delete(*self._items)
+        self._items = []
+
+        self.tree['columns'] = self.data.columns
+        for column in self.data.columns:
+            self.tree.heading(column, text=column, command=lambda c=column: self.sort_by(c))
+            self.tree.column(column, width=100)
+
+        self._offset = 0
+        self._render()
+
+    def clear(self):
+        self.show(pd.DataFrame())
+
+    def sort_by(self, column: str):
+        """Sort by a column; sorting by the same column again reverses the order"""
+        descending = self.data.sort_column == column and not self.data.descending
+        self.data.sort(column, descending)
+
+        for name in self.data.columns:
+            arrow = SORT_ARROWS[descending] if name == column else ''
+            self.tree.heading(name, text=name + arrow)
+        self._render()
+
+    def to_frame(self) -> pd.DataFrame:
+        """The displayed report, in display order"""
+        return self.data.to_frame()
+
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')"""
+        if not args:
+            return
+        if args[0] == 'moveto':
+            self._scroll_to(int(float(args[1]) * len(self.data)))
+        elif args[0] == 'scroll':
+            step = self._visible_rows if args[2] == 'pages' else 1
+            self._scroll_by(int(args[1]) * step)
+
+    def _scroll_by(self, rows: int):
+        self._scroll_to(self._offset + rows)
+        return 'break'
+
+    def _scroll_to(self, offset: int):
+        offset = max(0, min(offset, len(self.data) - self._visible_rows))
+        if offset != self._offset:
+            self._offset = offset
+            self._render()
+        return 'break'
+
+    def _on_mousewheel(self, event):
+        # Windows reports multiples of 120 per notch, macOS small integers
+        notches = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        return self._scroll_by(-3 * notches)
+
+    def _on_resize(self, event):
+        if self._items:
+            bbox = self.tree.bbox(self._items[0])
+            if bbox:
+                self._row_height = bbox[3]
+                header_height = bbox[1]
+            else:
+                header_height = self._row_height
+        else:
+            header_height = self._row_height
+
+        visible_rows = max(1, (event.height - header_height) // self._row_height)
+        if visible_rows != self._visible_rows:
+            self._visible_rows = visible_rows
+            self._offset = max(0, min(self._offset, len(self.data) - visible_rows))
+            self._render()
+
+    def _render(self):
+        """Fill the item pool with the rows at the current offset"""
+        rows = self.data.rows(self._offset, self._offset + self._visible_rows + BUFFER_ROWS)
+
+        while len(self._items) < len(rows):
+            self._items.append(self.tree.insert('', 'end'))
+        if len(self._items) > len(rows):
+            self.tree.delete(*self._items[len(rows):])
+            del self._items[len(rows):]
+
+        for item, values in zip(self._items, rows):
+            self.tree.item(item, values=values)
+
+        # The pool itself never scrolls; the offset does
+        self.tree.yview_moveto(0)
+
+        total = len(self.data)
+        if total:
+            self.scrollbar_y.set(self._offset / total, min(1.0, (self._offset + self._visible_rows) / total))
+        else:
+            self.scrollbar_y.set(0, 1)
@@ -0,0 +1,77 @@
+"""
+Report Streaming
+Reads salary_records through server-side (named) cursors in batches instead of all at once
+"""
+
+import os
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from period_queries import Period
+
+# Rows fetched per round trip; override with REPORT_ITERSIZE
+DEFAULT_ITERSIZE = int(os.getenv('REPORT_ITERSIZE', '5000'))
+
+DETAILED_COLUMNS = (
+    'labor_name', 'date', 'day_type', 'daily_wage', 'hours_worked', 'regular_hours',
+    'overtime_hours', 'overtime_rate', 'weekend_bonus', 'holiday_bonus',
+    'other_allowances', 'deductions', 'total_salary'
+)
+
+# salary_records columns sent to the CRM, in payload order
+CRM_SALARY_COLUMNS = (
+    'labor_name', 'date', 'day_type', 'daily_wage', 'hours_worked', 'overtime_hours',
+    'weekend_bonus', 'holiday_bonus', 'other_allowances', 'deductions', 'total_salary'
+)
+
+
+def detailed_report_query(period: Period, labor_name: Optional[str] = None,
+                          columns: Sequence[str] = DETAILED_COLUMNS) -> Tuple[str, List]:
+    """SQL and parameters for daily salary rows in a period, ordered by date and laborer"""
+    period_filter, params = period.predicate()
+    query = f"""
+        SELECT {', '.join(columns)}
+        FROM salary_records
+        WHERE {period_filter}
+    """
+    params = list(params)
+    if labor_name:
+        query += " AND labor_name = %s"
+        params.append(labor_name)
+    query += " ORDER BY date, labor_name"
+    return query, params
+
+
+def iter_query_chunks(conn, query: str, params=None, itersize: int = DEFAULT_ITERSIZE,
+                      cursor_name: str = 'report_stream') -> Iterator[List[tuple]]:
+    """Run a query on a named (server-side) cursor and yield its rows in batches of itersize
+
+    Needs a connection that is not in autocommit mode; the cursor lives until
+    the caller's transaction ends, so finish (or close) the iterator before
+    committing or rolling back.
+    """
+    with conn.cursor(name=cursor_name) as cursor:
+        cursor.itersize = itersize
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(itersize)
+            if not rows:
+                break
+            yield rows
+
+
+def iter_detailed_records(conn, period: Period, labor_name: Optional[str] = None,
+                          columns: Sequence[str] = DETAILED_COLUMNS,
+                          itersize: int = DEFAULT_ITERSIZE) -> Iterator[List[tuple]]:
+    """Daily salary rows for a period as batches of tuples (dates and Decimals as stored)"""
+    query, params = detailed_report_query(period, labor_name, columns)
+    return iter_query_chunks(conn, query, params, itersize, cursor_name='detailed_report')
+
+
+def iter_detailed_frames(conn, period: Period, labor_name: Optional[str] = None,
+                         columns: Sequence[str] = DETAILED_COLUMNS,
+                         itersize: int = DEFAULT_ITERSIZE) -> Iterator[pd.DataFrame]:
+    """Daily salary rows for a period as DataFrame chunks, typed like pd.read_sql_query's output"""
+    for rows in iter_detailed_records(conn, period, labor_name, columns, itersize):
+        yield pd.DataFrame.from_records(rows, columns=list(columns), coerce_float=True)
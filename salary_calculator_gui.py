@@ -14,6 +14,9 @@ from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib import colors
 from reportlab.lib.units import inch
 import webbrowser
+from holiday_calendar import load_calendar
+from payroll_engine import calculate_monthly_salary
+from report_grid import VirtualReportGrid
 
 class LaborSalaryCalculatorGUI:
     def __init__(self, root):
@@ -274,15 +277,9 @@ class LaborSalaryCalculatorGUI:
         report_frame = ttk.LabelFrame(self.reports_tab, text="Report Results")
         report_frame.pack(fill='both', expand=True, padx=10, pady=10)
 
-        self.report_tree = ttk.Treeview(report_frame, show='headings', height=20)
-
-        scrollbar_x = ttk.Scrollbar(report_frame, orient='horizontal', command=self.report_tree.xview)
-        scrollbar_y = ttk.Scrollbar(report_frame, orient='vertical', command=self.report_tree.yview)
-        self.report_tree.configure(xscrollcommand=scrollbar_x.set, yscrollcommand=scrollbar_y.set)
-
-        self.report_tree.pack(side='left', fill='both', expand=True)
-        scrollbar_y.pack(side='right', fill='y')
-        scrollbar_x.pack(side='bottom', fill='x')
+        # Only the rows on screen become Treeview items; headings sort the report
+        self.report_grid = VirtualReportGrid(report_frame, height=20)
+        self.report_grid.pack(fill='both', expand=True)
 
     def create_certificates_tab(self):
         """Create salary certificates tab"""
@@ -636,39 +633,17 @@ DAY TYPE SUMMARY:
             messagebox.showerror("Error", "Invalid year or month!")
 
     def update_report_tree(self, df):
-        """Update report treeview with dataframe"""
-        # Clear existing columns and data
-        for col in self.report_tree['columns']:
-            self.report_tree.heading(col, text="")
-        self.report_tree.delete(*self.report_tree.get_children())
-
-        # Set new columns
-        self.report_tree['columns'] = list(df.columns)
-        for col in df.columns:
-            self.report_tree.heading(col, text=col)
-            self.report_tree.column(col, width=100)
-
-        # Add data
-        for _, row in df.iterrows():
-            self.report_tree.insert('', 'end', values=tuple(row))
+        """Update report grid with dataframe"""
+        self.report_grid.show(df)
 
     def export_to_excel(self):
         """Export current report to Excel"""
-        # Get data from treeview
-        items = self.report_tree.get_children()
-        if not items:
+        # Whole report in display order, not just the rows on screen
+        df = self.report_grid.to_frame()
+        if df.empty:
             messagebox.showerror("Error", "No data to export!")
             return
 
-        # Get columns and data
-        columns = self.report_tree['columns']
-        data = []
-        for item in items:
-            data.append(self.report_tree.item(item)['values'])
-
-        # Create DataFrame and export
-        df = pd.DataFrame(data, columns=columns)
-
         filename = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
             filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")]
@@ -879,6 +854,7 @@ class EnhancedLaborSalaryCalculator:
             os.makedirs(db_dir, exist_ok=True)
 
         self.init_database()
+        self.reload_holidays()
 
     def init_database(self):
         """Initialize SQLite database"""
@@ -928,9 +904,26 @@ class EnhancedLaborSalaryCalculator:
             )
         ''')
 
+        # Public holidays and company closures
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS holidays (
+                date DATE PRIMARY KEY,
+                name TEXT NOT NULL,
+                kind TEXT NOT NULL DEFAULT 'public' CHECK (kind IN ('public', 'closure'))
+            )
+        ''')
+
         conn.commit()
         conn.close()
 
+    def reload_holidays(self):
+        """Load the holiday calendar from the holiday file and the holidays table"""
+        conn = sqlite3.connect(self.db_name)
+        try:
+            self.holidays = load_calendar(conn.cursor())
+        finally:
+            conn.close()
+
     def add_labor_profile(self, name, base_daily_wage, position="", contact_info="", overtime_rate=1.5):
         """Add labor profile"""
         hourly_rate = base_daily_wage / 8
@@ -959,103 +952,31 @@ class EnhancedLaborSalaryCalculator:
         return df
 
     def get_working_dates(self, year, month, include_weekends=False):
-        """Get working dates for a month"""
-        working_dates = []
-        num_days = calendar.monthrange(year, month)[1]
-
-        for day in range(1, num_days + 1):
-            current_date = datetime.date(year, month, day)
-            is_weekend = current_date.weekday() >= 5
-
-            if include_weekends or not is_weekend:
-                day_type = "Weekend" if is_weekend else "Weekday"
-                working_dates.append({
-                    'date': current_date,
-                    'date_str': current_date.strftime('%Y-%m-%d'),
-                    'day_name': current_date.strftime('%A'),
-                    'day_type': day_type,
-                    'is_weekend': is_weekend,
-                    'is_holiday': False
-                })
-
-        return working_dates
+        """Get working dates for a month (company closures are never worked)"""
+        return self.holidays.working_dates(year, month, include_weekends)
 
     def calculate_monthly_salary(self, labor_name, daily_wage, year, month,
                                 hours_per_day=8, overtime_per_day=0, overtime_rate=1.5,
-                                include_weekends=False, other_allowances=0, deductions=0):
-        """Calculate monthly salary"""
-        working_dates = self.get_working_dates(year, month, include_weekends)
-        daily_salaries = []
-
-        total_regular_pay = 0
-        total_overtime_pay = 0
-        total_weekend_bonus = 0
-        total_holiday_bonus = 0
-
-        hourly_rate = daily_wage / 8
-
-        for date_info in working_dates:
-            # Regular pay
-            regular_pay = daily_wage
-
-            # Overtime pay
-            overtime_pay = overtime_per_day * hourly_rate * overtime_rate
-
-            # Weekend bonus
-            weekend_bonus = daily_wage * 0.5 if date_info['is_weekend'] else 0
-
-            total_daily = regular_pay + overtime_pay + weekend_bonus + other_allowances - deductions
-
-            daily_salaries.append({
-                'labor_name': labor_name,
-                'date': date_info['date'],
-                'date_str': date_info['date_str'],
-                'day_type': date_info['day_type'],
-                'day_name': date_info['day_name'],
-                'daily_wage': daily_wage,
-                'hours_worked': hours_per_day,
-                'regular_hours': min(hours_per_day, 8),
-                'overtime_hours': max(hours_per_day - 8, 0) + overtime_per_day,
-                'overtime_rate': overtime_rate,
-                'regular_pay': regular_pay,
-                'overtime_pay': overtime_pay,
-                'weekend_bonus': weekend_bonus,
-                'holiday_bonus': 0,
-                'other_allowances': other_allowances,
-                'deductions': deductions,
-                'total_salary': total_daily
-            })
-
-            total_regular_pay += regular_pay
-            total_overtime_pay += overtime_pay
-            total_weekend_bonus += weekend_bonus
-
-        total_salary = total_regular_pay + total_overtime_pay + total_weekend_bonus + total_holiday_bonus
-
-        # Day type summary
-        day_type_summary = {}
-        for salary in daily_salaries:
-            day_type = salary['day_type']
-            day_type_summary[day_type] = day_type_summary.get(day_type, 0) + 1
-
-        return {
-            'labor_name': labor_name,
-            'year': year,
-            'month': month,
-            'month_name': calendar.month_name[month],
-            'total_working_days': len(working_dates),
-            'day_type_summary': day_type_summary,
-            'daily_salaries': daily_salaries,
-            'summary': {
-                'total_regular_pay': total_regular_pay,
-                'total_overtime_pay': total_overtime_pay,
-                'total_weekend_bonus': total_weekend_bonus,
-                'total_holiday_bonus': total_holiday_bonus,
-                'total_allowances': other_allowances * len(working_dates),
-                'total_deductions': deductions * len(working_dates),
-                'total_salary': total_salary
-            }
-        }
+                                include_weekends=False, other_allowances=0, deductions=0,
+                                summary_only=False):
+        """Calculate monthly salary (daily breakdown built only when accessed)"""
+        monthly_data = calculate_monthly_salary(
+            labor_name, daily_wage, year, month,
+            hours_per_day=hours_per_day,
+            overtime_per_day=overtime_per_day,
+            overtime_rate=overtime_rate,
+            include_weekends=include_weekends,
+            other_allowances=other_allowances,
+            deductions=deductions,
+            holidays=self.holidays,
+            summary_only=summary_only
+        )
+
+        # The desktop total has never included allowances and deductions
+        summary = monthly_data['summary']
+        summary['total_salary'] = (summary['total_regular_pay'] + summary['total_overtime_pay'] +
+                                   summary['total_weekend_bonus'] + summary['total_holiday_bonus'])
+        return monthly_data
 
     def save_salary_records(self, monthly_data):
         """Save salary records to database"""
@@ -7,7 +7,7 @@ import calendar
 import psycopg2
 from psycopg2 import sql
 import os
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional, Union
 from reportlab.lib.pagesizes import A4
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
@@ -15,21 +15,53 @@ from reportlab.lib import colors
 from reportlab.lib.units import inch
 import webbrowser
 from db_config import DatabaseConfig
+from db_pool import ConnectionPool
+from payroll_engine import PayrollBatch, calculate_monthly_salary, calculate_payroll_batch
+from salary_store import bulk_upsert_salary_records
+from period_queries import Period
+from salary_partitions import ensure_salary_records_schema
+from payroll_summary import ensure_summary_schema, monthly_payroll_total, summary_query
+from holiday_calendar import HOLIDAYS_TABLE_DDL, HolidayCalendar, load_calendar
+from server_payroll import compare_with_engine, generate_month_in_database
+from gui_tasks import BackgroundTasks
+from report_grid import VirtualReportGrid
+from profile_repository import LaborProfile, ProfileRepository, ensure_profile_triggers
+from report_export import export_filename, export_report
+from crm_sync_state import ensure_change_tracking
+from crm_webhooks import ensure_webhook_schema
+from report_stream import DEFAULT_ITERSIZE, DETAILED_COLUMNS, iter_detailed_frames
 
 class PostgresLaborSalaryCalculator:
     def __init__(self, config: DatabaseConfig):
         self.config = config
+        self.pool = ConnectionPool(config)
+        self.holidays = HolidayCalendar()
         self.init_database()
+        self.reload_holidays()
+        # Profiles are served from memory and kept current by NOTIFY triggers
+        self.profiles = ProfileRepository.from_dsn(config.get_connection_string()).start()
 
     def get_connection(self):
-        """Get PostgreSQL database connection"""
+        """Borrow a PostgreSQL connection from the pool (give it back with release_connection)"""
         try:
-            conn = psycopg2.connect(self.config.get_connection_string())
-            return conn
+            return self.pool.getconn()
         except Exception as e:
             print(f"Database connection error: {e}")
             raise
 
+    def release_connection(self, conn):
+        """Return a connection borrowed with get_connection to the pool"""
+        self.pool.putconn(conn)
+
+    def pool_stats(self) -> Dict:
+        """Connection pool usage statistics"""
+        return self.pool.stats()
+
+    def close(self):
+        """Stop the profile listener and close all pooled connections"""
+        self.profiles.stop()
+        self.pool.closeall()
+
     def init_database(self):
         """Initialize PostgreSQL database tables"""
         conn = self.get_connection()
@@ -50,39 +82,21 @@ class PostgresLaborSalaryCalculator:
                 )
             """)
 
-            # Salary records table
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS salary_records (
-                    id SERIAL PRIMARY KEY,
-                    labor_name VARCHAR(255) NOT NULL,
-                    date DATE NOT NULL,
-                    day_type VARCHAR(50) DEFAULT 'Weekday',
-                    daily_wage DECIMAL(10,2) NOT NULL,
-                    hours_worked DECIMAL(4,2) DEFAULT 8.00,
-                    regular_hours DECIMAL(4,2) DEFAULT 8.00,
-                    overtime_hours DECIMAL(4,2) DEFAULT 0.00,
-                    overtime_rate DECIMAL(3,2) DEFAULT 1.50,
-                    weekend_bonus DECIMAL(10,2) DEFAULT 0.00,
-                    holiday_bonus DECIMAL(10,2) DEFAULT 0.00,
-                    other_allowances DECIMAL(10,2) DEFAULT 0.00,
-                    deductions DECIMAL(10,2) DEFAULT 0.00,
-                    total_salary DECIMAL(10,2) NOT NULL,
-                    notes TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(labor_name, date)
-                )
-            """)
+            # Change notifications for the in-memory profile repository
+            ensure_profile_triggers(cursor)
 
-            # Create indexes for better performance
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_salary_records_date
-                ON salary_records (date)
-            """)
+            # Salary records table, range-partitioned by month, with its indexes
+            ensure_salary_records_schema(cursor)
 
-            cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_salary_records_labor_name
-                ON salary_records (labor_name)
-            """)
+            # Per-employee monthly totals maintained by save_salary_records
+            ensure_summary_schema(cursor)
+
+            # Public holidays and company closures
+            cursor.execute(HOLIDAYS_TABLE_DDL)
+
+            # updated_at change tracking and watermarks for the CRM delta sync, and the webhook queue
+            ensure_change_tracking(cursor)
+            ensure_webhook_schema(cursor)
 
             conn.commit()
             print("PostgreSQL database initialized successfully!")
@@ -92,7 +106,7 @@ class PostgresLaborSalaryCalculator:
             conn.rollback()
         finally:
             cursor.close()
-            conn.close()
+            self.release_connection(conn)
 
     def add_labor_profile(self, name: str, base_daily_wage: float, position: str = "",
                          contact_info: str = "", overtime_rate: float = 1.5) -> bool:
@@ -107,9 +121,12 @@ class PostgresLaborSalaryCalculator:
                 INSERT INTO labor_profiles
                 (name, base_daily_wage, hourly_rate, position, contact_info, overtime_rate)
                 VALUES (%s, %s, %s, %s, %s, %s)
+                RETURNING id
             """, (name, base_daily_wage, hourly_rate, position, contact_info, overtime_rate))
+            profile_id = cursor.fetchone()[0]
 
             conn.commit()
+            self.profiles.refresh([profile_id])
             return True
 
         except psycopg2.IntegrityError:
@@ -121,237 +138,207 @@ class PostgresLaborSalaryCalculator:
             return False
         finally:
             cursor.close()
-            conn.close()
+            self.release_connection(conn)
 
     def view_labor_profiles(self) -> pd.DataFrame:
-        """View all labor profiles from PostgreSQL"""
+        """View all labor profiles (from the in-memory repository)"""
+        return self.profiles.to_frame()
+
+    def get_labor_profile(self, name: str) -> Optional[LaborProfile]:
+        """Look up one labor profile by name without a query"""
+        return self.profiles.get(name)
+
+    def reload_holidays(self):
+        """Load the holiday calendar from the holiday file and the holidays table"""
         conn = self.get_connection()
 
         try:
-            query = 'SELECT * FROM labor_profiles ORDER BY name'
-            df = pd.read_sql_query(query, conn)
-            return df
+            with conn.cursor() as cursor:
+                self.holidays = load_calendar(cursor)
         except Exception as e:
-            print(f"Error fetching labor profiles: {e}")
-            return pd.DataFrame()
+            print(f"Error loading holiday calendar: {e}")
         finally:
-            conn.close()
+            self.release_connection(conn)
 
     def get_working_dates(self, year: int, month: int, include_weekends: bool = False) -> List[Dict]:
-        """Get working dates for a month"""
-        working_dates = []
-        num_days = calendar.monthrange(year, month)[1]
-
-        for day in range(1, num_days + 1):
-            current_date = datetime.date(year, month, day)
-            is_weekend = current_date.weekday() >= 5
-
-            if include_weekends or not is_weekend:
-                day_type = "Weekend" if is_weekend else "Weekday"
-                working_dates.append({
-                    'date': current_date,
-                    'date_str': current_date.strftime('%Y-%m-%d'),
-                    'day_name': current_date.strftime('%A'),
-                    'day_type': day_type,
-                    'is_weekend': is_weekend,
-                    'is_holiday': False
-                })
-
-        return working_dates
+        """Get working dates for a month (company closures are never worked)"""
+        return self.holidays.working_dates(year, month, include_weekends)
 
     def calculate_monthly_salary(self, labor_name: str, daily_wage: float, year: int, month: int,
                                 hours_per_day: float = 8, overtime_per_day: float = 0,
                                 overtime_rate: float = 1.5, include_weekends: bool = False,
-                                other_allowances: float = 0, deductions: float = 0) -> Dict:
-        """Calculate monthly salary with detailed breakdown"""
-        working_dates = self.get_working_dates(year, month, include_weekends)
-        daily_salaries = []
-
-        total_regular_pay = 0
-        total_overtime_pay = 0
-        total_weekend_bonus = 0
-        total_holiday_bonus = 0
-
-        hourly_rate = daily_wage / 8
-
-        for date_info in working_dates:
-            # Regular pay (full day wage)
-            regular_pay = daily_wage
-
-            # Overtime pay
-            overtime_pay = overtime_per_day * hourly_rate * overtime_rate
-
-            # Weekend bonus (50% extra for weekends)
-            weekend_bonus = daily_wage * 0.5 if date_info['is_weekend'] else 0
-
-            # Total daily salary
-            total_daily = regular_pay + overtime_pay + weekend_bonus + other_allowances - deductions
-
-            daily_salaries.append({
-                'labor_name': labor_name,
-                'date': date_info['date'],
-                'date_str': date_info['date_str'],
-                'day_type': date_info['day_type'],
-                'day_name': date_info['day_name'],
-                'daily_wage': daily_wage,
-                'hours_worked': hours_per_day,
-                'regular_hours': min(hours_per_day, 8),
-                'overtime_hours': max(hours_per_day - 8, 0) + overtime_per_day,
-                'overtime_rate': overtime_rate,
-                'regular_pay': regular_pay,
-                'overtime_pay': overtime_pay,
-                'weekend_bonus': weekend_bonus,
-                'holiday_bonus': 0,
-                'other_allowances': other_allowances,
-                'deductions': deductions,
-                'total_salary': total_daily
-            })
-
-            total_regular_pay += regular_pay
-            total_overtime_pay += overtime_pay
-            total_weekend_bonus += weekend_bonus
-
-        total_salary = (total_regular_pay + total_overtime_pay + total_weekend_bonus +
-                       total_holiday_bonus + (other_allowances * len(working_dates)) -
-                       (deductions * len(working_dates)))
-
-        # Day type summary
-        day_type_summary = {}
-        for salary in daily_salaries:
-            day_type = salary['day_type']
-            day_type_summary[day_type] = day_type_summary.get(day_type, 0) + 1
-
-        return {
-            'labor_name': labor_name,
-            'year': year,
-            'month': month,
-            'month_name': calendar.month_name[month],
-            'total_working_days': len(working_dates),
-            'day_type_summary': day_type_summary,
-            'daily_salaries': daily_salaries,
-            'summary': {
-                'total_regular_pay': total_regular_pay,
-                'total_overtime_pay': total_overtime_pay,
-                'total_weekend_bonus': total_weekend_bonus,
-                'total_holiday_bonus': total_holiday_bonus,
-                'total_allowances': other_allowances * len(working_dates),
-                'total_deductions': deductions * len(working_dates),
-                'total_salary': total_salary
-            }
-        }
+                                other_allowances: float = 0, deductions: float = 0,
+                                summary_only: bool = False) -> Dict:
+        """Calculate monthly salary; the daily breakdown is built only when accessed
 
-    def save_salary_records(self, monthly_data: Dict) -> bool:
-        """Save salary records to PostgreSQL"""
+        summary_only skips the breakdown entirely when just the totals are needed.
+        """
+        return calculate_monthly_salary(
+            labor_name, daily_wage, year, month,
+            hours_per_day=hours_per_day,
+            overtime_per_day=overtime_per_day,
+            overtime_rate=overtime_rate,
+            include_weekends=include_weekends,
+            other_allowances=other_allowances,
+            deductions=deductions,
+            holidays=self.holidays,
+            summary_only=summary_only
+        )
+
+    def calculate_payroll_batch(self, year: int, month: int, profiles: Optional[pd.DataFrame] = None,
+                                hours_per_day: float = 8, overtime_per_day: float = 0,
+                                include_weekends: bool = False, other_allowances: float = 0,
+                                deductions: float = 0) -> PayrollBatch:
+        """Calculate monthly salaries for many laborers at once (defaults to every profile)"""
+        if profiles is None:
+            profiles = self.view_labor_profiles()
+
+        return calculate_payroll_batch(
+            year, month, profiles,
+            hours_per_day=hours_per_day,
+            overtime_per_day=overtime_per_day,
+            include_weekends=include_weekends,
+            other_allowances=other_allowances,
+            deductions=deductions,
+            holidays=self.holidays
+        )
+
+    def generate_salary_records_in_database(self, year: int, month: int, labor_names: Optional[List[str]] = None,
+                                            hours_per_day: float = 8, overtime_per_day: float = 0,
+                                            include_weekends: bool = False, other_allowances: float = 0,
+                                            deductions: float = 0) -> Dict[str, int]:
+        """Generate a month of salary records inside PostgreSQL (every profile unless labor_names is given)
+
+        Same rules as calculate_payroll_batch, but no daily rows cross the wire.
+        """
         conn = self.get_connection()
-        cursor = conn.cursor()
 
         try:
-            for daily_salary in monthly_data['daily_salaries']:
-                cursor.execute("""
-                    INSERT INTO salary_records
-                    (labor_name, date, day_type, daily_wage, hours_worked, regular_hours,
-                     overtime_hours, overtime_rate, weekend_bonus, holiday_bonus,
-                     other_allowances, deductions, total_salary)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    ON CONFLICT (labor_name, date) DO UPDATE SET
-                    daily_wage = EXCLUDED.daily_wage,
-                    hours_worked = EXCLUDED.hours_worked,
-                    regular_hours = EXCLUDED.regular_hours,
-                    overtime_hours = EXCLUDED.overtime_hours,
-                    overtime_rate = EXCLUDED.overtime_rate,
-                    weekend_bonus = EXCLUDED.weekend_bonus,
-                    holiday_bonus = EXCLUDED.holiday_bonus,
-                    other_allowances = EXCLUDED.other_allowances,
-                    deductions = EXCLUDED.deductions,
-                    total_salary = EXCLUDED.total_salary
-                """, (
-                    daily_salary['labor_name'],
-                    daily_salary['date_str'],
-                    daily_salary['day_type'],
-                    daily_salary['daily_wage'],
-                    daily_salary['hours_worked'],
-                    daily_salary['regular_hours'],
-                    daily_salary['overtime_hours'],
-                    daily_salary['overtime_rate'],
-                    daily_salary['weekend_bonus'],
-                    daily_salary['holiday_bonus'],
-                    daily_salary['other_allowances'],
-                    daily_salary['deductions'],
-                    daily_salary['total_salary']
-                ))
+            with conn.cursor() as cursor:
+                result = generate_month_in_database(
+                    cursor, year, month, self.holidays, labor_names,
+                    hours_per_day=hours_per_day,
+                    overtime_per_day=overtime_per_day,
+                    include_weekends=include_weekends,
+                    other_allowances=other_allowances,
+                    deductions=deductions
+                )
+            conn.commit()
+            return result
+
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release_connection(conn)
+
+    def verify_server_payroll(self, year: int, month: int, profiles: Optional[pd.DataFrame] = None,
+                              **options) -> Dict:
+        """Check that server-side generation matches the Python engine row for row (writes nothing)"""
+        if profiles is None:
+            profiles = self.view_labor_profiles()
+        conn = self.get_connection()
 
+        try:
+            with conn.cursor() as cursor:
+                return compare_with_engine(cursor, year, month, profiles, self.holidays, **options)
+        finally:
+            conn.rollback()
+            self.release_connection(conn)
+
+    def bulk_save_salary_records(self, monthly_data: Union[Dict, PayrollBatch]) -> Dict[str, int]:
+        """Save salary records with COPY into a staging table and a single upsert
+
+        Accepts one laborer's monthly data or a whole-roster PayrollBatch and
+        returns the number of rows staged, inserted and updated, plus the
+        number of monthly summaries refreshed in the same transaction.
+        """
+        conn = self.get_connection()
+
+        try:
+            result = bulk_upsert_salary_records(conn, monthly_data)
             conn.commit()
+            return result
+
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            self.release_connection(conn)
+
+    def save_salary_records(self, monthly_data: Union[Dict, PayrollBatch]) -> bool:
+        """Save salary records to PostgreSQL (one laborer's monthly data or a payroll batch)"""
+        try:
+            self.bulk_save_salary_records(monthly_data)
             return True
 
         except Exception as e:
             print(f"Error saving salary records: {e}")
-            conn.rollback()
             return False
-        finally:
-            cursor.close()
-            conn.close()
 
     def generate_summary_report(self, year: int, month: int) -> pd.DataFrame:
-        """Generate summary report from PostgreSQL"""
+        """Generate summary report from the monthly summary table"""
         conn = self.get_connection()
 
         try:
-            query = """
-                SELECT
-                    labor_name,
-                    COUNT(*) as working_days,
-                    SUM(regular_hours) as total_regular_hours,
-                    SUM(overtime_hours) as total_overtime_hours,
-                    SUM(daily_wage * regular_hours / 8) as total_regular_pay,
-                    SUM(overtime_hours * (daily_wage / 8) * overtime_rate) as total_overtime_pay,
-                    SUM(weekend_bonus) as total_weekend_bonus,
-                    SUM(holiday_bonus) as total_holiday_bonus,
-                    SUM(other_allowances) as total_allowances,
-                    SUM(deductions) as total_deductions,
-                    SUM(total_salary) as total_salary
-                FROM salary_records
-                WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-                GROUP BY labor_name
-                ORDER BY total_salary DESC
-            """
-
-            df = pd.read_sql_query(query, conn, params=[year, month])
+            query, params = summary_query(year, month)
+            df = pd.read_sql_query(query, conn, params=list(params))
             return df
 
         except Exception as e:
             print(f"Error generating summary report: {e}")
             return pd.DataFrame()
         finally:
-            conn.close()
+            self.release_connection(conn)
 
-    def generate_detailed_report(self, year: int, month: int, labor_name: str = None) -> pd.DataFrame:
-        """Generate detailed report from PostgreSQL"""
+    def monthly_payroll_total(self, year: int, month: int) -> float:
+        """Total payroll for one month across all laborers"""
         conn = self.get_connection()
 
         try:
-            query = """
-                SELECT labor_name, date, day_type, daily_wage, hours_worked, regular_hours,
-                       overtime_hours, overtime_rate, weekend_bonus, holiday_bonus,
-                       other_allowances, deductions, total_salary
-                FROM salary_records
-                WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-            """
-            params = [year, month]
-
-            if labor_name:
-                query += ' AND labor_name = %s'
-                params.append(labor_name)
-
-            query += ' ORDER BY date, labor_name'
-
-            df = pd.read_sql_query(query, conn, params=params)
-            return df
+            with conn.cursor() as cursor:
+                return monthly_payroll_total(cursor, year, month)
+        finally:
+            self.release_connection(conn)
+
+    def generate_detailed_report(self, year: int, month: int, labor_name: str = None) -> pd.DataFrame:
+        """Generate detailed report from PostgreSQL"""
+        try:
+            frames = list(self.iter_detailed_report(Period.month(year, month), labor_name))
+            if not frames:
+                return pd.DataFrame(columns=list(DETAILED_COLUMNS))
+            return pd.concat(frames, ignore_index=True)
 
         except Exception as e:
             print(f"Error generating detailed report: {e}")
             return pd.DataFrame()
+
+    def iter_detailed_report(self, period: Period, labor_name: Optional[str] = None,
+                             itersize: int = DEFAULT_ITERSIZE) -> Iterator[pd.DataFrame]:
+        """Stream the detailed report for any period as DataFrame chunks of up to itersize rows
+
+        Rows come from a server-side cursor, so memory stays flat however long
+        the period is. The pooled connection is held until the iterator is
+        exhausted or closed.
+        """
+        conn = self.get_connection()
+
+        try:
+            yield from iter_detailed_frames(conn, period, labor_name, itersize=itersize)
         finally:
-            conn.close()
+            conn.rollback()
+            self.release_connection(conn)
+
+    def export_report(self, path: str, kind: str, year: int, month: Optional[int] = None,
+                      labor_name: Optional[str] = None) -> Dict:
+        """Stream a summary or detailed report from a server-side cursor into an .xlsx or .csv file"""
+        conn = self.get_connection()
+
+        try:
+            return export_report(conn, path, kind, year, month, labor_name)
+        finally:
+            conn.rollback()
+            self.release_connection(conn)
 
     def update_labor_profile(self, profile_id: int, name: str, base_daily_wage: float,
                            position: str, contact_info: str, overtime_rate: float) -> bool:
@@ -370,6 +357,7 @@ class PostgresLaborSalaryCalculator:
             """, (name, base_daily_wage, hourly_rate, position, contact_info, overtime_rate, profile_id))
 
             conn.commit()
+            self.profiles.refresh([profile_id])
             return True
 
         except Exception as e:
@@ -378,7 +366,7 @@ class PostgresLaborSalaryCalculator:
             return False
         finally:
             cursor.close()
-            conn.close()
+            self.release_connection(conn)
 
     def delete_labor_profile(self, profile_id: int) -> bool:
         """Delete labor profile from PostgreSQL"""
@@ -388,6 +376,7 @@ class PostgresLaborSalaryCalculator:
         try:
             cursor.execute('DELETE FROM labor_profiles WHERE id = %s', (profile_id,))
             conn.commit()
+            self.profiles.refresh([profile_id])
             return True
 
         except Exception as e:
@@ -396,7 +385,7 @@ class PostgresLaborSalaryCalculator:
             return False
         finally:
             cursor.close()
-            conn.close()
+            self.release_connection(conn)
 
 class DatabaseConfigDialog:
     """Dialog for configuring database connection"""
@@ -479,7 +468,8 @@ class DatabaseConfigDialog:
 
             calculator = PostgresLaborSalaryCalculator(temp_config)
             conn = calculator.get_connection()
-            conn.close()
+            calculator.release_connection(conn)
+            calculator.close()
 
             messagebox.showinfo("Success", "Database connection successful!")
 
@@ -500,6 +490,10 @@ class DatabaseConfigDialog:
         self.result = self.config
         self.dialog.destroy()
 
+# How often the GUI checks the profile repository for changes made elsewhere
+PROFILE_WATCH_MS = 2000
+
+
 class LaborSalaryCalculatorGUI:
     def __init__(self, root):
         self.root = root
@@ -531,6 +525,14 @@ class LaborSalaryCalculatorGUI:
                 root.destroy()
                 return
 
+        # Parameters of the report on screen, for streaming exports: (kind, year, month, labor_name)
+        self.current_report = None
+
+        # Database calls run in the background; results come back on the Tk thread
+        self.create_status_bar()
+        self.tasks = BackgroundTasks(self.root, on_busy=self.show_busy)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
         # Create notebook for tabs
         self.notebook = ttk.Notebook(root)
         self.notebook.pack(fill='both', expand=True, padx=10, pady=10)
@@ -544,6 +546,39 @@ class LaborSalaryCalculatorGUI:
 
         # Load initial data
         self.refresh_labor_profiles()
+        self.root.after(PROFILE_WATCH_MS, self.watch_profiles)
+
+    def create_status_bar(self):
+        """Create status bar with a busy indicator for background work"""
+        status_frame = ttk.Frame(self.root)
+        status_frame.pack(side='bottom', fill='x', padx=10, pady=(0, 5))
+
+        self.status_label = ttk.Label(status_frame, text="Ready")
+        self.status_label.pack(side='left')
+
+        self.busy_bar = ttk.Progressbar(status_frame, mode='indeterminate', length=120)
+        self.busy_bar.pack(side='right')
+
+    def show_busy(self, pending):
+        """Busy indicator: called with the number of background tasks still running"""
+        if pending:
+            self.status_label.config(text=f"Working... ({pending} pending)")
+            self.busy_bar.start(10)
+            self.root.config(cursor='watch')
+        else:
+            self.status_label.config(text="Ready")
+            self.busy_bar.stop()
+            self.root.config(cursor='')
+
+    def show_error(self, title):
+        """Error callback for background tasks"""
+        return lambda error: messagebox.showerror(title, str(error))
+
+    def on_close(self):
+        """Stop background work and release database connections before exiting"""
+        self.tasks.shutdown()
+        self.calculator.close()
+        self.root.destroy()
 
     def create_dashboard_tab(self):
         """Create dashboard tab with overview"""
@@ -780,15 +815,9 @@ class LaborSalaryCalculatorGUI:
         report_frame = ttk.LabelFrame(self.reports_tab, text="Report Results")
         report_frame.pack(fill='both', expand=True, padx=10, pady=10)
 
-        self.report_tree = ttk.Treeview(report_frame, show='headings', height=20)
-
-        scrollbar_x = ttk.Scrollbar(report_frame, orient='horizontal', command=self.report_tree.xview)
-        scrollbar_y = ttk.Scrollbar(report_frame, orient='vertical', command=self.report_tree.yview)
-        self.report_tree.configure(xscrollcommand=scrollbar_x.set, yscrollcommand=scrollbar_y.set)
-
-        self.report_tree.pack(side='left', fill='both', expand=True)
-        scrollbar_y.pack(side='right', fill='y')
-        scrollbar_x.pack(side='bottom', fill='x')
+        # Only the rows on screen become Treeview items; headings sort the report
+        self.report_grid = VirtualReportGrid(report_frame, height=20)
+        self.report_grid.pack(fill='both', expand=True)
 
     def create_certificates_tab(self):
         """Create salary certificates tab"""
@@ -857,8 +886,15 @@ class LaborSalaryCalculatorGUI:
         cert_frame.columnconfigure(1, weight=1)
         salary_frame.columnconfigure(1, weight=1)
 
+    def watch_profiles(self):
+        """Refresh the profile views when the repository changed (e.g. edited from another client)"""
+        if self.calculator.profiles.version != self.profiles_version:
+            self.refresh_labor_profiles()
+        self.root.after(PROFILE_WATCH_MS, self.watch_profiles)
+
     def refresh_labor_profiles(self):
         """Refresh labor profiles in all comboboxes"""
+        self.profiles_version = self.calculator.profiles.version
         profiles = self.calculator.view_labor_profiles()
         labor_names = profiles['name'].tolist() if not profiles.empty else []
 
@@ -899,11 +935,14 @@ class LaborSalaryCalculatorGUI:
             wage_float = float(wage)
             overtime_float = float(overtime_rate) if overtime_rate else 1.5
 
-            self.calculator.add_labor_profile(name, wage_float, position, contact, overtime_float)
-            self.refresh_labor_profiles()
-            self.clear_profile_form()
-            self.add_activity("Profile Added", f"Added labor profile: {name}")
-            self.update_dashboard()
+            self.tasks.submit(
+                ('add_profile', name), self.calculator.add_labor_profile,
+                name, wage_float, position, contact, overtime_float,
+                on_success=lambda ok: self.profile_changed(
+                    ok, "Profile Added", f"Added labor profile: {name}",
+                    f"Could not add {name}; the name may already exist."),
+                on_error=self.show_error("Error Adding Profile")
+            )
 
         except ValueError:
             messagebox.showerror("Error", "Please enter valid numbers for wage and overtime rate!")
@@ -929,22 +968,17 @@ class LaborSalaryCalculatorGUI:
             return
 
         try:
-            conn = sqlite3.connect(self.calculator.db_name)
-            cursor = conn.cursor()
-
-            cursor.execute('''
-                UPDATE labor_profiles
-                SET name=?, base_daily_wage=?, position=?, contact_info=?, overtime_rate=?
-                WHERE id=?
-            ''', (name, float(wage), position, contact, float(overtime_rate), profile_id))
-
-            conn.commit()
-            conn.close()
+            wage_float = float(wage)
+            overtime_float = float(overtime_rate) if overtime_rate else 1.5
 
-            self.refresh_labor_profiles()
-            self.clear_profile_form()
-            self.add_activity("Profile Updated", f"Updated labor profile: {name}")
-            self.update_dashboard()
+            self.tasks.submit(
+                ('update_profile', profile_id), self.calculator.update_labor_profile,
+                profile_id, name, wage_float, position, contact, overtime_float,
+                on_success=lambda ok: self.profile_changed(
+                    ok, "Profile Updated", f"Updated labor profile: {name}",
+                    f"Could not update {name}."),
+                on_error=self.show_error("Error Updating Profile")
+            )
 
         except ValueError:
             messagebox.showerror("Error", "Please enter valid numbers for wage and overtime rate!")
@@ -962,16 +996,24 @@ class LaborSalaryCalculatorGUI:
         if messagebox.askyesno("Confirm Delete", f"Are you sure you want to delete {profile_name}?"):
             profile_id = item['values'][0]
 
-            conn = sqlite3.connect(self.calculator.db_name)
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM labor_profiles WHERE id=?', (profile_id,))
-            conn.commit()
-            conn.close()
+            self.tasks.submit(
+                ('delete_profile', profile_id), self.calculator.delete_labor_profile, profile_id,
+                on_success=lambda ok: self.profile_changed(
+                    ok, "Profile Deleted", f"Deleted labor profile: {profile_name}",
+                    f"Could not delete {profile_name}."),
+                on_error=self.show_error("Error Deleting Profile")
+            )
 
-            self.refresh_labor_profiles()
-            self.clear_profile_form()
-            self.add_activity("Profile Deleted", f"Deleted labor profile: {profile_name}")
-            self.update_dashboard()
+    def profile_changed(self, ok, activity, details, failure):
+        """Refresh the profile views after a background add/update/delete"""
+        if not ok:
+            messagebox.showerror("Error", failure)
+            return
+
+        self.refresh_labor_profiles()
+        self.clear_profile_form()
+        self.add_activity(activity, details)
+        self.update_dashboard()
 
     def clear_profile_form(self):
         """Clear profile form fields"""
@@ -1011,43 +1053,54 @@ class LaborSalaryCalculatorGUI:
             year = int(self.year_combo.get())
             month = int(self.month_combo.get().split(' - ')[0])
 
-            # Get labor profile for base wage
-            profiles = self.calculator.view_labor_profiles()
-            labor_profile = profiles[profiles['name'] == labor_name].iloc[0]
-            base_wage = labor_profile['base_daily_wage']
-
-            # Determine daily wage
-            if self.custom_wage_var.get():
-                daily_wage = float(self.custom_wage_entry.get())
-            else:
-                daily_wage = base_wage
+            # Custom daily wage overrides the profile's base wage
+            custom_wage = float(self.custom_wage_entry.get()) if self.custom_wage_var.get() else None
 
             include_weekends = self.include_weekends.get()
             overtime_hours = float(self.overtime_hours_entry.get() or 0)
             hours_per_day = float(self.hours_per_day_entry.get() or 8)
-            overtime_rate = labor_profile['overtime_rate']
-
-            # Calculate salary
-            monthly_data = self.calculator.calculate_monthly_salary(
-                labor_name=labor_name,
-                daily_wage=daily_wage,
-                year=year,
-                month=month,
-                hours_per_day=hours_per_day,
-                overtime_per_day=overtime_hours,
-                overtime_rate=overtime_rate,
-                include_weekends=include_weekends
-            )
-
-            # Store for potential saving
-            self.current_calculation = monthly_data
-
-            # Display results
-            self.display_calculation_results(monthly_data)
-            self.add_activity("Salary Calculated", f"Calculated salary for {labor_name} - {calendar.month_name[month]} {year}")
 
         except ValueError as e:
             messagebox.showerror("Error", f"Invalid input: {e}")
+            return
+
+        self.tasks.submit(
+            'calculate', self.calculate_for_profile,
+            labor_name, year, month, custom_wage, hours_per_day, overtime_hours, include_weekends,
+            on_success=self.show_calculation,
+            on_error=self.show_error("Calculation Error")
+        )
+
+    def calculate_for_profile(self, labor_name, year, month, custom_wage, hours_per_day,
+                              overtime_hours, include_weekends):
+        """Look up the laborer's profile and calculate the month (runs in the background)"""
+        labor_profile = self.calculator.get_labor_profile(labor_name)
+        if labor_profile is None:
+            raise ValueError(f"No labor profile named {labor_name}")
+
+        # Determine daily wage
+        daily_wage = custom_wage if custom_wage is not None else labor_profile.base_daily_wage
+
+        return self.calculator.calculate_monthly_salary(
+            labor_name=labor_name,
+            daily_wage=daily_wage,
+            year=year,
+            month=month,
+            hours_per_day=hours_per_day,
+            overtime_per_day=overtime_hours,
+            overtime_rate=labor_profile.overtime_rate,
+            include_weekends=include_weekends
+        )
+
+    def show_calculation(self, monthly_data):
+        """Store and display a finished calculation"""
+        # Store for potential saving
+        self.current_calculation = monthly_data
+
+        # Display results
+        self.display_calculation_results(monthly_data)
+        self.add_activity("Salary Calculated", f"Calculated salary for {monthly_data['labor_name']} - "
+                                               f"{monthly_data['month_name']} {monthly_data['year']}")
 
     def display_calculation_results(self, monthly_data):
         """Display calculation results"""
@@ -1095,8 +1148,19 @@ DAY TYPE SUMMARY:
             messagebox.showerror("Error", "No calculation to save! Please calculate first.")
             return
 
-        self.calculator.save_salary_records(self.current_calculation)
-        self.add_activity("Salary Saved", f"Saved salary for {self.current_calculation['labor_name']}")
+        monthly_data = self.current_calculation
+        labor_name = monthly_data['labor_name']
+
+        # Keyed per laborer and month: double clicks coalesce, other saves are never superseded
+        self.tasks.submit(
+            ('save', labor_name, monthly_data['year'], monthly_data['month']),
+            self.calculator.bulk_save_salary_records, monthly_data,
+            on_success=lambda result: self.salary_saved(labor_name),
+            on_error=self.show_error("Error Saving Salary")
+        )
+
+    def salary_saved(self, labor_name):
+        self.add_activity("Salary Saved", f"Saved salary for {labor_name}")
         self.update_dashboard()
 
     def generate_summary_report(self):
@@ -1107,15 +1171,12 @@ DAY TYPE SUMMARY:
             labor_name = self.report_labor_combo.get()
             labor_name = None if labor_name == 'All' else labor_name
 
-            report = self.calculator.generate_summary_report(year, month)
-
-            if report.empty:
-                messagebox.showinfo("No Data", "No records found for the specified period.")
-                return
-
-            # Update treeview
-            self.update_report_tree(report)
-            self.add_activity("Report Generated", f"Summary report for {calendar.month_name[month]} {year}")
+            # Summary and detailed reports share the tree, so a newer request supersedes an older one
+            self.tasks.submit(
+                'report', self.calculator.generate_summary_report, year, month,
+                on_success=lambda report: self.show_report(report, "Summary", year, month),
+                on_error=self.show_error("Report Error")
+            )
 
         except ValueError:
             messagebox.showerror("Error", "Invalid year or month!")
@@ -1128,62 +1189,54 @@ DAY TYPE SUMMARY:
             labor_name = self.report_labor_combo.get()
             labor_name = None if labor_name == 'All' else labor_name
 
-            report = self.calculator.generate_detailed_report(year, month, labor_name)
-
-            if report.empty:
-                messagebox.showinfo("No Data", "No records found for the specified period.")
-                return
-
-            # Update treeview
-            self.update_report_tree(report)
-            self.add_activity("Report Generated", f"Detailed report for {calendar.month_name[month]} {year}")
+            # Summary and detailed reports share the tree, so a newer request supersedes an older one
+            self.tasks.submit(
+                'report', self.calculator.generate_detailed_report, year, month, labor_name,
+                on_success=lambda report: self.show_report(report, "Detailed", year, month, labor_name),
+                on_error=self.show_error("Report Error")
+            )
 
         except ValueError:
             messagebox.showerror("Error", "Invalid year or month!")
 
+    def show_report(self, report, kind, year, month, labor_name=None):
+        """Display a finished report"""
+        if report.empty:
+            messagebox.showinfo("No Data", "No records found for the specified period.")
+            return
+
+        # Update treeview
+        self.update_report_tree(report)
+        self.current_report = (kind.lower(), year, month, labor_name)
+        self.add_activity("Report Generated", f"{kind} report for {calendar.month_name[month]} {year}")
+
     def update_report_tree(self, df):
-        """Update report treeview with dataframe"""
-        # Clear existing columns and data
-        for col in self.report_tree['columns']:
-            self.report_tree.heading(col, text="")
-        self.report_tree.delete(*self.report_tree.get_children())
-
-        # Set new columns
-        self.report_tree['columns'] = list(df.columns)
-        for col in df.columns:
-            self.report_tree.heading(col, text=col)
-            self.report_tree.column(col, width=100)
-
-        # Add data
-        for _, row in df.iterrows():
-            self.report_tree.insert('', 'end', values=tuple(row))
+        """Update report grid with dataframe"""
+        self.report_grid.show(df)
 
     def export_to_excel(self):
-        """Export current report to Excel"""
-        # Get data from treeview
-        items = self.report_tree.get_children()
-        if not items:
+        """Export the current report straight from the database to Excel or CSV"""
+        if not self.current_report:
             messagebox.showerror("Error", "No data to export!")
             return
 
-        # Get columns and data
-        columns = self.report_tree['columns']
-        data = []
-        for item in items:
-            data.append(self.report_tree.item(item)['values'])
-
-        # Create DataFrame and export
-        df = pd.DataFrame(data, columns=columns)
-
+        kind, year, month, labor_name = self.current_report
         filename = filedialog.asksaveasfilename(
             defaultextension=".xlsx",
-            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")]
+            filetypes=[("Excel files", "*.xlsx"), ("CSV files", "*.csv"), ("All files", "*.*")],
+            initialfile=export_filename(kind, year, month, labor_name=labor_name)
         )
 
         if filename:
-            df.to_excel(filename, index=False)
-            messagebox.showinfo("Success", f"Report exported to {filename}")
-            self.add_activity("Report Exported", f"Exported report to Excel")
+            self.tasks.submit(
+                ('export', filename), self.calculator.export_report, filename, kind, year, month, labor_name,
+                on_success=self.report_exported,
+                on_error=self.show_error("Export Error")
+            )
+
+    def report_exported(self, result):
+        messagebox.showinfo("Success", f"Report exported to {result['path']} ({result['rows']} rows)")
+        self.add_activity("Report Exported", f"Exported {result['kind']} report to {result['format'].upper()}")
 
     def generate_certificate(self):
         """Generate salary certificate PDF"""
@@ -1343,20 +1396,27 @@ DAY TYPE SUMMARY:
             self.activity_tree.delete(self.activity_tree.get_children()[-1])
 
     def update_dashboard(self):
-        """Update dashboard statistics"""
-        profiles = self.calculator.view_labor_profiles()
-        total_laborers = len(profiles)
+        """Update dashboard statistics in the background"""
+        today = datetime.date.today()
+        self.tasks.submit('dashboard', self.load_dashboard_stats, today.year, today.month,
+                          on_success=self.show_dashboard_stats)
 
-        # Calculate this month's payroll
-        current_year = datetime.datetime.now().year
-        current_month = datetime.datetime.now().month
+    def load_dashboard_stats(self, year, month):
+        """Dashboard numbers (runs in the background)"""
+        total_laborers = len(self.calculator.profiles)
 
+        # Calculate this month's payroll
         try:
-            report = self.calculator.generate_summary_report(current_year, current_month)
-            total_payroll = report['total_salary'].sum() if not report.empty else 0
-        except:
+            total_payroll = self.calculator.monthly_payroll_total(year, month)
+        except Exception:
             total_payroll = 0
 
+        return total_laborers, total_payroll
+
+    def show_dashboard_stats(self, stats):
+        """Update dashboard statistics"""
+        total_laborers, total_payroll = stats
+
         self.stats_labels["Total Laborers"].config(text=str(total_laborers))
         self.stats_labels["This Month's Payroll"].config(text=f"AED {total_payroll:,.2f}")
         self.stats_labels["Pending Calculations"].config(text="0")  # Could be enhanced
@@ -0,0 +1,320 @@
+"""
+Salary Records Partitioning
+Monthly range partitions for salary_records: creation, online migration and retention
+"""
+
+import datetime
+import logging
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psycopg2 import sql
+
+from period_queries import Period
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'salary_records'
+
+# Partitions created ahead of the current month
+FUTURE_MONTHS = 3
+
+_PARTITION_NAME = re.compile(r'^salary_records_y(\d{4})m(\d{2})$')
+
+_TABLE_DDL = """
+    CREATE TABLE IF NOT EXISTS {table} (
+        id {id_type},
+        labor_name VARCHAR(255) NOT NULL,
+        date DATE NOT NULL,
+        day_type VARCHAR(50) DEFAULT 'Weekday',
+        daily_wage DECIMAL(10,2) NOT NULL,
+        hours_worked DECIMAL(4,2) DEFAULT 8.00,
+        regular_hours DECIMAL(4,2) DEFAULT 8.00,
+        overtime_hours DECIMAL(4,2) DEFAULT 0.00,
+        overtime_rate DECIMAL(3,2) DEFAULT 1.50,
+        weekend_bonus DECIMAL(10,2) DEFAULT 0.00,
+        holiday_bonus DECIMAL(10,2) DEFAULT 0.00,
+        other_allowances DECIMAL(10,2) DEFAULT 0.00,
+        deductions DECIMAL(10,2) DEFAULT 0.00,
+        total_salary DECIMAL(10,2) NOT NULL,
+        notes TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        CONSTRAINT {table}_pkey PRIMARY KEY (id, date),
+        CONSTRAINT {table}_labor_name_date_key UNIQUE (labor_name, date)
+    ) PARTITION BY RANGE (date)
+"""
+
+# (name suffix, definition); created on the parent and inherited by every partition
+_INDEXES = [
+    ('date', '(date)'),
+    ('labor_name', '(labor_name)'),
+    # Covers the monthly roll-ups (reports, CRM sync) with index-only scans
+    ('date_labor_covering', '(date, labor_name) INCLUDE (hours_worked, overtime_hours, total_salary)'),
+]
+
+_DATA_COLUMNS = (
+    'id', 'labor_name', 'date', 'day_type', 'daily_wage', 'hours_worked', 'regular_hours',
+    'overtime_hours', 'overtime_rate', 'weekend_bonus', 'holiday_bonus', 'other_allowances',
+    'deductions', 'total_salary', 'notes', 'created_at'
+)
+_COLUMN_LIST = ', '.join(_DATA_COLUMNS)
+
+
+def partition_name(year: int, month: int) -> str:
+    """Name of the partition holding one month, e.g. salary_records_y2025m01"""
+    return f"{TABLE}_y{year:04d}m{month:02d}"
+
+
+def is_partitioned(cursor, table: str = TABLE) -> bool:
+    """Whether table exists and is a partitioned (parent) table"""
+    cursor.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)
+        )
+    """, (table,))
+    return cursor.fetchone()[0]
+
+
+def _create_indexes(cursor, table: str):
+    for suffix, definition in _INDEXES:
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_{suffix} ON {table} {definition}")
+
+
+def ensure_salary_records_schema(cursor, months_ahead: int = FUTURE_MONTHS):
+    """Create the partitioned salary_records table, its indexes and upcoming partitions
+
+    An existing unpartitioned table is left as it is (see migrate_to_partitioned).
+    """
+    cursor.execute(_TABLE_DDL.format(table=TABLE, id_type='SERIAL'))
+    _create_indexes(cursor, TABLE)
+
+    if is_partitioned(cursor):
+        ensure_future_partitions(cursor, months_ahead)
+    else:
+        logger.warning("salary_records is not partitioned; "
+                       "run 'python setup_postgres.py --migrate-partitions' to migrate it")
+
+
+def create_month_partition(cursor, year: int, month: int, parent: str = TABLE) -> bool:
+    """Create the partition for one month if it is missing; returns True when created"""
+    period = Period.month(year, month)
+    name = partition_name(year, month)
+
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (name,))
+    if cursor.fetchone()[0]:
+        return False
+
+    cursor.execute(sql.SQL("CREATE TABLE {} PARTITION OF {} FOR VALUES FROM ({}) TO ({})").format(
+        sql.Identifier(name), sql.Identifier(parent),
+        sql.Literal(period.start), sql.Literal(period.end)
+    ))
+    logger.info(f"Created partition {name}")
+    return True
+
+
+def ensure_partitions(cursor, months: Iterable[Tuple[int, int]], parent: str = TABLE) -> List[str]:
+    """Create any missing partitions for (year, month) pairs"""
+    created = []
+    for year, month in sorted(set(months)):
+        if create_month_partition(cursor, year, month, parent):
+            created.append(partition_name(year, month))
+    return created
+
+
+def ensure_future_partitions(cursor, months_ahead: int = FUTURE_MONTHS,
+                             today: Optional[datetime.date] = None) -> List[str]:
+    """Create partitions from the current month up to months_ahead months later"""
+    start = (today or datetime.date.today()).replace(day=1)
+    end = start
+    for _ in range(months_ahead + 1):
+        end = Period.month(end.year, end.month).end
+    return ensure_partitions(cursor, Period(start, end).months())
+
+
+def ensure_partitions_for_staging(cursor, staging_table: str) -> List[str]:
+    """Create partitions for every month present in a staging table (no-op when unpartitioned)"""
+    cursor.execute(sql.SQL("""
+        SELECT DISTINCT EXTRACT(YEAR FROM date)::int, EXTRACT(MONTH FROM date)::int
+        FROM {}
+        WHERE EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))
+          AND to_regclass(%s || to_char(date, '"_y"YYYY"m"MM')) IS NULL
+    """).format(sql.Identifier(staging_table)), (TABLE, TABLE))
+    missing = cursor.fetchall()
+    return ensure_partitions(cursor, missing) if missing else []
+
+
+def list_partitions(cursor) -> List[Dict]:
+    """Monthly partitions currently attached to salary_records, oldest first"""
+    cursor.execute("""
+        SELECT child.relname
+        FROM pg_inherits
+        JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+        WHERE pg_inherits.inhparent = to_regclass(%s)
+    """, (TABLE,))
+
+    partitions = []
+    for (name,) in cursor.fetchall():
+        match = _PARTITION_NAME.match(name)
+        if match:
+            year, month = int(match.group(1)), int(match.group(2))
+            partitions.append({'name': name, 'year': year, 'month': month,
+                               'period': Period.month(year, month)})
+    return sorted(partitions, key=lambda p: (p['year'], p['month']))
+
+
+def detach_partitions_before(cursor, year: int, month: int, drop: bool = False) -> List[str]:
+    """Retention: detach (and optionally drop) partitions for months before year-month"""
+    cutoff = datetime.date(year, month, 1)
+    detached = []
+
+    for partition in list_partitions(cursor):
+        if partition['period'].end > cutoff:
+            continue
+        name = sql.Identifier(partition['name'])
+        cursor.execute(sql.SQL("ALTER TABLE {} DETACH PARTITION {}").format(sql.Identifier(TABLE), name))
+        if drop:
+            cursor.execute(sql.SQL("DROP TABLE {}").format(name))
+        detached.append(partition['name'])
+        logger.info(f"{'Dropped' if drop else 'Detached'} partition {partition['name']}")
+
+    return detached
+
+
+def migrate_to_partitioned(conn, drop_legacy: bool = False) -> Dict:
+    """Online migration of an unpartitioned salary_records table to monthly partitions
+
+    Rows are copied month by month in short transactions while the old table
+    stays readable and writable; a trigger logs rows changed during the copy.
+    The final swap locks out writers only while those logged rows are
+    replayed and the tables are renamed. The old table is kept as
+    salary_records_legacy unless drop_legacy is set.
+    """
+    new_table = f"{TABLE}_new"
+    log_table = f"{TABLE}_migration_log"
+
+    with conn.cursor() as cursor:
+        if is_partitioned(cursor):
+            return {'status': 'already_partitioned'}
+
+        cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (TABLE,))
+        if not cursor.fetchone()[0]:
+            return {'status': 'missing_table'}
+
+        # 1. Capture changes made while the copy runs
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {log_table} (
+                labor_name VARCHAR(255) NOT NULL,
+                date DATE NOT NULL
+            )
+        """)
+        cursor.execute(f"""
+            CREATE OR REPLACE FUNCTION {log_table}_capture() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP <> 'INSERT' THEN
+                    INSERT INTO {log_table} VALUES (OLD.labor_name, OLD.date);
+                END IF;
+                IF TG_OP <> 'DELETE' THEN
+                    INSERT INTO {log_table} VALUES (NEW.labor_name, NEW.date);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql
+        """)
+        cursor.execute(f"DROP TRIGGER IF EXISTS {log_table}_capture ON {TABLE}")
+        cursor.execute(f"""
+            CREATE TRIGGER {log_table}_capture
+            AFTER INSERT OR UPDATE OR DELETE ON {TABLE}
+            FOR EACH ROW EXECUTE FUNCTION {log_table}_capture()
+        """)
+        conn.commit()
+
+        # 2. New partitioned parent sharing the existing id sequence
+        cursor.execute(f"SELECT pg_get_serial_sequence(%s, 'id')", (TABLE,))
+        id_sequence = cursor.fetchone()[0]
+        cursor.execute(_TABLE_DDL.format(
+            table=new_table, id_type=f"INTEGER NOT NULL DEFAULT nextval('{id_sequence}'::regclass)"
+        ))
+        _create_indexes(cursor, new_table)
+
+        cursor.execute(f"SELECT MIN(date), MAX(date) FROM {TABLE}")
+        first_day, last_day = cursor.fetchone()
+        today = datetime.date.today()
+        first_day = min(first_day or today, today)
+        last_day = max(last_day or today, today)
+        months = list(Period.between(first_day, last_day).months())
+        ensure_partitions(cursor, months, parent=new_table)
+        conn.commit()
+
+        # 3. Copy history one month per transaction
+        copied = 0
+        for year, month in months:
+            period_filter, params = Period.month(year, month).predicate()
+            cursor.execute(f"""
+                INSERT INTO {new_table} ({_COLUMN_LIST})
+                SELECT {_COLUMN_LIST} FROM ONLY {TABLE} WHERE {period_filter}
+                ON CONFLICT (labor_name, date) DO NOTHING
+            """, params)
+            copied += cursor.rowcount
+            conn.commit()
+            logger.info(f"Copied {year}-{month:02d} into {new_table} ({cursor.rowcount} rows)")
+
+        # 4. Short exclusive window: replay concurrent changes and swap names
+        cursor.execute(f"LOCK TABLE {TABLE} IN EXCLUSIVE MODE")
+        cursor.execute(f"SELECT DISTINCT labor_name, date FROM {log_table}")
+        changed = cursor.fetchall()
+        if changed:
+            cursor.execute(f"""
+                SELECT DISTINCT EXTRACT(YEAR FROM date)::int, EXTRACT(MONTH FROM date)::int
+                FROM {log_table}
+            """)
+            ensure_partitions(cursor, cursor.fetchall(), parent=new_table)
+            cursor.execute(f"""
+                DELETE FROM {new_table} n
+                USING (SELECT DISTINCT labor_name, date FROM {log_table}) k
+                WHERE n.labor_name = k.labor_name AND n.date = k.date
+            """)
+            cursor.execute(f"""
+                INSERT INTO {new_table} ({_COLUMN_LIST})
+                SELECT {', '.join('s.' + column for column in _DATA_COLUMNS)}
+                FROM ONLY {TABLE} s
+                JOIN (SELECT DISTINCT labor_name, date FROM {log_table}) k
+                  ON s.labor_name = k.labor_name AND s.date = k.date
+            """)
+
+        legacy = f"{TABLE}_legacy"
+        cursor.execute(f"DROP TRIGGER {log_table}_capture ON {TABLE}")
+        cursor.execute(f"ALTER TABLE {TABLE} RENAME TO {legacy}")
+        _rename_relations(cursor, legacy, TABLE, legacy)
+        cursor.execute(f"ALTER TABLE {new_table} RENAME TO {TABLE}")
+        _rename_relations(cursor, TABLE, new_table, TABLE)
+        cursor.execute(f"ALTER SEQUENCE {id_sequence} OWNED BY {TABLE}.id")
+        cursor.execute(f"DROP TABLE {log_table}")
+        cursor.execute(f"DROP FUNCTION {log_table}_capture()")
+        if drop_legacy:
+            cursor.execute(f"DROP TABLE {legacy}")
+        conn.commit()
+
+    logger.info(f"Migrated salary_records to {len(months)} monthly partitions")
+    return {'status': 'migrated', 'partitions': len(months), 'rows_copied': copied,
+            'rows_replayed': len(changed), 'legacy_table': None if drop_legacy else legacy}
+
+
+def _rename_relations(cursor, table: str, old_prefix: str, new_prefix: str):
+    """Rename a table's constraints and indexes from old_prefix to new_prefix"""
+    cursor.execute("""
+        SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s) AND conname LIKE %s
+    """, (table, f"{old_prefix}\\_%"))
+    for (name,) in cursor.fetchall():
+        cursor.execute(sql.SQL("ALTER TABLE {} RENAME CONSTRAINT {} TO {}").format(
+            sql.Identifier(table), sql.Identifier(name),
+            sql.Identifier(new_prefix + name[len(old_prefix):])
+        ))
+
+    cursor.execute("""
+        SELECT indexrelid::regclass::text FROM pg_index
+        WHERE indrelid = to_regclass(%s) AND indexrelid::regclass::text LIKE %s
+    """, (table, f"idx\\_{old_prefix}\\_%"))
+    for (name,) in cursor.fetchall():
+        cursor.execute(sql.SQL("ALTER INDEX {} RENAME TO {}").format(
+            sql.Identifier(name), sql.Identifier(f"idx_{new_prefix}" + name[len(f"idx_{old_prefix}"):])
+        ))
@@ -0,0 +1,126 @@
+"""
+Salary Record Storage
+Bulk writes to salary_records using COPY into a staging table and a set-based upsert
+"""
+
+import csv
+import io
+from typing import Dict, Iterable, Iterator, Tuple, Union
+
+from payroll_engine import PayrollBatch, SALARY_RECORD_COLUMNS, salary_record_rows
+from payroll_summary import lock_staged_summaries, refresh_staged_summaries
+from salary_partitions import ensure_partitions_for_staging
+
+STAGING_TABLE = 'salary_records_staging'
+
+_COLUMN_LIST = ', '.join(SALARY_RECORD_COLUMNS)
+_UPDATE_LIST = ',\n                '.join(
+    f"{column} = EXCLUDED.{column}" for column in SALARY_RECORD_COLUMNS[2:]
+)
+
+
+class _CsvRowStream(io.TextIOBase):
+    """Read-only file object that renders rows as CSV on demand, for COPY FROM STDIN"""
+
+    def __init__(self, rows: Iterable[Tuple]):
+        self._rows = iter(rows)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer, lineterminator='\n')
+        self._pending = ''
+        self.row_count = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self, size: int):
+        while size < 0 or len(self._pending) < size:
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                break
+            self._writer.writerow(row)
+            self.row_count += 1
+            if self._buffer.tell() >= 65536:
+                self._flush_buffer()
+        self._flush_buffer()
+
+    def _flush_buffer(self):
+        self._pending += self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+
+    def read(self, size: int = -1) -> str:
+        self._fill(size)
+        if size < 0:
+            data, self._pending = self._pending, ''
+        else:
+            data, self._pending = self._pending[:size], self._pending[size:]
+        return data
+
+
+def copy_to_staging(cursor, rows: Iterable[Tuple]) -> int:
+    """Stream rows into a transaction-scoped staging table with COPY FROM STDIN"""
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} ON COMMIT DROP AS
+        SELECT {_COLUMN_LIST} FROM salary_records WITH NO DATA
+    """)
+    cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+
+    stream = _CsvRowStream(rows)
+    cursor.copy_expert(
+        f"COPY {STAGING_TABLE} ({_COLUMN_LIST}) FROM STDIN WITH (FORMAT csv)",
+        stream
+    )
+    return stream.row_count
+
+
+def merge_staging(cursor) -> Dict[str, int]:
+    """Upsert the staging table into salary_records and count inserted/updated rows"""
+    # DISTINCT ON keeps the last staged row when the input repeats a (labor_name, date).
+    # Partitioned tables cannot return xmax, so updates are counted as staged keys that
+    # already exist; every CTE sees the same snapshot, taken before the insert.
+    cursor.execute(f"""
+        WITH source AS (
+            SELECT DISTINCT ON (labor_name, date) {_COLUMN_LIST}
+            FROM {STAGING_TABLE}
+            ORDER BY labor_name, date, ctid DESC
+        ),
+        existing AS (
+            SELECT COUNT(*) AS n
+            FROM source s JOIN salary_records r USING (labor_name, date)
+        ),
+        upserted AS (
+            INSERT INTO salary_records ({_COLUMN_LIST})
+            SELECT {_COLUMN_LIST} FROM source
+            ON CONFLICT (labor_name, date) DO UPDATE SET
+                {_UPDATE_LIST}
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM upserted) - n, n FROM existing
+    """)
+    inserted, updated = cursor.fetchone()
+    return {'inserted': inserted, 'updated': updated}
+
+
+def bulk_upsert_salary_records(conn, monthly_data: Union[Dict, PayrollBatch, Iterable[Tuple]]) -> Dict[str, int]:
+    """Write one laborer's monthly data, a PayrollBatch or raw rows in a few round trips
+
+    The affected payroll_monthly_summary rows are refreshed in the same
+    transaction. Runs inside the caller's transaction; the caller commits or
+    rolls back.
+    """
+    if isinstance(monthly_data, (dict, PayrollBatch)):
+        rows: Iterator[Tuple] = salary_record_rows(monthly_data)
+    else:
+        rows = iter(monthly_data)
+
+    with conn.cursor() as cursor:
+        staged = copy_to_staging(cursor, rows)
+        if not staged:
+            return {'staged': 0, 'inserted': 0, 'updated': 0, 'summaries': 0}
+        ensure_partitions_for_staging(cursor, STAGING_TABLE)
+        lock_staged_summaries(cursor, STAGING_TABLE)
+        result = merge_staging(cursor)
+        summaries = refresh_staged_summaries(cursor, STAGING_TABLE)
+
+    return {'staged': staged, **result, 'summaries': summaries}
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark: EXTRACT(YEAR/MONTH) filters vs half-open period predicates
+Seeds a temporary copy of salary_records and compares query plans and timings
+"""
+
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db_config import DatabaseConfig  # noqa: E402
+from period_queries import Period  # noqa: E402
+
+TABLE = 'bench_salary_records'
+
+QUERIES = {
+    'summary report': """
+        SELECT labor_name, COUNT(*), SUM(hours_worked), SUM(overtime_hours), SUM(total_salary)
+        FROM {table} WHERE {where} GROUP BY labor_name
+    """,
+    'detailed report': """
+        SELECT labor_name, date, day_type, daily_wage, total_salary
+        FROM {table} WHERE {where} ORDER BY date, labor_name
+    """,
+}
+
+LEGACY_FILTER = "EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s"
+
+
+def seed(cursor, employees: int, months: int):
+    """Create and fill a temporary salary_records copy with the production indexes"""
+    cursor.execute(f"""
+        CREATE TEMP TABLE {TABLE} (
+            id SERIAL PRIMARY KEY,
+            labor_name VARCHAR(255) NOT NULL,
+            date DATE NOT NULL,
+            day_type VARCHAR(50) DEFAULT 'Weekday',
+            daily_wage DECIMAL(10,2) NOT NULL,
+            hours_worked DECIMAL(4,2) DEFAULT 8.00,
+            overtime_hours DECIMAL(4,2) DEFAULT 0.00,
+            total_salary DECIMAL(10,2) NOT NULL,
+            UNIQUE(labor_name, date)
+        )
+    """)
+    cursor.execute(f"""
+        INSERT INTO {TABLE} (labor_name, date, daily_wage, hours_worked, overtime_hours, total_salary)
+        SELECT 'Employee ' || e, d::date, 100 + e %% 50, 8, e %% 3, 100 + e %% 50 + (e %% 3) * 18.75
+        FROM generate_series(1, %s) AS e,
+             generate_series(date_trunc('month', CURRENT_DATE) - make_interval(months => %s),
+                             CURRENT_DATE, interval '1 day') AS d
+        WHERE EXTRACT(ISODOW FROM d) < 6
+    """, (employees, months))
+    cursor.execute(f"CREATE INDEX ON {TABLE} (date)")
+    cursor.execute(f"""
+        CREATE INDEX ON {TABLE} (date, labor_name)
+        INCLUDE (hours_worked, overtime_hours, total_salary)
+    """)
+    cursor.execute(f"VACUUM ANALYZE {TABLE}")
+
+
+def plan_nodes(plan: dict):
+    """Flatten the node types of an EXPLAIN (FORMAT JSON) plan"""
+    nodes = [plan['Node Type']]
+    for child in plan.get('Plans', []):
+        nodes.extend(plan_nodes(child))
+    return nodes
+
+
+def explain(cursor, query: str, params) -> dict:
+    cursor.execute(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {query}", params)
+    result = cursor.fetchone()[0]
+    result = json.loads(result) if isinstance(result, str) else result
+    return result[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--employees', type=int, default=500)
+    parser.add_argument('--months', type=int, default=36, help='months of history to seed')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    config = DatabaseConfig.from_file()
+    conn = psycopg2.connect(config.get_connection_string())
+    conn.autocommit = True
+    cursor = conn.cursor()
+
+    print(f"Seeding {args.employees} employees x {args.months} months...")
+    started = time.perf_counter()
+    seed(cursor, args.employees, args.months)
+    cursor.execute(f"SELECT COUNT(*) FROM {TABLE}")
+    print(f"  {cursor.fetchone()[0]:,} rows in {time.perf_counter() - started:.1f}s\n")
+
+    last_month = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+    year, month = last_month.year, last_month.month
+    period = Period.month(year, month)
+    period_filter, period_params = period.predicate()
+
+    print(f"{'query':<18} {'filter':<10} {'plan':<45} {'avg ms':>8}")
+    print('-' * 84)
+    for name, template in QUERIES.items():
+        for label, where, params in (
+            ('EXTRACT', LEGACY_FILTER, (year, month)),
+            ('range', period_filter, period_params),
+        ):
+            query = template.format(table=TABLE, where=where)
+            timings = []
+            for _ in range(args.runs):
+                result = explain(cursor, query, params)
+                timings.append(result['Execution Time'])
+            scans = [node for node in plan_nodes(result['Plan']) if 'Scan' in node]
+            print(f"{name:<18} {label:<10} {', '.join(scans):<45} {sum(timings) / len(timings):>8.2f}")
+
+    cursor.close()
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
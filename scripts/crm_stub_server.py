@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Local CRM stub: accepts the sync endpoints with configurable latency and records what it received
+Run it on its own, or with --cycle to time one sync cycle sequentially and concurrently against it
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from crm_async import run_sync_cycle  # noqa: E402
+from crm_sync_state import EMPLOYEES, SALARIES, reset_watermark  # noqa: E402
+from db_config import DatabaseConfig  # noqa: E402
+from db_pool import ConnectionPool  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+
+ENDPOINTS = ('/health', '/employees/sync', '/salaries/sync', '/reports/summary')
+
+
+class StubCRM:
+    """A threaded HTTP server standing in for the CRM API
+
+    latency maps a path to the seconds it sleeps before answering;
+    fail_paths answer 503. Every accepted body is decoded (gzip or plain)
+    and counted per path; max_in_flight is the most requests seen at once.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0,
+                 latency: Optional[Dict[str, float]] = None, fail_paths=()):
+        self.latency = dict(latency or {})
+        self.fail_paths = set(fail_paths)
+        self.requests: Dict[str, int] = {}
+        self.records: Dict[str, int] = {}
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _reply(self, status: int, body: Dict):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _handle(self, body=None):
+                with stub._lock:
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                time.sleep(stub.latency.get(self.path, 0))
+                records = sum(len(value) for value in (body or {}).values() if isinstance(value, list))
+                with stub._lock:
+                    stub.in_flight -= 1
+                    stub.requests[self.path] = stub.requests.get(self.path, 0) + 1
+                    if self.path not in stub.fail_paths:
+                        stub.records[self.path] = stub.records.get(self.path, 0) + records
+                if self.path in stub.fail_paths:
+                    self._reply(503, {'error': 'unavailable'})
+                elif self.path not in ENDPOINTS:
+                    self._reply(404, {'error': 'not found'})
+                else:
+                    self._reply(200, {'status': 'ok', 'received': records})
+
+            def do_GET(self):
+                self._handle()
+
+            def do_POST(self):
+                raw = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    raw = gzip.decompress(raw)
+                self._handle(json.loads(raw or b'{}'))
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> 'StubCRM':
+        self._thread = threading.Thread(target=self.server.serve_forever, name='crm-stub', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def parse_latency(values) -> Dict[str, float]:
+    latency = {}
+    for value in values:
+        path, _, seconds = value.partition('=')
+        latency[path] = float(seconds)
+    return latency
+
+
+def run_cycle(stub: StubCRM, pool: ConnectionPool, concurrency: int, resend: bool, months,
+              report_month=None) -> Dict:
+    if resend:
+        with pool.connection() as conn, conn.cursor() as cursor:
+            reset_watermark(cursor, EMPLOYEES)
+            reset_watermark(cursor, SALARIES)
+            conn.commit()
+
+    client = HttpClient(stub.url)
+    try:
+        result = run_sync_cycle(client, pool.connection, concurrency=concurrency, months=months,
+                                report_month=report_month)
+    finally:
+        client.close()
+    result['db_pool'] = pool.stats()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', action='append', default=[], metavar='PATH=SECONDS',
+                        help='delay before answering PATH, e.g. /salaries/sync=0.2 (repeatable)')
+    parser.add_argument('--fail', action='append', default=[], metavar='PATH', help='answer PATH with 503')
+    parser.add_argument('--cycle', action='store_true',
+                        help='run one sync cycle with concurrency 1 and then --concurrency, and compare')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--month', action='append', default=[], metavar='YYYY-MM',
+                        help='with --cycle, also upload this whole month (repeatable)')
+    parser.add_argument('--report', metavar='YYYY-MM', help='with --cycle, also send the summary report for this month')
+    parser.add_argument('--resend', action='store_true',
+                        help='with --cycle, reset the sync watermarks first so every row is sent')
+    args = parser.parse_args()
+
+    stub = StubCRM(port=args.port, latency=parse_latency(args.latency), fail_paths=args.fail).start()
+    print(f"CRM stub listening on {stub.url}")
+
+    if not args.cycle:
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            stub.stop()
+        return
+
+    pool = ConnectionPool(DatabaseConfig.from_file())
+    months = [tuple(int(part) for part in value.split('-')) for value in args.month]
+    report_month = tuple(int(part) for part in args.report.split('-')) if args.report else None
+
+    print(f"\n{'concurrency':<12} {'cycle s':>8} {'request s':>10} {'slowest s':>10} {'connections':>12}")
+    print('-' * 56)
+    for concurrency in (1, args.concurrency):
+        result = run_cycle(stub, pool, concurrency, args.resend, months, report_month)
+        slowest = max(stats['max_seconds'] for stats in result['latency'].values())
+        print(f"{concurrency:<12} {result['seconds']:>8.2f} {result['request_seconds']:>10.2f} "
+              f"{slowest:>10.2f} {result['http']['connections_opened']:>12}")
+
+    print("\nLast cycle:")
+    for name, step in result['results'].items():
+        print(f"  {name:<15} {json.dumps(step, default=str)}")
+    print("\nPer endpoint:")
+    for path, stats in sorted(result['latency'].items()):
+        print(f"  {path:<18} {stats['calls']:>4} calls  avg {stats['average_seconds']:.3f}s  "
+              f"max {stats['max_seconds']:.3f}s  errors {stats['errors']}")
+    print(f"\nRecords received: {stub.records}")
+    print(f"Database pool: {result['db_pool']}")
+    pool.closeall()
+    stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Parity check: server-side payroll generation vs the Python payroll engine
+Runs a matrix of months and pay options and compares the stored numerics row for row
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import psycopg2
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from db_config import DatabaseConfig  # noqa: E402
+from holiday_calendar import COMPANY_CLOSURE, Holiday, load_calendar  # noqa: E402
+from server_payroll import compare_with_engine  # noqa: E402
+
+SCENARIOS = {
+    'weekdays': {},
+    'weekends': {'include_weekends': True},
+    'overtime': {'hours_per_day': 9.5, 'overtime_per_day': 1.25, 'include_weekends': True},
+    'allowances': {'other_allowances': 7.3, 'deductions': 2.15},
+    'everything': {'hours_per_day': 10, 'overtime_per_day': 0.75, 'include_weekends': True,
+                   'other_allowances': 12.35, 'deductions': 3.333},
+}
+
+MONTHS = [(2024, 2), (2025, 1), (2025, 6), (2025, 12)]
+
+
+def synthetic_profiles(cursor, employees: int, seed: int) -> pd.DataFrame:
+    """Insert made-up profiles (rolled back with the rest of the check)"""
+    rng = np.random.default_rng(seed)
+    profiles = pd.DataFrame({
+        'name': [f"Parity {index:05d}" for index in range(employees)],
+        'base_daily_wage': rng.uniform(50, 999, employees).round(2),
+        'overtime_rate': rng.choice([1.0, 1.25, 1.5, 2.0], employees)
+    })
+    cursor.executemany("""
+        INSERT INTO labor_profiles (name, base_daily_wage, hourly_rate, overtime_rate)
+        VALUES (%s, %s, %s, %s)
+    """, [(row.name, row.base_daily_wage, round(row.base_daily_wage / 8, 2), row.overtime_rate)
+          for row in profiles.itertuples()])
+    return profiles
+
+
+def with_test_holidays(calendar, year: int, month: int):
+    """Add a weekday holiday, a weekend holiday and a closure to the month being checked"""
+    first = datetime.date(year, month, 1)
+    saturday = first + datetime.timedelta(days=(5 - first.weekday()) % 7)
+    calendar.update([
+        Holiday(saturday + datetime.timedelta(days=3), 'Parity weekday holiday'),
+        Holiday(saturday + datetime.timedelta(days=7), 'Parity weekend holiday'),
+        Holiday(saturday + datetime.timedelta(days=12), 'Parity closure', COMPANY_CLOSURE),
+    ])
+    return calendar
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--synthetic', type=int, default=200,
+                        help="employees to generate (0 = use the existing labor_profiles)")
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    config = DatabaseConfig.from_file()
+    conn = psycopg2.connect(config.get_connection_string())
+    cursor = conn.cursor()
+    failures = 0
+
+    try:
+        if args.synthetic:
+            profiles = synthetic_profiles(cursor, args.synthetic, args.seed)
+        else:
+            cursor.execute("SELECT name, base_daily_wage, overtime_rate FROM labor_profiles")
+            profiles = pd.DataFrame(cursor.fetchall(), columns=['name', 'base_daily_wage', 'overtime_rate'])
+
+        print(f"{'month':<9} {'scenario':<12} {'engine':>8} {'server':>8} {'diff':>6}")
+        print('-' * 47)
+        for year, month in MONTHS:
+            holidays = with_test_holidays(load_calendar(cursor), year, month)
+            for name, options in SCENARIOS.items():
+                result = compare_with_engine(cursor, year, month, profiles, holidays, **options)
+                ok = result['mismatches'] == 0 and result['engine_rows'] == result['server_rows']
+                failures += not ok
+                print(f"{year}-{month:02d}  {name:<12} {result['engine_rows']:>8} {result['server_rows']:>8} "
+                      f"{result['mismatches']:>6}  {'PASS' if ok else 'FAIL'}")
+                for example in result['examples'][:4]:
+                    print(f"    {example}")
+    finally:
+        # Synthetic profiles and temporary tables are never kept
+        conn.rollback()
+        cursor.close()
+        conn.close()
+
+    print()
+    print("All scenarios match" if not failures else f"{failures} scenario(s) differ")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
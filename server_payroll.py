@@ -0,0 +1,165 @@
+"""
+Server-side Payroll
+Generates a month's salary_records inside PostgreSQL with one INSERT ... SELECT
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from holiday_calendar import HOLIDAY_BONUS_RATE, HolidayCalendar
+from payroll_engine import SALARY_RECORD_COLUMNS, WEEKEND_BONUS_RATE, calculate_payroll_batch
+from payroll_summary import rebuild_monthly_summaries
+from period_queries import Period
+from salary_partitions import create_month_partition, is_partitioned
+from salary_store import copy_to_staging, STAGING_TABLE
+
+logger = logging.getLogger(__name__)
+
+_COLUMN_LIST = ', '.join(SALARY_RECORD_COLUMNS)
+_UPDATE_LIST = ',\n            '.join(
+    f"{column} = EXCLUDED.{column}" for column in SALARY_RECORD_COLUMNS[2:]
+)
+
+# The arithmetic runs in float8, in the same order as payroll_engine, and every
+# value goes through float8 -> text -> numeric. That is the path Python floats
+# take through COPY, so both engines store identical numerics.
+_MONTH_SELECT = """
+    WITH days AS (
+        SELECT d::date AS date,
+               EXTRACT(ISODOW FROM d) >= 6 AS is_weekend,
+               d::date = ANY(%(holidays)s::date[]) AS is_holiday
+        FROM generate_series(%(start)s::date, %(end)s::date - 1, interval '1 day') AS d
+        WHERE NOT d::date = ANY(%(closures)s::date[])
+    ),
+    profiles AS (
+        SELECT name,
+               base_daily_wage::float8 AS wage,
+               COALESCE(overtime_rate, 1.5)::float8 AS rate
+        FROM labor_profiles
+        WHERE %(labor_names)s::text[] IS NULL OR name = ANY(%(labor_names)s::text[])
+    ),
+    daily AS (
+        SELECT p.name, w.date, p.wage, p.rate,
+               CASE WHEN w.is_holiday THEN 'Holiday'
+                    WHEN w.is_weekend THEN 'Weekend'
+                    ELSE 'Weekday' END AS day_type,
+               %(overtime_per_day)s::float8 * (p.wage / 8) * p.rate AS overtime_pay,
+               CASE WHEN w.is_weekend AND NOT w.is_holiday
+                    THEN p.wage * %(weekend_rate)s::float8 ELSE 0 END AS weekend_bonus,
+               CASE WHEN w.is_holiday
+                    THEN p.wage * %(holiday_rate)s::float8 ELSE 0 END AS holiday_bonus
+        FROM profiles p
+        CROSS JOIN days w
+        WHERE %(include_weekends)s OR NOT w.is_weekend
+    )
+    SELECT name,
+           date,
+           day_type,
+           wage::text::numeric,
+           %(hours_per_day)s::float8::text::numeric,
+           LEAST(%(hours_per_day)s::float8, 8)::text::numeric,
+           (GREATEST(%(hours_per_day)s::float8 - 8, 0) + %(overtime_per_day)s::float8)::text::numeric,
+           rate::text::numeric,
+           weekend_bonus::text::numeric,
+           holiday_bonus::text::numeric,
+           %(other_allowances)s::float8::text::numeric,
+           %(deductions)s::float8::text::numeric,
+           (wage + overtime_pay + weekend_bonus + holiday_bonus
+            + %(other_allowances)s::float8 - %(deductions)s::float8)::text::numeric
+    FROM daily
+"""
+
+
+def month_query_params(year: int, month: int, holidays: Optional[HolidayCalendar] = None,
+                       labor_names: Optional[Iterable[str]] = None, hours_per_day: float = 8,
+                       overtime_per_day: float = 0, include_weekends: bool = False,
+                       other_allowances: float = 0, deductions: float = 0) -> Dict:
+    """Parameters for _MONTH_SELECT; holidays come from the same calendar the Python engine uses"""
+    period = Period.month(year, month)
+    entries = (holidays or HolidayCalendar()).holidays(year)
+    in_month = [holiday for holiday in entries if holiday.date in period]
+
+    return {
+        'start': period.start,
+        'end': period.end,
+        'holidays': [holiday.date for holiday in in_month if holiday.kind != 'closure'],
+        'closures': [holiday.date for holiday in in_month if holiday.kind == 'closure'],
+        'labor_names': list(labor_names) if labor_names is not None else None,
+        'include_weekends': include_weekends,
+        'hours_per_day': float(hours_per_day),
+        'overtime_per_day': float(overtime_per_day),
+        'other_allowances': float(other_allowances),
+        'deductions': float(deductions),
+        'weekend_rate': WEEKEND_BONUS_RATE,
+        'holiday_rate': HOLIDAY_BONUS_RATE
+    }
+
+
+def generate_month_in_database(cursor, year: int, month: int, holidays: Optional[HolidayCalendar] = None,
+                               labor_names: Optional[Iterable[str]] = None, **options) -> Dict[str, int]:
+    """Write a month of salary_records for every (or the named) labor profile without leaving the server
+
+    Runs inside the caller's transaction and refreshes the month's summaries.
+    """
+    if is_partitioned(cursor):
+        create_month_partition(cursor, year, month)
+
+    cursor.execute("SET LOCAL extra_float_digits = 1")
+    params = month_query_params(year, month, holidays, labor_names, **options)
+    cursor.execute(f"""
+        INSERT INTO salary_records ({_COLUMN_LIST})
+        {_MONTH_SELECT}
+        ON CONFLICT (labor_name, date) DO UPDATE SET
+            {_UPDATE_LIST}
+    """, params)
+    rows = cursor.rowcount
+
+    summaries = rebuild_monthly_summaries(cursor, Period.month(year, month))
+    logger.info(f"Generated {rows} salary records for {year}-{month:02d} in the database")
+    return {'rows': rows, 'summaries': summaries}
+
+
+def compare_with_engine(cursor, year: int, month: int, profiles: pd.DataFrame,
+                        holidays: Optional[HolidayCalendar] = None, **options) -> Dict:
+    """Compare server-generated rows with the Python batch engine's rows, as stored numerics
+
+    Both row sets go into temporary tables; nothing is written to salary_records.
+    Run it in a transaction that is rolled back afterwards.
+    """
+    batch = calculate_payroll_batch(year, month, profiles, holidays=holidays, **options)
+    engine_rows = copy_to_staging(cursor, batch.iter_salary_rows())
+
+    cursor.execute("SET LOCAL extra_float_digits = 1")
+    cursor.execute(f"""
+        CREATE TEMP TABLE IF NOT EXISTS server_payroll_check ON COMMIT DROP AS
+        SELECT {_COLUMN_LIST} FROM salary_records WITH NO DATA
+    """)
+    cursor.execute("TRUNCATE server_payroll_check")
+    params = month_query_params(year, month, holidays, profiles['name'].tolist(), **options)
+    cursor.execute(f"INSERT INTO server_payroll_check ({_COLUMN_LIST}) {_MONTH_SELECT}", params)
+    server_rows = cursor.rowcount
+
+    cursor.execute(f"""
+        SELECT 'server' AS source, * FROM (
+            SELECT {_COLUMN_LIST} FROM server_payroll_check
+            EXCEPT ALL
+            SELECT {_COLUMN_LIST} FROM {STAGING_TABLE}
+        ) server_only
+        UNION ALL
+        SELECT 'engine', * FROM (
+            SELECT {_COLUMN_LIST} FROM {STAGING_TABLE}
+            EXCEPT ALL
+            SELECT {_COLUMN_LIST} FROM server_payroll_check
+        ) engine_only
+        ORDER BY 2, 3, 1
+    """)
+    mismatches: List[tuple] = cursor.fetchall()
+
+    return {
+        'engine_rows': engine_rows,
+        'server_rows': server_rows,
+        'mismatches': len(mismatches),
+        'examples': mismatches[:10]
+    }
@@ -8,6 +8,17 @@ import psycopg2
 from psycopg2.extensions import ISOLATION_LEVEL_AUTOCOMMIT
 import sys
 import os
+import argparse
+from salary_partitions import (FUTURE_MONTHS, detach_partitions_before, ensure_salary_records_schema,
+                               is_partitioned, migrate_to_partitioned)
+from payroll_summary import ensure_summary_schema, rebuild_monthly_summaries
+from period_queries import Period
+from holiday_calendar import HOLIDAYS_TABLE_DDL, load_holiday_file
+from profile_repository import ensure_profile_triggers
+from crm_sync_state import ensure_change_tracking
+from crm_upload import ensure_upload_schema
+from crm_webhooks import ensure_webhook_schema
+from month_close import ensure_close_schema
 
 def load_config_from_env():
     """Load database configuration from .env file"""
@@ -107,41 +118,30 @@ def initialize_tables(config):
             )
         """)
         print("✓ Created labor_profiles table")
+        ensure_profile_triggers(cursor)
+        print("✓ Created labor_profiles change notification triggers")
 
-        # Create salary_records table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS salary_records (
-                id SERIAL PRIMARY KEY,
-                labor_name VARCHAR(255) NOT NULL,
-                date DATE NOT NULL,
-                day_type VARCHAR(50) DEFAULT 'Weekday',
-                daily_wage DECIMAL(10,2) NOT NULL,
-                hours_worked DECIMAL(4,2) DEFAULT 8.00,
-                regular_hours DECIMAL(4,2) DEFAULT 8.00,
-                overtime_hours DECIMAL(4,2) DEFAULT 0.00,
-                overtime_rate DECIMAL(3,2) DEFAULT 1.50,
-                weekend_bonus DECIMAL(10,2) DEFAULT 0.00,
-                holiday_bonus DECIMAL(10,2) DEFAULT 0.00,
-                other_allowances DECIMAL(10,2) DEFAULT 0.00,
-                deductions DECIMAL(10,2) DEFAULT 0.00,
-                total_salary DECIMAL(10,2) NOT NULL,
-                notes TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(labor_name, date)
-            )
-        """)
+        # Create salary_records table (partitioned by month) and indexes
+        ensure_salary_records_schema(cursor)
         print("✓ Created salary_records table")
-
-        # Create indexes
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_salary_records_date
-            ON salary_records (date)
-        """)
-        cursor.execute("""
-            CREATE INDEX IF NOT EXISTS idx_salary_records_labor_name
-            ON salary_records (labor_name)
-        """)
         print("✓ Created indexes")
+        if is_partitioned(cursor):
+            print(f"✓ Monthly partitions ready through the next {FUTURE_MONTHS} months")
+
+        # Create payroll_monthly_summary (backfilled from salary_records when new)
+        if ensure_summary_schema(cursor):
+            print("✓ Created payroll_monthly_summary table")
+
+        # Create holidays table (public holidays and company closures)
+        cursor.execute(HOLIDAYS_TABLE_DDL)
+        print("✓ Created holidays table")
+
+        # updated_at change tracking and crm_sync_state watermarks for the CRM delta sync
+        ensure_change_tracking(cursor)
+        ensure_upload_schema(cursor)
+        ensure_webhook_schema(cursor)
+        ensure_close_schema(cursor)
+        print("✓ Created CRM change tracking and webhook queue")
 
         conn.commit()
         cursor.close()
@@ -155,8 +155,149 @@ def initialize_tables(config):
         return False
 
 
+def migrate_partitions(config, drop_legacy=False):
+    """Migrate an existing unpartitioned salary_records table to monthly partitions"""
+    try:
+        conn = psycopg2.connect(
+            host=config['host'],
+            port=config['port'],
+            user=config['user'],
+            password=config['password'],
+            database=config['database']
+        )
+        result = migrate_to_partitioned(conn, drop_legacy=drop_legacy)
+        if result['status'] == 'migrated':
+            # The new table starts without updated_at; its rows are sent to the CRM once more
+            with conn.cursor() as cursor:
+                ensure_change_tracking(cursor)
+            conn.commit()
+        conn.close()
+
+        if result['status'] == 'migrated':
+            print(f"✓ Migrated {result['rows_copied']} rows into {result['partitions']} monthly partitions "
+                  f"({result['rows_replayed']} changed rows replayed)")
+            if result['legacy_table']:
+                print(f"  Old table kept as {result['legacy_table']}; drop it once verified")
+        elif result['status'] == 'already_partitioned':
+            print("✓ salary_records is already partitioned")
+        else:
+            print("✗ salary_records does not exist yet, run setup without flags first")
+            return False
+        return True
+
+    except psycopg2.Error as e:
+        print(f"✗ Error migrating salary_records: {e}")
+        return False
+
+
+def detach_old_partitions(config, before, drop=False):
+    """Detach (or drop) monthly partitions older than YYYY-MM"""
+    try:
+        year, month = (int(part) for part in before.split('-'))
+        conn = psycopg2.connect(
+            host=config['host'],
+            port=config['port'],
+            user=config['user'],
+            password=config['password'],
+            database=config['database']
+        )
+        cursor = conn.cursor()
+        detached = detach_partitions_before(cursor, year, month, drop=drop)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        action = 'Dropped' if drop else 'Detached'
+        print(f"✓ {action} {len(detached)} partition(s) before {year}-{month:02d}")
+        for name in detached:
+            print(f"  - {name}")
+        return True
+
+    except (ValueError, psycopg2.Error) as e:
+        print(f"✗ Error detaching partitions: {e}")
+        return False
+
+
+def rebuild_summary(config, month=None):
+    """Recompute payroll_monthly_summary from salary_records (all months, or one YYYY-MM)"""
+    try:
+        period = None
+        if month:
+            year, month_number = (int(part) for part in month.split('-'))
+            period = Period.month(year, month_number)
+
+        conn = psycopg2.connect(
+            host=config['host'],
+            port=config['port'],
+            user=config['user'],
+            password=config['password'],
+            database=config['database']
+        )
+        cursor = conn.cursor()
+        rows = rebuild_monthly_summaries(cursor, period)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        print(f"✓ Rebuilt {rows} monthly summary row(s){f' for {month}' if month else ''}")
+        return True
+
+    except (ValueError, psycopg2.Error) as e:
+        print(f"✗ Error rebuilding monthly summaries: {e}")
+        return False
+
+
+def import_holidays(config, path):
+    """Load a holiday CSV/JSON file into the holidays table (existing dates are replaced)"""
+    try:
+        holidays = load_holiday_file(path)
+        conn = psycopg2.connect(
+            host=config['host'],
+            port=config['port'],
+            user=config['user'],
+            password=config['password'],
+            database=config['database']
+        )
+        cursor = conn.cursor()
+        cursor.executemany("""
+            INSERT INTO holidays (date, name, kind) VALUES (%s, %s, %s)
+            ON CONFLICT (date) DO UPDATE SET name = EXCLUDED.name, kind = EXCLUDED.kind
+        """, holidays)
+        conn.commit()
+        cursor.close()
+        conn.close()
+
+        print(f"✓ Imported {len(holidays)} holiday(s) from {path}")
+        return True
+
+    except (OSError, ValueError, KeyError, psycopg2.Error) as e:
+        print(f"✗ Error importing holidays: {e}")
+        return False
+
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description="PostgreSQL database setup for Salary Calculator")
+    parser.add_argument('--migrate-partitions', action='store_true',
+                        help="migrate an existing unpartitioned salary_records table to monthly partitions")
+    parser.add_argument('--drop-legacy', action='store_true',
+                        help="with --migrate-partitions, drop the old table after the swap")
+    parser.add_argument('--detach-before', metavar='YYYY-MM',
+                        help="detach salary_records partitions for months before YYYY-MM (retention)")
+    parser.add_argument('--drop-detached', action='store_true',
+                        help="with --detach-before, drop the detached partitions")
+    parser.add_argument('--rebuild-summary', nargs='?', const='all', metavar='YYYY-MM',
+                        help="recompute payroll_monthly_summary from salary_records "
+                             "(every month, or only YYYY-MM)")
+    parser.add_argument('--import-holidays', metavar='FILE',
+                        help="load public holidays and closures from a CSV or JSON file")
+    return parser.parse_args()
+
+
 def main():
     """Main setup function"""
+    args = parse_args()
+
     print("=" * 60)
     print("PostgreSQL Database Setup for Salary Calculator")
     print("=" * 60)
@@ -204,6 +345,31 @@ def main():
         sys.exit(1)
     print()
 
+    if args.migrate_partitions:
+        print("Migrating salary_records to monthly partitions...")
+        if not migrate_partitions(config, drop_legacy=args.drop_legacy):
+            sys.exit(1)
+        print()
+
+    if args.detach_before:
+        print(f"Detaching partitions before {args.detach_before}...")
+        if not detach_old_partitions(config, args.detach_before, drop=args.drop_detached):
+            sys.exit(1)
+        print()
+
+    if args.import_holidays:
+        print("Importing holiday calendar...")
+        if not import_holidays(config, args.import_holidays):
+            sys.exit(1)
+        print()
+
+    if args.rebuild_summary:
+        print("Rebuilding monthly payroll summaries...")
+        month = None if args.rebuild_summary == 'all' else args.rebuild_summary
+        if not rebuild_summary(config, month):
+            sys.exit(1)
+        print()
+
     print("=" * 60)
     print("Setup completed! You can now run the application.")
     print("=" * 60)
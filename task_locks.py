@@ -0,0 +1,290 @@
+"""
+Task Locks
+Single-flight locks for Celery tasks: Redis keys with a TTL and an owner token, or an in-memory stand-in
+"""
+
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional, Union
+
+import redis
+from celery import current_app, current_task
+from celery.exceptions import Retry
+
+logger = logging.getLogger(__name__)
+
+# redis://host:port/db, or memory:// for a lock store local to this process (tests, single-process runs)
+TASK_LOCK_URL = os.getenv('TASK_LOCK_URL') or 'redis://:{password}@{host}:{port}/1'.format(
+    password=os.getenv('REDIS_PASSWORD', ''), host=os.getenv('REDIS_HOST', 'redis'),
+    port=os.getenv('REDIS_PORT', '6379'))
+
+# Seconds a lock outlives the task's hard time limit, so a lock left by a killed worker still expires
+LOCK_TTL_MARGIN = int(os.getenv('TASK_LOCK_TTL_MARGIN', '60'))
+
+KEY_PREFIX = 'task_lock:'
+
+# What a run does when another run holds its lock
+SKIP = 'skip'
+COALESCE = 'coalesce'
+
+
+class LocalLockStore:
+    """In-process stand-in for RedisLockStore with the same semantics; it only sees this process's locks"""
+
+    def __init__(self):
+        self._locks: Dict[str, tuple] = {}
+        self._reruns = set()
+        self._lock = threading.Lock()
+
+    def _holder(self, key: str) -> Optional[str]:
+        held = self._locks.get(key)
+        if held is not None and held[1] <= time.monotonic():
+            del self._locks[key]
+            held = None
+        return held[0] if held else None
+
+    def acquire(self, key: str, token: str, ttl: float, rerun: bool = False) -> Optional[str]:
+        with self._lock:
+            holder = self._holder(key)
+            if holder is None or holder == token:
+                self._locks[key] = (token, time.monotonic() + ttl)
+                return None
+            if rerun:
+                self._reruns.add(key)
+            return holder
+
+    def extend(self, key: str, token: str, ttl: float) -> bool:
+        with self._lock:
+            if self._holder(key) != token:
+                return False
+            self._locks[key] = (token, time.monotonic() + ttl)
+            return True
+
+    def release(self, key: str, token: str) -> Optional[bool]:
+        with self._lock:
+            if self._holder(key) != token:
+                return None
+            del self._locks[key]
+            rerun = key in self._reruns
+            self._reruns.discard(key)
+            return rerun
+
+    def holders(self) -> Dict[str, Dict]:
+        with self._lock:
+            now = time.monotonic()
+            return {key: {'token': token, 'ttl': round(expires - now, 1)}
+                    for key, (token, expires) in self._locks.items() if expires > now}
+
+
+# KEYS: lock, rerun flag; ARGV: token, ttl ms, set the rerun flag if held by another owner
+_ACQUIRE = """
+local holder = redis.call('get', KEYS[1])
+if not holder or holder == ARGV[1] then
+    redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return false
+end
+if ARGV[3] == '1' then
+    redis.call('set', KEYS[2], '1', 'PX', redis.call('pttl', KEYS[1]) + ARGV[2])
+end
+return holder
+"""
+
+_EXTEND = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then return 0 end
+return redis.call('pexpire', KEYS[1], ARGV[2])
+"""
+
+# Returns -1 when the token no longer holds the lock, else whether a rerun was requested
+_RELEASE = """
+if redis.call('get', KEYS[1]) ~= ARGV[1] then return -1 end
+redis.call('del', KEYS[1])
+return redis.call('del', KEYS[2])
+"""
+
+
+class RedisLockStore:
+    """Locks as Redis keys holding the owner's token, set and cleared by Lua scripts so no owner frees another's"""
+
+    def __init__(self, client: redis.Redis):
+        self.client = client
+        self._acquire = client.register_script(_ACQUIRE)
+        self._extend = client.register_script(_EXTEND)
+        self._release = client.register_script(_RELEASE)
+
+    @classmethod
+    def from_url(cls, url: str) -> 'RedisLockStore':
+        return cls(redis.Redis.from_url(url, decode_responses=True, socket_timeout=5))
+
+    def acquire(self, key: str, token: str, ttl: float, rerun: bool = False) -> Optional[str]:
+        """None once token holds the lock for ttl seconds (again, if it already did), else the holder's token"""
+        return self._acquire(keys=[KEY_PREFIX + key, f"{KEY_PREFIX}{key}:rerun"],
+                             args=[token, int(ttl * 1000), int(rerun)])
+
+    def extend(self, key: str, token: str, ttl: float) -> bool:
+        """Reset the TTL of a lock token still holds"""
+        return bool(self._extend(keys=[KEY_PREFIX + key], args=[token, int(ttl * 1000)]))
+
+    def release(self, key: str, token: str) -> Optional[bool]:
+        """Free a lock token holds; None if it no longer does, else whether a rerun was requested meanwhile"""
+        result = self._release(keys=[KEY_PREFIX + key, f"{KEY_PREFIX}{key}:rerun"], args=[token])
+        return None if result < 0 else bool(result)
+
+    def holders(self) -> Dict[str, Dict]:
+        held = {}
+        for name in self.client.scan_iter(f"{KEY_PREFIX}*"):
+            if name.endswith(':rerun'):
+                continue
+            token, ttl = self.client.get(name), self.client.pttl(name)
+            if token is not None:
+                held[name[len(KEY_PREFIX):]] = {'token': token, 'ttl': round(ttl / 1000, 1)}
+        return held
+
+
+_store = None
+_store_pid: Optional[int] = None
+_store_lock = threading.Lock()
+
+
+def get_lock_store() -> Union[LocalLockStore, RedisLockStore]:
+    """This process's lock store for TASK_LOCK_URL (forked workers open their own Redis connections)"""
+    global _store, _store_pid
+    with _store_lock:
+        if _store is None or (_store_pid != os.getpid() and isinstance(_store, RedisLockStore)):
+            _store = LocalLockStore() if TASK_LOCK_URL.startswith('memory://') else RedisLockStore.from_url(TASK_LOCK_URL)
+            _store_pid = os.getpid()
+        return _store
+
+
+class TaskLock:
+    """A single-flight lock held by a task run, and the run to repeat if another was coalesced into it"""
+
+    def __init__(self, key: str, token: str, ttl: float, rerun: Optional[Dict] = None):
+        self.key = key
+        self.token = token
+        self.ttl = ttl
+        self.rerun = rerun
+        self.handed_off = False
+
+    def info(self) -> Dict:
+        """What release_lock needs to free this lock from another task"""
+        return {'key': self.key, 'token': self.token, 'rerun': self.rerun}
+
+    def hand_off(self, ttl: Optional[float] = None):
+        """Keep the lock (for ttl seconds from now) when the task returns; a later task frees it with release_lock"""
+        if ttl:
+            self.extend(ttl)
+        self.handed_off = True
+
+    def extend(self, ttl: float) -> bool:
+        return get_lock_store().extend(self.key, self.token, ttl)
+
+    def release(self) -> bool:
+        return release_lock(self.info())
+
+
+def release_lock(info: Dict) -> bool:
+    """Free a lock from TaskLock.info(), sending the task once more if a run was coalesced into it"""
+    rerun = get_lock_store().release(info['key'], info['token'])
+    if rerun is None:
+        logger.warning(f"Task lock {info['key']} expired before its owner {info['token']} released it")
+        return False
+    if rerun and info['rerun']:
+        logger.info(f"Task lock {info['key']} released; running {info['rerun']['task']} again for a coalesced request")
+        current_app.signature(info['rerun']['task'], args=info['rerun']['args'],
+                              kwargs=info['rerun']['kwargs']).apply_async()
+    return True
+
+
+_current_lock: contextvars.ContextVar = contextvars.ContextVar('task_lock', default=None)
+
+
+def current_lock() -> Optional[TaskLock]:
+    """The lock held by the running single_flight task, if any"""
+    return _current_lock.get()
+
+
+def _task_ttl(task=None) -> float:
+    """The task's hard time limit (the current app's outside a task) plus LOCK_TTL_MARGIN"""
+    app = task.app if task is not None else current_app
+    time_limit = getattr(task, 'time_limit', None) or app.conf.task_time_limit or 3600
+    return time_limit + LOCK_TTL_MARGIN
+
+
+def _retry_seconds(retry: Retry) -> float:
+    if isinstance(retry.when, datetime):
+        when = retry.when if retry.when.tzinfo else retry.when.replace(tzinfo=timezone.utc)
+        return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+    return float(retry.when or 0)
+
+
+def single_flight(key: Union[str, Callable[..., str]], mode: str = SKIP, ttl: Optional[float] = None):
+    """Let one run of the decorated Celery task at a time hold key; put it under @celery.task
+
+    key is a format string over the task's arguments (e.g.
+    'crm_sync:reports:{year}-{month:02d}') or a callable taking them. A run
+    that finds the lock held returns {'status': 'skipped'} naming the running
+    task; with mode=COALESCE it returns {'status': 'coalesced'} instead, and
+    the running task is sent once more after it finishes, however many runs
+    were coalesced into it.
+
+    The owner token is the task id, so a retry (same id) keeps the lock
+    through its countdown. ttl defaults to the task's hard time limit plus
+    LOCK_TTL_MARGIN; it bounds how long a crashed run can block others.
+    Called outside a Celery task (e.g. from a script), the function still
+    takes the lock, under a random token; nothing is rerun for it.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            task = current_task._get_current_object()
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            values = {name: value for name, value in arguments.arguments.items() if name != 'self'}
+            lock_key = key(**values) if callable(key) else key.format(**values)
+
+            name = task.name if task is not None else func.__qualname__
+            request_id, rerun = None, None
+            if task is not None:
+                request = task.request
+                request_id = request.id
+                if mode == COALESCE:
+                    rerun = {'task': task.name, 'args': list(request.args or ()),
+                             'kwargs': dict(request.kwargs or {})}
+            lock = TaskLock(lock_key, request_id or uuid.uuid4().hex, ttl or _task_ttl(task), rerun)
+
+            holder = get_lock_store().acquire(lock.key, lock.token, lock.ttl, rerun=mode == COALESCE)
+            if holder is not None:
+                status = 'coalesced' if mode == COALESCE else 'skipped'
+                logger.info(f"{name} {status}: {lock.key} is held by task {holder}")
+                return {'status': status, 'reason': 'already running', 'lock': lock.key, 'running_task_id': holder}
+
+            context = _current_lock.set(lock)
+            try:
+                result = func(*args, **kwargs)
+            except Retry as retry:
+                # The retry runs under the same task id and takes the lock up again
+                lock.extend(lock.ttl + _retry_seconds(retry))
+                raise
+            except BaseException:
+                lock.release()
+                raise
+            finally:
+                _current_lock.reset(context)
+
+            if not lock.handed_off:
+                lock.release()
+            return result
+
+        wrapper.__signature__ = signature
+        return wrapper
+
+    return decorator
@@ -3,14 +3,32 @@ Celery Tasks for Asynchronous Processing
 Handles CRM synchronization, reports, and maintenance tasks
 """
 
+from celery import chain, chord
 from celery_app import celery
+from celery.signals import worker_process_init, worker_process_shutdown
 import os
-import psycopg2
-import requests
 import logging
+import threading
 from datetime import datetime, timedelta
 from typing import Dict, List
 import subprocess
+from crm_sync_state import (EMPLOYEES, SALARIES, employee_payload, salaries_by_month, summary_payload,
+                            sync_changes, sync_upper_bound)
+from crm_upload import month_shards, post_records, record_month_sync, upload_month
+from report_artifacts import (build_employee_artifacts, cached_artifacts, finish_month_artifacts,
+                              plan_month_artifacts)
+from report_export import export_filename, export_report
+from crm_async import run_sync_cycle
+from crm_webhooks import drain, purge_processed, webhook_metrics
+from db_config import DatabaseConfig
+from db_pool import ConnectionPool
+from http_client import get_http_client, http_metrics
+from month_close import (BACKUP, BACKUP_DIR, CLOSED, CRM, PAYROLL, REPORTS, SUMMARIES, calculate_shard,
+                         clear_checkpoints, completed_stages, ensure_close_schema, get_checkpoint,
+                         materialize_summaries, profile_shards, run_checkpointed, save_checkpoint,
+                         shard_stage, verified_backup)
+from salary_partitions import create_month_partition, detach_partitions_before, ensure_future_partitions, is_partitioned
+from task_locks import COALESCE, TaskLock, current_lock, get_lock_store, release_lock, single_flight
 
 logger = logging.getLogger(__name__)
 
@@ -18,16 +36,65 @@ logger = logging.getLogger(__name__)
 CRM_API_BASE = os.getenv("CRM_API_BASE", "https://crm.jatan.com/api/v1")
 CRM_API_KEY = os.getenv("CRM_API_KEY", "")
 CRM_ENABLED = os.getenv("CRM_ENABLED", "false").lower() == "true"
+EXPORT_DIR = os.getenv("EXPORT_DIR", "/app/exports")
 
-def get_db_connection():
-    """Get PostgreSQL database connection"""
-    return psycopg2.connect(
-        host=os.getenv("DB_HOST", "postgres"),
-        port=os.getenv("DB_PORT", "5432"),
-        dbname=os.getenv("DB_NAME", "labor_salary_db"),
-        user=os.getenv("DB_USER", "salary_admin"),
-        password=os.getenv("DB_PASSWORD", "password"),
-    )
+# Per worker process: a prefork child runs one task at a time, but a sync cycle
+# uses a connection per concurrent step
+WORKER_DB_POOL_MIN = int(os.getenv("WORKER_DB_POOL_MIN", "1"))
+WORKER_DB_POOL_MAX = int(os.getenv("WORKER_DB_POOL_MAX", "4"))
+
+# Single-flight lock shared by the delta syncs: they advance the same watermarks
+CRM_DELTA_LOCK = "crm_sync:delta"
+
+# Locks handed to a whole-month chord: long enough for its shards' retries
+MONTH_JOB_LOCK_TTL = 4 * 3600
+
+# How often a month-close stage checks again for a lock held by the same job run on its own
+STAGE_LOCK_RETRY_SECONDS = 60
+
+_db_pool = None
+_db_pool_lock = threading.Lock()
+
+def worker_db_config() -> DatabaseConfig:
+    """Database settings for the worker (docker-compose service defaults)"""
+    config = DatabaseConfig()
+    config.host = os.getenv("DB_HOST", "postgres")
+    config.database = os.getenv("DB_NAME", "labor_salary_db")
+    config.user = os.getenv("DB_USER", "salary_admin")
+    config.password = os.getenv("DB_PASSWORD", "password")
+    config.pool_min_size = WORKER_DB_POOL_MIN
+    config.pool_max_size = WORKER_DB_POOL_MAX
+    return config
+
+def get_db_pool() -> ConnectionPool:
+    """This worker process's connection pool, created on first use"""
+    global _db_pool
+    with _db_pool_lock:
+        if _db_pool is None:
+            _db_pool = ConnectionPool(worker_db_config())
+        return _db_pool
+
+def db_connection():
+    """Borrow a pooled connection for a with block; it goes back to the pool afterwards"""
+    return get_db_pool().connection()
+
+@worker_process_init.connect
+def open_db_pool(**kwargs):
+    """Open the pool as each worker process starts; a pool inherited from the parent starts over empty"""
+    get_db_pool()
+
+@worker_process_shutdown.connect
+def close_db_pool(**kwargs):
+    global _db_pool
+    with _db_pool_lock:
+        pool, _db_pool = _db_pool, None
+    if pool is not None:
+        logger.info(f"Closing worker database pool: {pool.stats()}")
+        pool.closeall()
+
+def crm_client():
+    """Pooled HTTP client for the CRM API, shared by every task in this worker"""
+    return get_http_client(CRM_API_BASE)
 
 def get_auth_headers() -> Dict[str, str]:
     """Get authentication headers for CRM API"""
@@ -39,56 +106,30 @@ def get_auth_headers() -> Dict[str, str]:
 
 
 @celery.task(name="tasks.sync_employees_to_crm", bind=True, max_retries=3)
+@single_flight(CRM_DELTA_LOCK)
 def sync_employees_to_crm(self):
-    """Sync employee/labor profiles to CRM"""
+    """Sync employee/labor profiles added or edited since the last acknowledged sync to CRM"""
     if not CRM_ENABLED:
         logger.info("CRM sync disabled, skipping employee sync")
         return {"status": "skipped", "reason": "CRM disabled"}
     
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # Get recently added/updated employees
-        cursor.execute("""
-            SELECT id, name, base_daily_wage, position, contact_info, overtime_rate
-            FROM labor_profiles
-            WHERE created_at >= NOW() - INTERVAL '7 days'
-            ORDER BY created_at DESC
-        """)
-        
-        employees = []
-        for row in cursor.fetchall():
-            employees.append({
-                "employee_id": row[0],
-                "name": row[1],
-                "daily_wage": float(row[2]),
-                "position": row[3],
-                "contact": row[4],
-                "overtime_rate": float(row[5])
-            })
-        
-        cursor.close()
-        conn.close()
-        
-        if not employees:
-            logger.info("No new employees to sync")
-            return {"status": "success", "synced": 0}
-        
-        # Send to CRM
-        response = requests.post(
-            f"{CRM_API_BASE}/employees/sync",
-            json={"employees": employees},
-            headers=get_auth_headers(),
-            timeout=30
+    def send(rows):
+        response = post_records(
+            crm_client(), "/employees/sync", {}, "employees",
+            map(employee_payload, rows), headers=get_auth_headers()
         )
-        
-        if response.status_code in [200, 201]:
-            logger.info(f"Synced {len(employees)} employees to CRM")
-            return {"status": "success", "synced": len(employees)}
-        else:
+        if response.status_code not in [200, 201]:
             logger.error(f"CRM sync failed: {response.status_code} - {response.text}")
-            raise Exception(f"CRM API error: {response.status_code}")
+            return False
+        return True
+    
+    try:
+        with db_connection() as conn:
+            result = sync_changes(conn, EMPLOYEES, send)
+        
+        if result["status"] == "failed":
+            raise Exception(f"CRM API rejected an employee batch after {result['synced']} rows")
+        return result
             
     except Exception as e:
         logger.error(f"Employee sync error: {e}")
@@ -96,117 +137,180 @@ def sync_employees_to_crm(self):
         self.retry(exc=e, countdown=60 * (2 ** self.request.retries))
 
 
+def previous_month():
+    now = datetime.now()
+    return (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+
+
+def salary_sync_lock(year: int = None, month: int = None) -> str:
+    return f"crm_sync:salaries:{year}-{month:02d}" if year and month else CRM_DELTA_LOCK
+
+
+def monthly_report_lock(year: int = None, month: int = None, force: bool = False) -> str:
+    return "reports:monthly:%d-%02d" % ((year, month) if year and month else previous_month())
+
+
+@celery.task(name="tasks.release_task_lock")
+def release_task_lock(lock: Dict):
+    """Chain/chord step freeing a single-flight lock handed off by the task that dispatched the workflow"""
+    return release_lock(lock)
+
+
+def take_stage_lock(task, key: str, rerun: Dict = None) -> TaskLock:
+    """Take the single-flight lock a month-close stage shares with a standalone task, for its workflow to release
+
+    While the standalone task (or its chord) holds it, the stage retries
+    every STAGE_LOCK_RETRY_SECONDS for as long as such a lock can live.
+    """
+    lock = TaskLock(key, task.request.id, MONTH_JOB_LOCK_TTL, rerun)
+    holder = get_lock_store().acquire(lock.key, lock.token, lock.ttl)
+    if holder is not None:
+        logger.info(f"{task.name}: {key} is held by task {holder}, retrying in {STAGE_LOCK_RETRY_SECONDS}s")
+        raise task.retry(countdown=STAGE_LOCK_RETRY_SECONDS,
+                         max_retries=MONTH_JOB_LOCK_TTL // STAGE_LOCK_RETRY_SECONDS)
+    return lock
+
+
 @celery.task(name="tasks.sync_salaries_to_crm", bind=True, max_retries=3)
-def sync_salaries_to_crm(year: int, month: int):
-    """Sync salary records for a specific month to CRM"""
+@single_flight(salary_sync_lock)
+def sync_salaries_to_crm(self, year: int = None, month: int = None):
+    """Sync salary records changed since the last acknowledged sync to CRM, or resend one whole month
+    
+    A whole month is split into labor_name shards, uploaded by a group of
+    upload_salary_shard tasks; a chord callback totals them and records the
+    month as synced.
+    """
     if not CRM_ENABLED:
         logger.info("CRM sync disabled, skipping salary sync")
         return {"status": "skipped", "reason": "CRM disabled"}
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT labor_name, date, day_type, daily_wage, hours_worked,
-                   overtime_hours, weekend_bonus, holiday_bonus,
-                   other_allowances, deductions, total_salary
-            FROM salary_records
-            WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-            ORDER BY date, labor_name
-        """, (year, month))
-        
-        salaries = []
-        for row in cursor.fetchall():
-            salaries.append({
-                "employee_name": row[0],
-                "date": row[1].isoformat(),
-                "day_type": row[2],
-                "daily_wage": float(row[3]),
-                "hours_worked": float(row[4]),
-                "overtime_hours": float(row[5]),
-                "weekend_bonus": float(row[6]),
-                "holiday_bonus": float(row[7]),
-                "allowances": float(row[8]),
-                "deductions": float(row[9]),
-                "total_salary": float(row[10])
-            })
+        if year is None or month is None:
+            return sync_salary_changes_to_crm()
         
-        cursor.close()
-        conn.close()
-        
-        if not salaries:
-            logger.info(f"No salaries to sync for {year}-{month:02d}")
-            return {"status": "success", "synced": 0}
-        
-        # Send to CRM
-        response = requests.post(
-            f"{CRM_API_BASE}/salaries/sync",
-            json={
-                "year": year,
-                "month": month,
-                "salaries": salaries
-            },
-            headers=get_auth_headers(),
-            timeout=60
-        )
-        
-        if response.status_code in [200, 201]:
-            logger.info(f"Synced {len(salaries)} salary records to CRM")
-            return {"status": "success", "synced": len(salaries), "year": year, "month": month}
-        else:
-            logger.error(f"Salary sync failed: {response.status_code}")
-            raise Exception(f"CRM API error: {response.status_code}")
+        lock = current_lock()
+        release = release_task_lock.si(lock.info())
+        workflow, shards = month_upload_workflow(year, month, then=release)
+        # The month's lock is freed once the chord has finished, or failed
+        workflow.link_error(release_task_lock.si(lock.info()))
+        job = workflow.apply_async()
+        lock.hand_off(MONTH_JOB_LOCK_TTL)
+        logger.info(f"Dispatched {len(shards)} salary shards for {year}-{month:02d}")
+        return {"status": "dispatched", "year": year, "month": month, "shards": len(shards),
+                "rows": sum(shard["rows"] for shard in shards), "chord_id": job.id}
             
     except Exception as e:
         logger.error(f"Salary sync error: {e}")
         raise
 
 
+def month_upload_workflow(year: int, month: int, then=None):
+    """Chord uploading a month's salary shards, ending in finish_salary_month_sync (then `then`)"""
+    with db_connection() as conn, conn.cursor() as cursor:
+        # Rows written after this may be missed by the shards; the delta sync picks them up
+        as_of = sync_upper_bound(cursor)
+        shards = month_shards(cursor, year, month)
+    
+    body = finish_salary_month_sync.s(year, month, as_of.isoformat())
+    if then is not None:
+        body = body | then
+    return chord([upload_salary_shard.s(year, month, shard) for shard in shards], body), shards
+
+
+def post_salary_chunk(fields: Dict, salaries) -> bool:
+    """Post one chunk of a month upload to CRM"""
+    response = post_records(crm_client(), "/salaries/sync", fields, "salaries", salaries,
+                            headers=get_auth_headers())
+    if response.status_code not in [200, 201]:
+        logger.error(f"Salary chunk {fields['chunk']} for {fields['year']}-{fields['month']:02d} "
+                     f"failed: {response.status_code}")
+        return False
+    return True
+
+
+@celery.task(name="tasks.upload_salary_shard", bind=True, max_retries=5)
+def upload_salary_shard(self, year: int, month: int, shard: Dict):
+    """Upload one labor_name shard of a month; a retry resumes after its last acknowledged chunk"""
+    try:
+        with db_connection() as conn:
+            result = upload_month(conn, post_salary_chunk, year, month, shard=shard)
+        
+        if result["status"] == "failed":
+            raise Exception(f"CRM API rejected chunk {result['chunks']} of shard {shard['shard']} "
+                            f"for {year}-{month:02d}")
+        return {**result, "shard": shard["shard"]}
+            
+    except Exception as e:
+        logger.error(f"Salary shard {shard['shard']} for {year}-{month:02d} error: {e}")
+        raise self.retry(exc=e, countdown=30 * (2 ** self.request.retries))
+
+
+@celery.task(name="tasks.finish_salary_month_sync")
+def finish_salary_month_sync(results: List[Dict], year: int, month: int, as_of: str):
+    """Chord callback: total the shard uploads and record the month's sync watermark"""
+    synced = sum(result["synced"] for result in results)
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            record_month_sync(cursor, year, month, as_of, synced)
+        conn.commit()
+    
+    logger.info(f"Synced {synced} salary records for {year}-{month:02d} in {len(results)} shards")
+    return {
+        "status": "success",
+        "year": year,
+        "month": month,
+        "shards": len(results),
+        "synced": synced,
+        "chunks": sum(result["chunks"] for result in results),
+        "resumed_shards": sum(1 for result in results if result["resumed"]),
+        "as_of": as_of
+    }
+
+
+def post_salaries(year: int, month: int, salaries: List[Dict]) -> bool:
+    """Post one month of salary records to CRM"""
+    response = post_records(
+        crm_client(), "/salaries/sync", {"year": year, "month": month}, "salaries",
+        salaries, headers=get_auth_headers()
+    )
+    if response.status_code not in [200, 201]:
+        logger.error(f"Salary sync failed for {year}-{month:02d}: {response.status_code}")
+        return False
+    return True
+
+
+def sync_salary_changes_to_crm() -> Dict:
+    """Send salary records changed since the salary watermark, one request per month in each batch"""
+    def send(rows):
+        return all(post_salaries(year, month, salaries)
+                   for (year, month), salaries in sorted(salaries_by_month(rows).items()))
+    
+    with db_connection() as conn:
+        result = sync_changes(conn, SALARIES, send)
+    
+    if result["status"] == "failed":
+        raise Exception(f"CRM API rejected a salary batch after {result['synced']} rows")
+    return result
+
+
 @celery.task(name="tasks.sync_reports_to_crm", bind=True, max_retries=3)
-def sync_reports_to_crm(year: int, month: int):
+@single_flight("crm_sync:reports:{year}-{month:02d}")
+def sync_reports_to_crm(self, year: int, month: int):
     """Sync monthly summary report to CRM"""
     if not CRM_ENABLED:
         return {"status": "skipped", "reason": "CRM disabled"}
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT 
-                labor_name,
-                COUNT(*) as working_days,
-                SUM(hours_worked) as total_hours,
-                SUM(overtime_hours) as total_overtime,
-                SUM(total_salary) as total_salary
-            FROM salary_records
-            WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-            GROUP BY labor_name
-            ORDER BY labor_name
-        """, (year, month))
-        
-        summary = []
-        for row in cursor.fetchall():
-            summary.append({
-                "employee_name": row[0],
-                "working_days": row[1],
-                "total_hours": float(row[2]),
-                "total_overtime": float(row[3]),
-                "total_salary": float(row[4])
-            })
-        
-        cursor.close()
-        conn.close()
+        with db_connection() as conn, conn.cursor() as cursor:
+            summary = summary_payload(cursor, year, month)
         
         if not summary:
             return {"status": "success", "synced": 0}
         
-        response = requests.post(
-            f"{CRM_API_BASE}/reports/summary",
+        response = crm_client().post(
+            "/reports/summary",
             json={"year": year, "month": month, "summary": summary},
-            headers=get_auth_headers(),
-            timeout=30
+            headers=get_auth_headers()
         )
         
         if response.status_code in [200, 201]:
@@ -221,6 +325,7 @@ def sync_reports_to_crm(year: int, month: int):
 
 
 @celery.task(name="tasks.periodic_crm_sync")
+@single_flight(CRM_DELTA_LOCK)
 def periodic_crm_sync():
     """Periodic task to sync all data to CRM"""
     if not CRM_ENABLED:
@@ -229,62 +334,147 @@ def periodic_crm_sync():
     
     now = datetime.now()
     
-    # Sync employees
-    sync_employees_to_crm.delay()
-    
-    # Sync current month salaries
-    sync_salaries_to_crm.delay(now.year, now.month)
+    # Health check, employee, salary and report syncs run concurrently in one cycle
+    sync_reports = os.getenv("CRM_SYNC_REPORTS", "false").lower() == "true"
+    result = run_sync_cycle(
+        crm_client(),
+        db_connection,
+        get_auth_headers(),
+        report_month=(now.year, now.month) if sync_reports else None
+    )
     
-    # Sync reports if enabled
-    if os.getenv("CRM_SYNC_REPORTS", "false").lower() == "true":
-        sync_reports_to_crm.delay(now.year, now.month)
+    logger.info(f"Periodic CRM sync completed in {result['seconds']}s")
+    return {"status": "completed", "timestamp": now.isoformat(), **result}
+
+
+@celery.task(name="tasks.process_crm_webhooks")
+def process_crm_webhooks(max_seconds: float = 200):
+    """Apply queued CRM webhook events in coalesced batches"""
+    with db_connection() as conn:
+        result = drain(conn, max_seconds=max_seconds)
+        with conn.cursor() as cursor:
+            result["queue"] = webhook_metrics(cursor)
     
-    logger.info("Periodic CRM sync tasks queued")
-    return {"status": "queued", "timestamp": now.isoformat()}
+    if result["events"]:
+        logger.info(f"Processed {result['events']} CRM webhook events "
+                    f"({result['events_per_second']}/s, max lag {result['max_lag_seconds']}s)")
+    return result
 
 
 @celery.task(name="tasks.generate_monthly_report")
-def generate_monthly_report(year: int = None, month: int = None):
-    """Generate monthly salary report"""
+@single_flight(monthly_report_lock, mode=COALESCE)
+def generate_monthly_report(year: int = None, month: int = None, force: bool = False):
+    """Build the month's report artifacts (summary XLSX, detail CSVs, payslip PDFs), reusing current ones
+    
+    Employees whose files are missing are built by a group of
+    build_report_artifacts tasks; finish_monthly_report writes the summary
+    and manifest.
+    """
     if year is None or month is None:
-        now = datetime.now()
-        year = now.year
-        month = now.month - 1 if now.month > 1 else 12
-        if month == 12:
-            year -= 1
+        year, month = previous_month()
     
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
+        lock = current_lock()
+        release = release_task_lock.si(lock.info())
+        workflow, plan = month_artifacts_workflow(year, month, force, then=release)
+        if workflow is None:
+            logger.info(f"Monthly report for {year}-{month:02d} is current")
+            return {"status": "success", "cached": True, "built": 0, **artifacts_summary(plan["cached"])}
         
-        cursor.execute("""
-            SELECT 
-                labor_name,
-                COUNT(*) as days,
-                SUM(total_salary) as total
-            FROM salary_records
-            WHERE EXTRACT(YEAR FROM date) = %s AND EXTRACT(MONTH FROM date) = %s
-            GROUP BY labor_name
-        """, (year, month))
+        workflow.link_error(release_task_lock.si(lock.info()))
+        job = workflow.apply_async()
+        lock.hand_off(MONTH_JOB_LOCK_TTL)
+        logger.info(f"Generating monthly report for {year}-{month:02d} in {len(plan['pieces'])} pieces")
+        return {"status": "dispatched", "year": year, "month": month, "pieces": len(plan["pieces"]),
+                "content_hash": plan["content_hash"], "chord_id": job.id}
         
-        results = cursor.fetchall()
-        cursor.close()
-        conn.close()
+    except Exception as e:
+        logger.error(f"Report generation error: {e}")
+        raise
+
+
+def month_artifacts_workflow(year: int, month: int, force: bool = False, then=None):
+    """Chord building a month's report artifacts (then `then`), or None when they are current"""
+    with db_connection() as conn, conn.cursor() as cursor:
+        plan = plan_month_artifacts(cursor, year, month, force)
+    if plan["cached"]:
+        return None, plan
+    
+    body = finish_monthly_report.s({key: value for key, value in plan.items() if key not in ("cached", "pieces")})
+    if then is not None:
+        body = body | then
+    return chord([build_report_artifacts.s(year, month, piece) for piece in plan["pieces"]], body), plan
+
+
+@celery.task(name="tasks.build_report_artifacts", bind=True, max_retries=3,
+             soft_time_limit=1800, time_limit=1900)
+def build_report_artifacts(self, year: int, month: int, employees: Dict):
+    """Write detail CSVs and payslip PDFs for a piece of the month's employees"""
+    try:
+        with db_connection() as conn:
+            return build_employee_artifacts(conn, year, month, employees)
+    except Exception as e:
+        logger.error(f"Report artifacts for {year}-{month:02d} error: {e}")
+        raise self.retry(exc=e, countdown=30 * (2 ** self.request.retries))
+
+
+@celery.task(name="tasks.finish_monthly_report", soft_time_limit=1800, time_limit=1900)
+def finish_monthly_report(results: List[Dict], plan: Dict):
+    """Chord callback: write the month's summary XLSX and manifest"""
+    with db_connection() as conn:
+        manifest = finish_month_artifacts(conn, plan)
+    
+    logger.info(f"Generated monthly report for {plan['year']}-{plan['month']:02d}: "
+                f"{sum(result['employees'] for result in results)} employees rebuilt")
+    return {"status": "success", "cached": False, "built": sum(result["employees"] for result in results),
+            **artifacts_summary(manifest)}
+
+
+def artifacts_summary(manifest: Dict) -> Dict:
+    """A manifest without its per-employee file list, small enough for task results and checkpoints"""
+    return {**manifest, "employees": len(manifest["employees"])}
+
+
+def cached_export(year: int, month: int, kind: str, labor_name: str, fmt: str):
+    """Path of a current report artifact matching an export request, if one exists"""
+    if not month or (kind, fmt, bool(labor_name)) not in (("summary", "xlsx", False), ("detailed", "csv", True)):
+        return None
+    with db_connection() as conn, conn.cursor() as cursor:
+        manifest = cached_artifacts(cursor, year, month)
+    if manifest is None:
+        return None
+    if not labor_name:
+        return manifest["summary"]
+    employee = manifest["employees"].get(labor_name)
+    return employee["detail"] if employee else None
+
+
+@celery.task(name="tasks.export_salary_report", soft_time_limit=1800, time_limit=1900)
+def export_salary_report(year: int, month: int = None, kind: str = "detailed",
+                         labor_name: str = None, fmt: str = "xlsx"):
+    """Stream a report (a month, or a whole year without month) into EXPORT_DIR"""
+    try:
+        cached = cached_export(year, month, kind, labor_name, fmt)
+        if cached:
+            logger.info(f"Serving {kind} report for {year}-{month:02d} from {cached}")
+            return {"status": "success", "path": cached, "kind": kind, "format": fmt, "cached": True}
         
-        logger.info(f"Generated monthly report for {year}-{month:02d}")
-        return {
-            "status": "success",
-            "year": year,
-            "month": month,
-            "records": len(results)
-        }
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        path = os.path.join(EXPORT_DIR, export_filename(kind, year, month, fmt, labor_name))
+        
+        with db_connection() as conn:
+            result = export_report(conn, path, kind, year, month, labor_name, fmt)
+        
+        logger.info(f"Exported {result['rows']} rows to {path}")
+        return {"status": "success", **result}
         
     except Exception as e:
-        logger.error(f"Report generation error: {e}")
+        logger.error(f"Report export error: {e}")
         raise
 
 
 @celery.task(name="tasks.backup_database")
+@single_flight("maintenance:backup_database")
 def backup_database():
     """Create database backup"""
     try:
@@ -318,6 +508,222 @@ def backup_database():
         raise
 
 
+@celery.task(name="tasks.maintain_salary_partitions")
+def maintain_salary_partitions(months_ahead: int = 3):
+    """Create upcoming salary_records partitions and detach expired ones"""
+    retention_months = int(os.getenv("SALARY_RETENTION_MONTHS", "0"))
+    
+    try:
+        with db_connection() as conn, conn.cursor() as cursor:
+            if not is_partitioned(cursor):
+                logger.warning("salary_records is not partitioned, skipping partition maintenance")
+                return {"status": "skipped", "reason": "not partitioned"}
+            
+            created = ensure_future_partitions(cursor, months_ahead)
+            
+            detached = []
+            if retention_months > 0:
+                # Keep the current month plus retention_months of history
+                now = datetime.now()
+                index = now.year * 12 + now.month - 1 - retention_months
+                detached = detach_partitions_before(cursor, index // 12, index % 12 + 1)
+            
+            conn.commit()
+        
+        logger.info(f"Partition maintenance: created {len(created)}, detached {len(detached)}")
+        return {"status": "success", "created": created, "detached": detached}
+        
+    except Exception as e:
+        logger.error(f"Partition maintenance error: {e}")
+        raise
+
+
+@celery.task(name="tasks.month_close")
+def month_close(year: int = None, month: int = None, restart: bool = False, options: Dict = None):
+    """Close a month as one workflow, skipping stages an earlier run already finished
+    
+    payroll (calculate + bulk save, one task per name range) -> summaries ->
+    summary and detailed reports, CRM month upload and a verified backup,
+    side by side -> closed. Each stage is checkpointed in month_close_stages;
+    restart=True forgets them and runs everything again. options go to the
+    payroll calculation (hours_per_day, overtime_per_day, ...).
+    """
+    if year is None or month is None:
+        now = datetime.now()
+        year, month = (now.year, now.month - 1) if now.month > 1 else (now.year - 1, 12)
+    
+    with db_connection() as conn, conn.cursor() as cursor:
+        ensure_close_schema(cursor)
+        if restart:
+            clear_checkpoints(cursor, year, month)
+        done = completed_stages(cursor, year, month)
+        shards = []
+        if PAYROLL not in done:
+            shards = [shard for shard in profile_shards(cursor) if shard_stage(shard) not in done]
+            if is_partitioned(cursor):
+                # Create the month's partition up front so shards don't race to create it
+                create_month_partition(cursor, year, month)
+        conn.commit()
+    
+    if CLOSED in done:
+        return {"status": "closed", "year": year, "month": month, "stages": sorted(done)}
+    
+    steps = []
+    if PAYROLL not in done:
+        steps.append(chord([close_payroll_shard.si(year, month, shard, options or {}) for shard in shards],
+                           close_payroll_done.s(year, month)) if shards else close_payroll_done.si([], year, month))
+    if SUMMARIES not in done:
+        steps.append(close_summaries.si(year, month))
+    final = [close_report.si(year, month, stage) for stage in REPORTS if stage not in done]
+    if CRM not in done:
+        final.append(close_crm_sync.si(year, month))
+    if BACKUP not in done:
+        final.append(close_backup.si(year, month))
+    steps.append(chord(final, close_finish.si(year, month)) if final else close_finish.si(year, month))
+    
+    workflow = chain(*steps).apply_async()
+    logger.info(f"Month close {year}-{month:02d} started ({len(shards)} payroll shards, "
+                f"{len(done)} stages already done)")
+    return {"status": "started", "year": year, "month": month, "workflow_id": workflow.id,
+            "payroll_shards": len(shards), "skipped": sorted(done)}
+
+
+def run_close_stage(year: int, month: int, stage: str, func, valid=None) -> Dict:
+    with db_connection() as conn:
+        return run_checkpointed(conn, year, month, stage, func, valid)
+
+
+def output_exists(saved: Dict) -> bool:
+    return os.path.exists(saved["path"])
+
+
+@celery.task(name="tasks.close_payroll_shard", bind=True, max_retries=3)
+def close_payroll_shard(self, year: int, month: int, shard: Dict, options: Dict):
+    """Calculate and save one name range of the month's payroll"""
+    try:
+        return run_close_stage(year, month, shard_stage(shard),
+                               lambda conn: calculate_shard(conn, year, month, shard, **options))
+    except Exception as e:
+        logger.error(f"Payroll shard {shard['shard']} for {year}-{month:02d} error: {e}")
+        raise self.retry(exc=e, countdown=30 * (2 ** self.request.retries))
+
+
+@celery.task(name="tasks.close_payroll_done")
+def close_payroll_done(results: List[Dict], year: int, month: int):
+    """Chord callback: total the payroll shards and checkpoint the payroll stage"""
+    def total(conn):
+        return {
+            "shards": len(results),
+            "employees": sum(result["employees"] for result in results),
+            "inserted": sum(result.get("inserted", 0) for result in results),
+            "updated": sum(result.get("updated", 0) for result in results),
+            "total_salary": sum(result["total_salary"] for result in results)
+        }
+    return run_close_stage(year, month, PAYROLL, total)
+
+
+@celery.task(name="tasks.close_summaries")
+def close_summaries(year: int, month: int):
+    """Materialize and verify the month's payroll_monthly_summary rows"""
+    def materialize(conn):
+        with conn.cursor() as cursor:
+            return materialize_summaries(cursor, year, month)
+    return run_close_stage(year, month, SUMMARIES, materialize)
+
+
+@celery.task(name="tasks.close_report", bind=True, soft_time_limit=1800, time_limit=1900)
+def close_report(self, year: int, month: int, stage: str):
+    """Build the month's report artifacts, or write one of its report files into EXPORT_DIR"""
+    kind = stage.split(":", 1)[1]
+    if kind == "artifacts":
+        with db_connection() as conn, conn.cursor() as cursor:
+            saved = get_checkpoint(cursor, year, month, stage)
+        if saved is not None and os.path.exists(saved["manifest"]):
+            return saved
+        
+        # Shares generate_monthly_report's lock, which reruns once for a report coalesced meanwhile
+        lock = take_stage_lock(self, monthly_report_lock(year, month),
+                               rerun={"task": generate_monthly_report.name, "args": [year, month], "kwargs": {}})
+        try:
+            workflow, plan = month_artifacts_workflow(
+                year, month, then=close_checkpoint.s(year, month, stage) | release_task_lock.si(lock.info()))
+        except BaseException:
+            lock.release()
+            raise
+        if workflow is None:
+            lock.release()
+            return close_checkpoint(artifacts_summary(plan["cached"]), year, month, stage)
+        workflow.link_error(release_task_lock.si(lock.info()))
+        return self.replace(workflow)
+    
+    def export(conn):
+        os.makedirs(EXPORT_DIR, exist_ok=True)
+        path = os.path.join(EXPORT_DIR, export_filename(kind, year, month))
+        return export_report(conn, path, kind, year, month)
+    return run_close_stage(year, month, stage, export, valid=output_exists)
+
+
+@celery.task(name="tasks.close_crm_sync", bind=True)
+def close_crm_sync(self, year: int, month: int):
+    """Upload the closed month to CRM as a chord of shard tasks, then checkpoint it"""
+    if not CRM_ENABLED:
+        # Not checkpointed: a later run sends the month once CRM is enabled
+        return {"status": "skipped", "reason": "CRM disabled"}
+    
+    with db_connection() as conn, conn.cursor() as cursor:
+        saved = get_checkpoint(cursor, year, month, CRM)
+    if saved is not None:
+        return saved
+    
+    # Shares sync_salaries_to_crm's lock for the month, so the two never upload it side by side
+    lock = take_stage_lock(self, salary_sync_lock(year, month))
+    try:
+        workflow, _ = month_upload_workflow(
+            year, month, then=close_checkpoint.s(year, month, CRM) | release_task_lock.si(lock.info()))
+    except BaseException:
+        lock.release()
+        raise
+    workflow.link_error(release_task_lock.si(lock.info()))
+    return self.replace(workflow)
+
+
+@celery.task(name="tasks.close_checkpoint")
+def close_checkpoint(result: Dict, year: int, month: int, stage: str):
+    """Record a stage that ran as its own workflow"""
+    with db_connection() as conn:
+        with conn.cursor() as cursor:
+            save_checkpoint(cursor, year, month, stage, result)
+        conn.commit()
+    return result
+
+
+@celery.task(name="tasks.close_backup", soft_time_limit=3600, time_limit=3700)
+def close_backup(year: int, month: int):
+    """Back up the database once the month's payroll is in, and verify the archive"""
+    def backup(conn):
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(BACKUP_DIR, f"month_close_{year}-{month:02d}_{timestamp}.dump")
+        return verified_backup(worker_db_config(), path)
+    return run_close_stage(year, month, BACKUP, backup, valid=output_exists)
+
+
+@celery.task(name="tasks.close_finish")
+def close_finish(year: int, month: int):
+    """Mark the month closed once every stage has finished"""
+    with db_connection() as conn, conn.cursor() as cursor:
+        stages = completed_stages(cursor, year, month)
+    missing = [stage for stage in (PAYROLL, SUMMARIES, *REPORTS, BACKUP) if stage not in stages]
+    if CRM_ENABLED and CRM not in stages:
+        missing.append(CRM)
+    if missing:
+        raise Exception(f"Month close {year}-{month:02d} is missing stages: {', '.join(missing)}")
+    
+    result = run_close_stage(year, month, CLOSED, lambda conn: {"stages": sorted(stages)})
+    logger.info(f"Month {year}-{month:02d} closed")
+    return {"status": "closed", "year": year, "month": month, **result}
+
+
 @celery.task(name="tasks.cleanup_old_files")
 def cleanup_old_files(days: int = 30):
     """Cleanup old backup files and exports"""
@@ -338,7 +744,7 @@ def cleanup_old_files(days: int = 30):
                         logger.info(f"Deleted old backup: {filename}")
         
         # Cleanup exports
-        export_dir = "/app/exports"
+        export_dir = EXPORT_DIR
         if os.path.exists(export_dir):
             for filename in os.listdir(export_dir):
                 filepath = os.path.join(export_dir, filename)
@@ -349,7 +755,13 @@ def cleanup_old_files(days: int = 30):
                         deleted_count += 1
                         logger.info(f"Deleted old export: {filename}")
         
-        logger.info(f"Cleanup completed: {deleted_count} files deleted")
+        # Processed webhook events
+        with db_connection() as conn:
+            with conn.cursor() as cursor:
+                purged_events = purge_processed(cursor, days)
+            conn.commit()
+        
+        logger.info(f"Cleanup completed: {deleted_count} files deleted, {purged_events} webhook events purged")
         return {"status": "success", "deleted": deleted_count}
         
     except Exception as e:
@@ -364,7 +776,10 @@ def health_check():
     return {
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
-        "worker": "celery"
+        "worker": "celery",
+        "http": http_metrics(),
+        "db_pool": get_db_pool().stats(),
+        "task_locks": get_lock_store().holders()
     }
 
 
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# The modules under test live at the repository root
+sys.path.insert(0, ROOT)
+
+import psycopg2  # noqa: E402
+
+from db_config import DatabaseConfig  # noqa: E402
+
+ENV_FILE = os.path.join(ROOT, '.env')
+
+# Tests that need PostgreSQL use DB_* from the environment or .env, and are skipped without either
+requires_database = pytest.mark.skipif(not (os.getenv('DB_HOST') or os.path.exists(ENV_FILE)),
+                                       reason='no database configured (set DB_HOST or create .env)')
+
+
+@pytest.fixture
+def database():
+    """A connection to the configured database; anything a test leaves uncommitted is rolled back"""
+    conn = psycopg2.connect(DatabaseConfig.from_file(ENV_FILE).get_connection_string())
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
@@ -0,0 +1,140 @@
+"""
+CRMSyncEngine against the local CRM stub, with fake database steps so no database is needed
+"""
+
+import contextlib
+import os
+import sys
+from datetime import date
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+import crm_async  # noqa: E402
+from crm_async import run_sync_cycle  # noqa: E402
+from crm_stub_server import StubCRM  # noqa: E402
+from crm_sync_state import EMPLOYEES, SALARIES, salary_payload  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+
+
+def employee(index):
+    return {'id': index, 'name': f'Worker {index}', 'base_daily_wage': 100, 'position': 'Labor',
+            'contact_info': '', 'overtime_rate': 1.5}
+
+
+def salary(index, day):
+    return {'labor_name': f'Worker {index}', 'date': day, 'day_type': 'Weekday', 'daily_wage': 100,
+            'hours_worked': 8, 'overtime_hours': 0, 'weekend_bonus': 0, 'holiday_bonus': 0,
+            'other_allowances': 0, 'deductions': 0, 'total_salary': 100}
+
+
+class FakeConnection:
+    def cursor(self):
+        return contextlib.nullcontext()
+
+    def rollback(self):
+        pass
+
+
+def fake_connection():
+    return contextlib.nullcontext(FakeConnection())
+
+
+@pytest.fixture
+def data(monkeypatch):
+    """What the fake database steps hand over: changed rows per entity, payload chunks per month, the summary"""
+    data = {EMPLOYEES: [], SALARIES: [], 'months': {}, 'summary': []}
+
+    def sync_changes(conn, entity, send, batch_size=2, send_many=None, window=1):
+        rows = data[entity]
+        batches = [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+        synced = 0
+        for start in range(0, len(batches), window):
+            results = send_many(batches[start:start + window])
+            for rows, ok in zip(batches[start:start + window], results):
+                if not ok:
+                    return {'entity': entity, 'status': 'failed', 'synced': synced, 'batches': len(batches)}
+                synced += len(rows)
+        return {'entity': entity, 'status': 'success', 'synced': synced, 'batches': len(batches)}
+
+    def upload_month(conn, post_chunk, year, month, post_many=None, window=1):
+        chunks = data['months'][(year, month)]
+        results = post_many([({'year': year, 'month': month, 'upload_id': f'{year}-{month}', 'chunk': index,
+                               'final': index == len(chunks) - 1}, records)
+                             for index, records in enumerate(chunks)])
+        return {'status': 'success' if all(results) else 'failed', 'chunks': len(chunks)}
+
+    monkeypatch.setattr(crm_async, 'sync_changes', sync_changes)
+    monkeypatch.setattr(crm_async, 'upload_month', upload_month)
+    monkeypatch.setattr(crm_async, 'summary_payload', lambda cursor, year, month: data['summary'])
+    return data
+
+
+@contextlib.contextmanager
+def crm(**stub_options):
+    stub = StubCRM(**stub_options).start()
+    client = HttpClient(stub.url)
+    try:
+        yield stub, client
+    finally:
+        client.close()
+        stub.stop()
+
+
+def test_endpoints_run_concurrently(data):
+    data[EMPLOYEES] = [employee(1)]
+    data[SALARIES] = [salary(1, date(2024, 1, 2))]
+    data['summary'] = [{'employee_name': 'Worker 1', 'total_salary': 100.0}]
+    latency = {path: 0.3 for path in ('/health', '/employees/sync', '/salaries/sync', '/reports/summary')}
+
+    in_flight = {}
+    for concurrency in (1, 4):
+        with crm(latency=latency) as (stub, client):
+            cycle = run_sync_cycle(client, fake_connection, concurrency=concurrency, report_month=(2024, 1))
+        assert {name: result['status'] for name, result in cycle['results'].items()} == {
+            'health': 'success', 'employees': 'success', 'salaries': 'success', 'summary_report': 'success'}
+        assert stub.records == {'/health': 0, '/employees/sync': 1, '/salaries/sync': 1, '/reports/summary': 1}
+        in_flight[concurrency] = stub.max_in_flight
+
+    # One endpoint at a time, then the endpoints side by side rather than one after another
+    assert in_flight[1] == 1
+    assert 1 < in_flight[4] <= 4
+
+
+def test_semaphore_caps_requests_in_flight(data):
+    data['months'] = {(2024, month): [[salary_payload(salary(index, date(2024, month, 1)))] for index in (1, 2)]
+                      for month in (1, 2, 3)}
+
+    with crm(latency={'/salaries/sync': 0.2}) as (stub, client):
+        cycle = run_sync_cycle(client, fake_connection, concurrency=2, employees=False, salaries=False,
+                               months=[(2024, 1), (2024, 2), (2024, 3)])
+
+    assert {month: result['status'] for month, result in cycle['results']['months'].items()} == {
+        '2024-01': 'success', '2024-02': 'success', '2024-03': 'success'}
+    assert stub.requests['/salaries/sync'] == 6
+    assert stub.max_in_flight == 2
+    assert cycle['latency']['/salaries/sync']['calls'] == 6
+
+
+def test_latency_and_errors_per_endpoint(data):
+    data[EMPLOYEES] = [employee(index) for index in range(6)]
+    data['summary'] = [{'employee_name': 'Worker 1', 'total_salary': 100.0}]
+
+    with crm(latency={'/employees/sync': 0.1}, fail_paths={'/reports/summary'}) as (stub, client):
+        cycle = run_sync_cycle(client, fake_connection, concurrency=4, salaries=False, report_month=(2024, 1))
+
+    results, latency = cycle['results'], cycle['latency']
+    assert results['employees'] == {'entity': EMPLOYEES, 'status': 'success', 'synced': 6, 'batches': 3}
+    assert results['summary_report'] == {'status': 'failed', 'synced': 0}
+    assert set(latency) == {'/health', '/employees/sync', '/reports/summary'}
+
+    assert latency['/employees/sync']['calls'] == 3
+    assert latency['/employees/sync']['errors'] == 0
+    assert latency['/employees/sync']['average_seconds'] >= 0.1
+    assert latency['/employees/sync']['max_seconds'] >= latency['/employees/sync']['average_seconds']
+    assert latency['/reports/summary']['calls'] == 1
+    assert latency['/reports/summary']['errors'] == 1
+    assert latency['/health']['errors'] == 0
+    assert stub.records['/employees/sync'] == 6
+    assert '/reports/summary' not in stub.records
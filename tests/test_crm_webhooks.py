@@ -0,0 +1,95 @@
+"""
+CRM webhook batches: salary request grouping and validation, and draining a batch with a bad event in it
+"""
+
+from decimal import Decimal
+
+from conftest import requires_database
+from crm_webhooks import EVENTS_TABLE, drain_once, enqueue_events, ensure_webhook_schema, group_salary_requests
+
+NAME = 'Webhook Test Employee'
+
+
+def test_bad_options_are_errors_and_the_rest_of_the_batch_is_grouped():
+    groups, errors = group_salary_requests([
+        (1, {'year': 2024, 'month': 3, 'employee_name': 'A'}),
+        (2, {'year': 2024, 'month': 3, 'employee_name': 'B', 'hours_per_day': 'abc'}),
+        (3, {'year': 2024, 'month': 3, 'employee_name': 'C', 'include_weekends': 'yes'}),
+        (4, {'year': 2024, 'month': 3, 'employee_name': 'D', 'deductions': [1]}),
+        (5, {'year': 2024, 'month': 3, 'employee_name': 'E', 'overtime_per_day': {'hours': 1}}),
+        (6, {'year': 2024, 'month': 3, 'employee_name': 'F', 'other_allowances': float('nan')}),
+        (7, {'year': 2024, 'month': 3, 'employee_name': ['G']}),
+        (8, {'year': 2024, 'month': 13}),
+        (9, {'year': 2024, 'month': 3, 'employee_name': 'H'}),
+        (10, {'year': 2024, 'month': 3, 'employee_name': 'I', 'hours_per_day': '9.5', 'include_weekends': True}),
+    ])
+
+    assert groups == {
+        (2024, 3, ()): {'A', 'H'},
+        (2024, 3, (('hours_per_day', 9.5), ('include_weekends', True))): {'I'},
+    }
+    assert set(errors) == {2, 3, 4, 5, 6, 7, 8}
+    assert 'hours_per_day' in errors[2]
+    assert 'include_weekends' in errors[3]
+
+
+def test_equal_options_share_one_run():
+    groups, errors = group_salary_requests([
+        (1, {'year': '2024', 'month': '3', 'employee_name': 'A', 'hours_per_day': 9}),
+        (2, {'year': 2024, 'month': 3, 'employee_name': 'B', 'hours_per_day': '9.0'}),
+        (3, {'year': 2024, 'month': 3, 'hours_per_day': 9.0}),
+    ])
+
+    assert errors == {}
+    assert groups == {(2024, 3, (('hours_per_day', 9.0),)): None}
+
+
+@requires_database
+def test_drain_marks_bad_events_processed_and_applies_the_rest(database):
+    with database.cursor() as cursor:
+        ensure_webhook_schema(cursor)
+    database.commit()
+    enqueue_events(database, [('employee.created', {'name': NAME, 'daily_wage': 200})])
+    drain_once(database)
+
+    try:
+        enqueue_events(database, [
+            ('employee.updated', {'name': NAME, 'daily_wage': 240}),
+            ('salary.requested', {'year': 2024, 'month': 3, 'employee_name': NAME, 'hours_per_day': 'abc'}),
+            ('salary.requested', {'year': 2024, 'month': 3, 'employee_name': NAME}),
+            ('salary.requested', {'year': 2024, 'month': 3, 'employee_name': NAME, 'include_weekends': [1]}),
+        ])
+        with database.cursor() as cursor:
+            cursor.execute(f"SELECT id FROM {EVENTS_TABLE} WHERE payload->>'name' = %s "
+                           f"OR payload->>'employee_name' = %s ORDER BY id DESC LIMIT 4", (NAME, NAME))
+            event_ids = sorted(row[0] for row in cursor.fetchall())
+        database.rollback()
+
+        result = drain_once(database)
+
+        assert result['payroll_runs'] >= 1
+        with database.cursor() as cursor:
+            cursor.execute(f"SELECT id, processed_at IS NOT NULL, error FROM {EVENTS_TABLE} "
+                           f"WHERE id = ANY(%s) ORDER BY id", (event_ids,))
+            events = cursor.fetchall()
+            cursor.execute("SELECT base_daily_wage, hourly_rate FROM labor_profiles WHERE name = %s", (NAME,))
+            profile = cursor.fetchone()
+            cursor.execute("SELECT COUNT(*), MIN(daily_wage) FROM salary_records "
+                           "WHERE labor_name = %s AND date >= '2024-03-01' AND date < '2024-04-01'", (NAME,))
+            records, wage = cursor.fetchone()
+        database.rollback()
+
+        # Every event is processed, so none of them is claimed again by the next drain
+        assert [processed for _, processed, _ in events] == [True] * 4
+        assert [error is not None for _, _, error in events] == [False, True, False, True]
+        # A wage-only update moves the hourly rate with it
+        assert profile == (Decimal('240.00'), Decimal('30.00'))
+        assert records > 0 and wage == 240
+    finally:
+        with database.cursor() as cursor:
+            cursor.execute("DELETE FROM payroll_monthly_summary WHERE labor_name = %s", (NAME,))
+            cursor.execute("DELETE FROM salary_records WHERE labor_name = %s", (NAME,))
+            cursor.execute("DELETE FROM labor_profiles WHERE name = %s", (NAME,))
+            cursor.execute(f"DELETE FROM {EVENTS_TABLE} WHERE payload->>'name' = %s "
+                           f"OR payload->>'employee_name' = %s", (NAME, NAME))
+        database.commit()
@@ -0,0 +1,33 @@
+"""
+Parity of server-side payroll generation with the Python payroll engine, over the verify_server_payroll matrix
+Needs a database; the synthetic profiles and check tables are rolled back after each case
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+from conftest import requires_database  # noqa: E402
+from holiday_calendar import load_calendar  # noqa: E402
+from server_payroll import compare_with_engine  # noqa: E402
+from verify_server_payroll import MONTHS, SCENARIOS, synthetic_profiles, with_test_holidays  # noqa: E402
+
+EMPLOYEES = 50
+
+
+@requires_database
+@pytest.mark.parametrize('year, month', MONTHS, ids=[f"{year}-{month:02d}" for year, month in MONTHS])
+@pytest.mark.parametrize('scenario', list(SCENARIOS))
+def test_server_rows_match_the_engine(database, year, month, scenario):
+    with database.cursor() as cursor:
+        profiles = synthetic_profiles(cursor, EMPLOYEES, seed=7)
+        holidays = with_test_holidays(load_calendar(cursor), year, month)
+
+        result = compare_with_engine(cursor, year, month, profiles, holidays, **SCENARIOS[scenario])
+
+    assert result['engine_rows'] > 0
+    assert result['server_rows'] == result['engine_rows']
+    assert result['mismatches'] == 0, result['examples'][:4]
@@ -0,0 +1,297 @@
+"""
+Single-flight task locks against the in-memory store (TASK_LOCK_URL=memory://), with Celery in eager mode
+Also the month-close stages that share them with the standalone month tasks, with the database faked
+"""
+
+import contextlib
+import os
+import time
+
+import pytest
+from celery import Celery, chord
+from celery.exceptions import Retry
+
+# Eager chords keep their results here rather than in the Redis backend
+os.environ.setdefault('CELERY_BACKEND_URL', 'cache+memory://')
+
+import task_locks  # noqa: E402
+import tasks  # noqa: E402
+from task_locks import COALESCE, LocalLockStore, current_lock, release_lock, single_flight  # noqa: E402
+
+app = Celery('test_task_locks', set_as_current=False)
+app.conf.update(task_always_eager=True, task_eager_propagates=True, task_time_limit=300)
+
+runs = []
+
+
+@app.task(name='test.locked')
+@single_flight('test:{name}')
+def locked(name, nested=()):
+    runs.append((name, current_lock().token))
+    return [locked.apply(args=(name,), task_id=task_id).get() for task_id in nested]
+
+
+@app.task(name='test.coalesced')
+@single_flight('test:report:{month}', mode=COALESCE)
+def coalesced(month, nested=0):
+    runs.append(month)
+    # The rerun gets the same arguments; only the first run sends the overlapping requests
+    if len(runs) > 1:
+        return []
+    return [coalesced.apply(args=(month,), task_id=f'late-{index}').get() for index in range(nested)]
+
+
+@app.task(name='test.flaky', bind=True)
+@single_flight('test:flaky')
+def flaky(self, fail):
+    if fail:
+        raise Retry(when=30)
+    return 'done'
+
+
+@app.task(name='test.broken')
+@single_flight('test:broken')
+def broken():
+    raise ValueError('broken')
+
+
+@app.task(name='test.dispatcher')
+@single_flight('test:chord', mode=COALESCE)
+def dispatcher():
+    lock = current_lock()
+    runs.append(lock.token)
+    lock.hand_off(600)
+    return lock.info()
+
+
+@pytest.fixture(autouse=True)
+def store(monkeypatch):
+    """A fresh in-memory store per test, and the eager test app as Celery's current app"""
+    monkeypatch.setattr(task_locks, 'TASK_LOCK_URL', 'memory://')
+    monkeypatch.setattr(task_locks, '_store', None)
+    runs.clear()
+    app.set_current()
+    return task_locks.get_lock_store()
+
+
+def test_memory_url_selects_local_store(store):
+    assert isinstance(store, LocalLockStore)
+
+
+def test_run_while_held_is_skipped(store):
+    assert store.acquire('test:a', 'other-task', 30) is None
+
+    result = locked.apply(args=('a',), task_id='second').get()
+
+    assert result == {'status': 'skipped', 'reason': 'already running', 'lock': 'test:a',
+                      'running_task_id': 'other-task'}
+    assert runs == []
+
+
+def test_lock_is_freed_after_a_run(store):
+    assert locked.apply(args=('a',), task_id='first').get() == []
+    assert locked.apply(args=('a',), task_id='second').get() == []
+
+    assert runs == [('a', 'first'), ('a', 'second')]
+    assert store.holders() == {}
+
+
+def test_overlapping_run_is_skipped_and_other_keys_are_not(store):
+    results = locked.apply(args=('a',), kwargs={'nested': ('overlap',)}, task_id='first').get()
+
+    assert results[0]['status'] == 'skipped'
+    assert results[0]['running_task_id'] == 'first'
+    assert runs == [('a', 'first')]
+
+    locked.apply(args=('b',), task_id='other-key').get()
+    assert runs[-1] == ('b', 'other-key')
+
+
+def test_default_ttl_is_time_limit_plus_margin():
+    assert task_locks._task_ttl(locked) == 300 + task_locks.LOCK_TTL_MARGIN
+
+
+def test_coalesced_runs_trigger_exactly_one_rerun(store):
+    results = coalesced.apply(args=(3,), kwargs={'nested': 3}, task_id='running').get()
+
+    assert [result['status'] for result in results] == ['coalesced'] * 3
+    assert all(result['running_task_id'] == 'running' for result in results)
+    # The running task and one rerun for the three coalesced requests
+    assert runs == [3, 3]
+    assert store.holders() == {}
+    assert store._reruns == set()
+
+
+def test_coalesce_without_overlap_does_not_rerun(store):
+    coalesced.apply(args=(4,), task_id='alone').get()
+
+    assert runs == [4]
+
+
+def test_retry_keeps_the_lock_for_its_countdown(store):
+    with pytest.raises(Retry):
+        flaky.apply(args=(True,), task_id='retrying').get()
+
+    held = store.holders()['test:flaky']
+    assert held['token'] == 'retrying'
+    assert held['ttl'] > 300 + task_locks.LOCK_TTL_MARGIN
+    assert flaky.apply(args=(False,), task_id='someone-else').get()['status'] == 'skipped'
+
+    # The retry runs under the same task id and takes the lock up again
+    assert flaky.apply(args=(False,), task_id='retrying').get() == 'done'
+    assert store.holders() == {}
+
+
+def test_failure_releases_the_lock(store):
+    with pytest.raises(ValueError):
+        broken.apply(task_id='failing').get()
+
+    assert store.holders() == {}
+
+
+def test_stale_owner_expires(store):
+    assert store.acquire('test:a', 'crashed-task', 0.05) is None
+    assert store.acquire('test:a', 'next-task', 30) == 'crashed-task'
+    time.sleep(0.1)
+
+    assert locked.apply(args=('a',), task_id='after-expiry').get() == []
+    assert runs == [('a', 'after-expiry')]
+    # The stale owner can no longer free or extend a lock it lost
+    assert store.extend('test:a', 'crashed-task', 30) is False
+    assert release_lock({'key': 'test:a', 'token': 'crashed-task', 'rerun': None}) is False
+
+
+def test_release_needs_the_owner_token(store):
+    store.acquire('test:a', 'owner', 30)
+
+    assert store.release('test:a', 'intruder') is None
+    assert store.holders()['test:a']['token'] == 'owner'
+    assert store.release('test:a', 'owner') is False
+
+
+def test_hand_off_keeps_the_lock_until_release_lock(store):
+    info = dispatcher.apply(task_id='dispatch').get()
+
+    held = store.holders()['test:chord']
+    assert held['token'] == 'dispatch'
+    assert held['ttl'] > 500
+    assert dispatcher.apply(task_id='meanwhile').get()['status'] == 'coalesced'
+
+    # e.g. the chord's last step, in another task; the coalesced request runs once more
+    assert release_lock(info) is True
+    assert runs == ['dispatch', runs[1]]
+    assert runs[1] != 'dispatch'
+    # The rerun handed the lock off in turn
+    assert store.holders()['test:chord']['token'] == runs[1]
+
+
+def test_arguments_are_still_checked(store):
+    with pytest.raises(TypeError):
+        locked.delay('a', (), 'extra')
+
+
+def test_direct_call_outside_a_task_still_takes_the_lock(store):
+    assert locked.run('a') == []
+    assert len(runs) == 1 and runs[0][1]
+    assert store.holders() == {}
+
+    store.acquire('test:a', 'worker-task', 30)
+    assert locked.run('a')['running_task_id'] == 'worker-task'
+    assert len(runs) == 1
+
+
+# Month-close stages against the standalone tasks that upload a month or build its report
+
+class FakeConnection:
+    def cursor(self):
+        return contextlib.nullcontext()
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def month_close(monkeypatch, store):
+    """tasks with Celery eager, CRM on and checkpoints kept in memory; month workflows come from workflows"""
+    monkeypatch.setitem(tasks.celery.conf, 'task_always_eager', True)
+    monkeypatch.setitem(tasks.celery.conf, 'task_eager_propagates', True)
+    monkeypatch.setattr(tasks, 'CRM_ENABLED', True)
+    monkeypatch.setattr(tasks, 'db_connection', lambda: contextlib.nullcontext(FakeConnection()))
+    monkeypatch.setattr(tasks, 'get_checkpoint', lambda cursor, year, month, stage: None)
+    checkpoints = []
+    monkeypatch.setattr(tasks, 'save_checkpoint',
+                        lambda cursor, year, month, stage, result, seconds=None: checkpoints.append(stage))
+
+    workflows = []
+
+    def month_upload_workflow(year, month, then=None):
+        workflows.append('upload')
+        return chord([meanwhile.si(tasks.sync_salaries_to_crm.name, 'manual-sync')], then), []
+
+    def month_artifacts_workflow(year, month, force=False, then=None):
+        workflows.append('artifacts')
+        if workflows.count('artifacts') > 1:
+            return None, {'cached': {'year': year, 'month': month, 'employees': {}}}
+        return chord([meanwhile.si(tasks.generate_monthly_report.name, 'manual-report')], then), {}
+
+    monkeypatch.setattr(tasks, 'month_upload_workflow', month_upload_workflow)
+    monkeypatch.setattr(tasks, 'month_artifacts_workflow', month_artifacts_workflow)
+    tasks.celery.set_current()
+    return checkpoints, workflows
+
+
+@app.task(name='test.meanwhile')
+def meanwhile(name, task_id):
+    """Runs inside a month-close stage's workflow: the standalone task for the same month"""
+    runs.append(tasks.celery.tasks[name].apply(args=(2024, 1), task_id=task_id).get())
+    return 'done'
+
+
+def test_close_crm_sync_holds_the_month_sync_lock(store, month_close):
+    checkpoints, workflows = month_close
+
+    tasks.close_crm_sync.apply(args=(2024, 1), task_id='close-crm').get()
+
+    sync = runs[0]
+    assert sync['status'] == 'skipped'
+    assert sync['lock'] == tasks.salary_sync_lock(2024, 1)
+    assert sync['running_task_id'] == 'close-crm'
+    assert checkpoints == [tasks.CRM]
+    assert store.holders() == {}
+
+
+def test_close_crm_sync_waits_for_a_manual_month_sync(store, month_close):
+    checkpoints, workflows = month_close
+    store.acquire(tasks.salary_sync_lock(2024, 1), 'manual-sync', 30)
+
+    with pytest.raises(Retry):
+        tasks.close_crm_sync.apply(args=(2024, 1), task_id='close-crm').get()
+
+    assert workflows == []
+    assert store.holders()[tasks.salary_sync_lock(2024, 1)]['token'] == 'manual-sync'
+
+
+def test_close_report_holds_the_monthly_report_lock(store, month_close):
+    checkpoints, workflows = month_close
+
+    tasks.close_report.apply(args=(2024, 1, 'report:artifacts'), task_id='close-report').get()
+
+    report = runs[0]
+    assert report['status'] == 'coalesced'
+    assert report['lock'] == tasks.monthly_report_lock(2024, 1)
+    assert report['running_task_id'] == 'close-report'
+    assert checkpoints == ['report:artifacts']
+    # The coalesced report runs once after the stage and finds the artifacts current
+    assert workflows == ['artifacts', 'artifacts']
+    assert store.holders() == {}
+
+
+def test_close_report_waits_for_a_running_monthly_report(store, month_close):
+    checkpoints, workflows = month_close
+    store.acquire(tasks.monthly_report_lock(2024, 1), 'manual-report', 30)
+
+    with pytest.raises(Retry):
+        tasks.close_report.apply(args=(2024, 1, 'report:artifacts'), task_id='close-report').get()
+
+    assert workflows == []
+    assert store.holders()[tasks.monthly_report_lock(2024, 1)]['token'] == 'manual-report'